@@ -1,6 +1,8 @@
 """Sub-package __init__."""
 
 from . import utils
+from .breaker import CircuitBreaker, CircuitOpenError
+from .cache import ResponseCache
 from .client import (
     MAX_RETRIES,
     CalcRetryFromBackoffMax,
@@ -9,8 +11,24 @@ from .client import (
 )
 from .client_credentials import ClientCredentialsAuth
 from .device_client import DeviceGrantAuth, SavedDeviceGrantAuth
+from .download import DownloadResult
+from .hedging import HedgingTransport
+from .limiter import AdaptiveLimiter
+from .loopback import LoopbackTransport
+from .metrics import ClientMetrics, RequestInfo
 from .openid_client import OpenIDRestClient
-from .session import AsyncSession, Session
+from .pagination import CursorPagination, LinkHeaderPagination, OffsetPagination
+from .retry import RetryBudget, RetryPolicy
+from .session import AsyncSession, PoolStats, Session
+from .tornado_session import TornadoSession, TornadoTransport
+from .transport import (
+    DeadlineExceededError,
+    RequestsTransport,
+    RetryTransport,
+    Transport,
+    TransportWrapper,
+)
+from .upload import UploadBody
 
 __all__ = [
     "RestClient",
@@ -20,6 +38,29 @@ __all__ = [
     "SavedDeviceGrantAuth",
     "AsyncSession",
     "Session",
+    "PoolStats",
+    "ResponseCache",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "DeadlineExceededError",
+    "AdaptiveLimiter",
+    "HedgingTransport",
+    "RetryPolicy",
+    "RetryBudget",
+    "ClientMetrics",
+    "RequestInfo",
+    "CursorPagination",
+    "OffsetPagination",
+    "LinkHeaderPagination",
+    "UploadBody",
+    "DownloadResult",
+    "TornadoSession",
+    "Transport",
+    "TransportWrapper",
+    "RetryTransport",
+    "RequestsTransport",
+    "TornadoTransport",
+    "LoopbackTransport",
     "CalcRetryFromBackoffMax",
     "CalcRetryFromWaittimeMax",
     "MAX_RETRIES",
@@ -0,0 +1,276 @@
+"""A per-host circuit breaker for `RestClient`.
+
+When a backend is down, retrying every request through its full backoff
+schedule just piles up waiting callers. A circuit breaker tracks the
+recent failure rate of each host, and once it is too high the circuit
+"opens": attempts fail fast with :py:class:`CircuitOpenError`, without
+touching the network. After `reset_timeout` seconds the circuit is
+"half-open", and a few probe attempts decide whether to close it again
+or keep it open.
+
+Breakers are shared by every client (and thread, and event loop) in the
+process that targets the same host, through :py:func:`get_circuit_breaker`.
+"""
+
+# fmt:off
+
+import collections
+import logging
+import threading
+import time
+from typing import Any, Collection, Deque, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from .transport import RETRYABLE_ERRORS, StreamResponse, Transport, TransportWrapper
+
+LOGGER = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request, while the circuit is open."""
+
+
+class CircuitBreaker:
+    """Track the outcomes of attempts to one host, and fail fast when it is down.
+
+    Thread-safe.
+
+    Args:
+        name (str): the host, for logging
+        failure_threshold (float): open the circuit at this failure rate (0-1)
+        window (int): number of recent attempts to compute the failure rate over
+        min_requests (int): min number of attempts in the window before opening
+        reset_timeout (float): seconds to stay open before probing
+        half_open_max_calls (int): number of concurrent probe attempts when half-open
+    """
+
+    def __init__(
+        self,
+        name: str = '',
+        failure_threshold: float = 0.5,
+        window: int = 20,
+        min_requests: int = 10,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ) -> None:
+        if not 0.0 < failure_threshold <= 1.0:
+            raise ValueError(f"failure_threshold must be between 0 and 1: {failure_threshold}")
+        if window < 1 or min_requests < 1 or half_open_max_calls < 1:
+            raise ValueError("window, min_requests, and half_open_max_calls must be at least 1")
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_requests = min(min_requests, window)
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._outcomes: Deque[bool] = collections.deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+
+        # counters
+        self.opened = 0
+        self.rejected = 0
+        self.successes = 0
+        self.failures = 0
+
+    @property
+    def state(self) -> str:
+        """The current state: 'closed', 'open', or 'half-open'."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def before(self, url: str = '') -> bool:
+        """Call before an attempt.
+
+        Raises `CircuitOpenError` if the attempt is not allowed.
+
+        Returns:
+            bool: whether the attempt is a half-open probe (pass it on to `after()`)
+        """
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(f'circuit breaker open for {self.name or url}')
+                LOGGER.info('circuit breaker half-open for %s', self.name)
+                self._state = HALF_OPEN
+                self._probes = 0
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(f'circuit breaker half-open for {self.name or url}, waiting on a probe')
+                self._probes += 1
+                return True
+            return False
+
+    def after(self, success: Optional[bool], probe: bool = False) -> None:
+        """Call after an attempt, with its outcome (None if it was abandoned)."""
+        with self._lock:
+            if success is not None:
+                if success:
+                    self.successes += 1
+                else:
+                    self.failures += 1
+            if probe:
+                if self._state != HALF_OPEN:
+                    return
+                self._probes -= 1
+                if success:
+                    LOGGER.info('circuit breaker closed for %s', self.name)
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                elif success is not None:
+                    self._open()
+                return
+            if success is None or self._state != CLOSED:
+                return
+            self._outcomes.append(success)
+            if len(self._outcomes) >= self.min_requests:
+                failure_rate = self._outcomes.count(False) / len(self._outcomes)
+                if failure_rate >= self.failure_threshold:
+                    self._open()
+
+    def _open(self) -> None:
+        LOGGER.warning('circuit breaker open for %s', self.name)
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.opened += 1
+
+    def reset(self) -> None:
+        """Close the circuit, and forget the recent outcomes."""
+        with self._lock:
+            self._state = CLOSED
+            self._outcomes.clear()
+            self._probes = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Get a snapshot of the state and counters."""
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'opened': self.opened,
+                'rejected': self.rejected,
+                'successes': self.successes,
+                'failures': self.failures,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def _host(url: str) -> str:
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+def get_circuit_breaker(url: str, **kwargs: Any) -> CircuitBreaker:
+    """Get the process-wide circuit breaker for the host of `url`.
+
+    The `kwargs` (see :py:class:`CircuitBreaker`) only apply when the
+    breaker is created, by the first caller for a host.
+    """
+    host = _host(url)
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host, **kwargs)
+        return breaker
+
+
+class CircuitBreakerTransport(TransportWrapper):
+    """Check each attempt against the circuit breaker of its host.
+
+    Wrap this inside a :py:class:`rest_tools.client.RetryTransport`, so
+    every retry attempt is checked. A `CircuitOpenError` is not retried.
+
+    Failed attempts are connection errors, timeouts, and the
+    `failure_statuses`. Other statuses (including 4xx) are successes,
+    as the host is up.
+
+    Args:
+        transport (Transport): the transport to wrap
+        failure_statuses (collection): statuses that count as failures
+        **kwargs: settings for new breakers (see :py:class:`CircuitBreaker`)
+    """
+
+    def __init__(
+        self,
+        transport: Transport,
+        failure_statuses: Collection[int] = (500, 502, 503, 504),
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(transport)
+        self.failure_statuses = failure_statuses
+        self.breaker_kwargs = kwargs
+
+    def get_breaker(self, url: str) -> CircuitBreaker:
+        return get_circuit_breaker(url, **self.breaker_kwargs)
+
+    async def send(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        breaker = self.get_breaker(prepared.url)  # type: ignore[arg-type]
+        probe = breaker.before(prepared.url)  # type: ignore[arg-type]
+        success = None
+        try:
+            r = await self.transport.send(prepared, timeout)
+            success = r.status_code not in self.failure_statuses
+            return r
+        except RETRYABLE_ERRORS:
+            success = False
+            raise
+        finally:
+            breaker.after(success, probe)
+
+    def send_sync(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        breaker = self.get_breaker(prepared.url)  # type: ignore[arg-type]
+        probe = breaker.before(prepared.url)  # type: ignore[arg-type]
+        success = None
+        try:
+            r = self.transport.send_sync(prepared, timeout, stream)
+            success = r.status_code not in self.failure_statuses
+            return r
+        except RETRYABLE_ERRORS:
+            success = False
+            raise
+        finally:
+            breaker.after(success, probe)
+
+    async def send_stream(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        max_buffered_chunks: int = 16,
+    ) -> StreamResponse:
+        breaker = self.get_breaker(prepared.url)  # type: ignore[arg-type]
+        probe = breaker.before(prepared.url)  # type: ignore[arg-type]
+        success = None
+        try:
+            sr = await self.transport.send_stream(prepared, timeout, max_buffered_chunks)
+            success = sr.status_code not in self.failure_statuses
+            return sr
+        except RETRYABLE_ERRORS:
+            success = False
+            raise
+        finally:
+            breaker.after(success, probe)
@@ -0,0 +1,196 @@
+"""An http response cache for `RestClient`.
+
+Caches the decoded json body of successful GET requests, keyed by the
+url, the args, and a hash of the `Authorization` header (so different
+identities never share an entry). Freshness follows the response's
+`Cache-Control: max-age`; stale entries are revalidated with
+`If-None-Match` / `If-Modified-Since`, and a `304 Not Modified` reuses
+the cached body.
+"""
+
+# fmt:off
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Mapping, Optional, Tuple
+
+from ..utils.json_util import JSONType
+
+#: a cache key: (method, url, args, auth identity)
+CacheKey = Tuple[str, str, str, str]
+
+
+def request_key(method: str, url: str, args: Optional[Dict[str, Any]], authorization: Optional[str]) -> CacheKey:
+    """Get the key identifying a request: (method, url, args, auth identity)."""
+    identity = hashlib.sha256(authorization.encode('utf-8')).hexdigest() if authorization else ''
+    return (method, url, json.dumps(args or {}, sort_keys=True, default=str), identity)
+
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    """Parse a `Cache-Control` header into a dict of directives."""
+    directives: Dict[str, Optional[str]] = {}
+    for part in value.split(','):
+        name, sep, arg = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip().strip('"') if sep else None
+    return directives
+
+
+class CacheEntry:
+    """A cached response body, with its validators and expiration."""
+
+    def __init__(self, body: JSONType, size: int, headers: Mapping[str, str]) -> None:
+        self.body = body
+        self.size = size
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.expires = 0.0
+        self.update(headers)
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """Update the validators and expiration from (new) response headers."""
+        self.etag = headers.get('ETag', self.etag)
+        self.last_modified = headers.get('Last-Modified', self.last_modified)
+        self.expires = time.monotonic() + get_max_age(headers)
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires
+
+    def validators(self) -> Dict[str, str]:
+        """Get the headers for a conditional request."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def get_max_age(headers: Mapping[str, str]) -> float:
+    """Get the number of seconds a response stays fresh (0 if it must be revalidated)."""
+    directives = parse_cache_control(headers.get('Cache-Control', ''))
+    if 'no-cache' in directives or 'max-age' not in directives:
+        return 0.0
+    try:
+        max_age = float(directives['max-age'])  # type: ignore[arg-type]
+        age = float(headers.get('Age', 0))
+    except ValueError:
+        return 0.0
+    return max(0.0, max_age - age)
+
+
+def is_cacheable(headers: Mapping[str, str]) -> bool:
+    """Whether a response can be stored: it must not be `no-store`, and
+    must be either fresh for a while or revalidatable."""
+    if 'no-store' in parse_cache_control(headers.get('Cache-Control', '')):
+        return False
+    return get_max_age(headers) > 0 or 'ETag' in headers or 'Last-Modified' in headers
+
+
+class ResponseCache:
+    """A bounded LRU cache of decoded response bodies.
+
+    One instance can be shared by several clients. It is thread-safe.
+
+    Counters:
+        hits: requests answered from the cache, without a request
+        revalidations: stale entries the server confirmed (`304`)
+        misses: requests that needed a full response
+        stores: responses added (or replaced) in the cache
+        evictions: entries dropped to stay under `max_entries`
+        bytes_saved: response body bytes not transferred, thanks to hits and revalidations
+
+    Args:
+        max_entries (int): max number of cached responses
+        copy (bool): return a deep copy of a cached body, so callers can
+            modify it (default: True) -- disable for read-only use, to
+            save the copy
+    """
+
+    #: get the cache key for a request
+    key = staticmethod(request_key)
+
+    def __init__(self, max_entries: int = 1024, copy: bool = True) -> None:
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be at least 1: {max_entries}")
+        self.max_entries = max_entries
+        self.copy = copy
+        self._entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """Get an entry (fresh or stale), marking it as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _body(self, entry: CacheEntry) -> JSONType:
+        return copy.deepcopy(entry.body) if self.copy else entry.body
+
+    def hit(self, entry: CacheEntry) -> JSONType:
+        """Get the body of a fresh entry."""
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += entry.size
+        return self._body(entry)
+
+    def revalidated(self, entry: CacheEntry, headers: Mapping[str, str]) -> JSONType:
+        """Get the body of a stale entry, after a `304 Not Modified`."""
+        with self._lock:
+            entry.update(headers)
+            self.revalidations += 1
+            self.bytes_saved += entry.size
+        return self._body(entry)
+
+    def store(self, key: Hashable, headers: Mapping[str, str], body: JSONType, size: int) -> JSONType:
+        """Record a full response, and cache it if allowed.
+
+        Returns:
+            the body (a copy, if it was cached and `copy` is set)
+        """
+        with self._lock:
+            self.misses += 1
+            if not is_cacheable(headers):
+                self._entries.pop(key, None)
+                return body
+            entry = CacheEntry(body, size, headers)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return self._body(entry)
+
+    def clear(self) -> None:
+        """Drop all the entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def as_dict(self) -> Dict[str, int]:
+        """Get a snapshot of all the counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'revalidations': self.revalidations,
+                'misses': self.misses,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'bytes_saved': self.bytes_saved,
+            }
@@ -9,23 +9,84 @@ a json-encoded dictionary as necessary.
 # fmt:quotes-ok
 
 import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import copy
 import dataclasses as dc
+import functools
+import itertools
+import json
 import logging
 import math
 import os
+import threading
 import time
-from typing import Any, Callable, Dict, Generator, Optional, Tuple, Union
+import urllib.parse
+import warnings
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import jwt
 import requests
 import urllib3
+from requests.adapters import DEFAULT_POOLSIZE
 
 from .. import telemetry as wtt
-from ..utils.json_util import JSONType, json_decode
-from .session import AsyncSession, Session
+from ..utils.compression import ACCEPT_ENCODING, compress
+from ..utils.deadline import deadline_scope
+from ..utils.json_util import JSONType, json_decode, json_decode_lines
+from .breaker import CircuitBreaker, CircuitBreakerTransport, get_circuit_breaker
+from .cache import CacheEntry, CacheKey, ResponseCache, request_key
+from .download import (
+    DownloadDest,
+    DownloadResult,
+    DownloadWriter,
+    ProgressCallback,
+    SegmentedWriter,
+    check_range,
+    plan_segments,
+    range_headers,
+)
+from .hedging import HedgingTransport
+from .limiter import AdaptiveLimiter, ConcurrencyLimitTransport
+from .metrics import ClientMetrics, RequestHook, RequestInfo, current_request, path_template
+from .pagination import Page, PageRequest, Pagination
+from .retry import RetryBudget, get_retry_budget, make_retry
+from .session import AsyncSession, PoolStats, Session
+from .tornado_session import TornadoTransport
+from .transport import RequestsTransport, RetryTransport, Transport
+from .upload import DEFAULT_CHUNK_SIZE, UploadBody, UploadSource
 
 MAX_RETRIES = 30
 
+#: max number of threads for `request_many_seq()`, shared by all its calls
+MAX_BATCH_WORKERS = 100
+
+# a call for `request_many()` & co:
+#   (method, path), (method, path, args), or (method, path, args, headers)
+RequestCall = Tuple[Any, ...]
+
+
+#: errors that stop a byte range part way, after which it can be resumed
+_SEGMENT_ERRORS = (
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ReadTimeout,
+)
+
 
 def _to_str(s: Union[str, bytes]) -> str:
     if isinstance(s, bytes):
@@ -33,6 +94,104 @@ def _to_str(s: Union[str, bytes]) -> str:
     return s
 
 
+def _run_coroutine_sync(func: Callable[[], Awaitable[Any]]) -> Any:
+    """Run an async function to completion from sync code.
+
+    Uses a new event loop in a separate thread, in case this thread
+    already has a running loop.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(lambda: asyncio.run(func())).result()  # type: ignore[arg-type]
+
+
+class _NDJSONDecoder:
+    """Incrementally decode newline-delimited json, from chunks of bytes.
+
+    Each chunk is split into lines once, and lines are decoded without
+    stripping. Chunks without `__jsonclass__` objects skip converting
+    them. With a `batch_size`, objects are returned in lists of that size.
+
+    If a line cannot be decoded, the objects before it are still
+    returned, and then the error is raised.
+    """
+
+    def __init__(self, logger: logging.Logger, batch_size: Optional[int] = None) -> None:
+        if batch_size is not None and batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1: {batch_size}")
+        self.logger = logger
+        self.batch_size = batch_size
+        self._partial = b''
+        self._batch: List[JSONType] = []
+
+    def feed(self, chunk: bytes) -> Generator[JSONType, None, None]:
+        """Decode the complete lines, and keep the rest for the next chunk."""
+        if self._partial:
+            chunk = self._partial + chunk
+        lines = chunk.split(b'\n')
+        self._partial = lines.pop()
+        return self._emit(*self._decode(lines, chunk))
+
+    def close(self) -> Generator[JSONType, None, None]:
+        """Decode the last line (if not newline-terminated), and flush the batch."""
+        partial, self._partial = self._partial, b''
+        return self._emit(*self._decode([partial], partial), flush=True)
+
+    def _decode(self, lines: List[bytes], data: bytes) -> Tuple[List[JSONType], Optional[Exception]]:
+        plain = b'__jsonclass__' not in data
+        error = None
+        try:
+            objs = json_decode_lines(lines, plain=plain)
+        except Exception:
+            # decode line by line, to keep the objects before the bad line
+            objs = []
+            for line in lines:
+                try:
+                    objs.extend(json_decode_lines([line], plain=plain))
+                except Exception as e:
+                    self.logger.info('json data: %r', line[:1000])
+                    error = e
+                    break
+        return [obj for obj in objs if obj], error  # skip empty values, like `request_stream` always has
+
+    def _emit(self, objs: List[JSONType], error: Optional[Exception], flush: bool = False) -> Generator[JSONType, None, None]:
+        if not self.batch_size:
+            yield from objs
+        else:
+            self._batch.extend(objs)
+            end = len(self._batch)
+            if not flush and error is None:
+                end -= end % self.batch_size
+            for i in range(0, end, self.batch_size):
+                yield self._batch[i:i + self.batch_size]
+            del self._batch[:end]
+        if error is not None:
+            raise error
+
+
+class _SharedRequest:
+    """An in-flight request, and the number of callers waiting on it."""
+
+    def __init__(self, task: asyncio.Future) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+def _get_token_expiration(token: Union[str, bytes]) -> float:
+    """Get a token's `exp` claim, or 0 if it cannot be read (so it's
+    treated as expired)."""
+    try:
+        # NOTE: PyJWT mis-type-hinted arg #1 as a str, but byte is also fine
+        # https://github.com/jpadilla/pyjwt/pull/605#issuecomment-772082918
+        data = jwt.decode(
+            token,  # type: ignore[arg-type]
+            algorithms=['RS256', 'RS512'],
+            options={"verify_signature": False},
+        )
+        return float(data['exp'])
+    except Exception:
+        return 0.0
+
+
 @dc.dataclass
 class CalcRetryFromBackoffMax:
     """An indicator to auto-calculate the # of retries using a backoff_max.
@@ -132,7 +291,8 @@ class RestClient:
         address (str):
             base address of REST API
         token (str):
-            (optional) access token, or a function generating an access token
+            (optional) access token, or a function generating an access token --
+            an async function is awaited by `request()` without blocking the event loop
         timeout (int):
             (optional) request timeout (default: 60s)
         retries (int | CalcRetryFromBackoffMax | CalcRetryFromWaittimeMax):
@@ -150,16 +310,126 @@ class RestClient:
             (optional) auth-basic password
         logger (logging.Logger):
             (optional) supply a logger to use
+        async_backend (str):
+            (optional) the http backend for async requests (default: 'requests') --
+            'requests' runs each request in a `requests_futures` thread pool,
+            'tornado' runs each request as a coroutine on the event loop
+        pool_connections (int):
+            (optional) number of per-host connection pools to cache (default: 10)
+        pool_maxsize (int):
+            (optional) max connections per host --
+            default: 10 for sync requests, `max_workers` for async requests
+            (at least 10), 1000 for the 'tornado' backend
+        pool_block (bool):
+            (optional) whether to block for a free connection when the pool
+            is full, instead of opening (and then discarding) an extra one
+            (default: False)
+        max_workers (int):
+            (optional) number of worker threads for async requests (default: 8)
+        token_renewal (float):
+            (optional) renew the token in a background thread once this
+            fraction of its lifetime has passed (ex: 0.75), instead of only
+            when a request finds it expired (default: None)
+        compression (str):
+            (optional) compress request bodies with this content-coding
+            ('gzip', 'deflate', 'zstd', or 'br'), and set `Content-Encoding`
+            (default: None)
+        compression_threshold (int):
+            (optional) only compress request bodies of at least this many
+            bytes (default: 1024)
+        transport (Transport):
+            (optional) a custom http transport, instead of the `async_backend`
+            (see :py:mod:`rest_tools.client.transport`) -- the client adds
+            retries on top, and closes it in `close()`
+        cache (ResponseCache):
+            (optional) cache the responses of GET requests, honoring
+            `Cache-Control: max-age` and revalidating with the `ETag` /
+            `Last-Modified` validators (see :py:mod:`rest_tools.client.cache`)
+        coalesce (bool):
+            (optional) concurrent identical GET/HEAD requests (same url,
+            args, and auth) on an event loop share one network call and
+            its decoded result (default: False)
+        circuit_breaker (bool | dict):
+            (optional) fail fast with a `CircuitOpenError` while the
+            server's failure rate is too high, instead of retrying --
+            pass a dict to configure the breaker (see
+            :py:class:`rest_tools.client.breaker.CircuitBreaker`); the
+            breaker is shared by all clients for the same host
+            (default: False)
+        concurrency_limit (bool | dict):
+            (optional) adapt the number of requests in flight to the server
+            (AIMD): shrink it on `503`/`429` and latency growth, and grow it
+            on success -- pass a dict to configure the limiter (see
+            :py:class:`rest_tools.client.limiter.AdaptiveLimiter`)
+            (default: False)
+        hedging (bool | dict):
+            (optional) for async GET/HEAD requests, send a duplicate when
+            no response arrived within a latency percentile of the route,
+            and take the first response -- within a budget of extra
+            requests; pass a dict to configure it (see
+            :py:class:`rest_tools.client.hedging.HedgingTransport`)
+            (default: False)
+        on_request_start (callable):
+            (optional) called with a `RequestInfo` when a request starts
+            (see :py:mod:`rest_tools.client.metrics`)
+        on_request_end (callable):
+            (optional) called with the `RequestInfo` when a request ends,
+            with its duration, status, response size, retries, and error
+        metrics (bool | ClientMetrics):
+            (optional) record per-route histograms of latency, retries,
+            and response size, and counts of statuses -- read them with
+            `metrics.snapshot()` (default: False)
+        retry_policy (dict):
+            (optional) settings for the retries, like `status_retries`,
+            `method_retries`, `allowed_methods`, or `jitter` (see
+            :py:class:`rest_tools.client.retry.RetryPolicy`) -- by default,
+            backoffs have decorrelated jitter, and POST/PATCH are only
+            retried when the request was not processed
+        retry_budget (bool | RetryBudget):
+            (optional) cap retries to a fraction of successful requests --
+            `True` for the budget shared by all clients in the process
+            (see :py:class:`rest_tools.client.retry.RetryBudget`)
+            (default: False)
+        deadline (float):
+            (optional) the default deadline of each call, in seconds --
+            caps each attempt's timeout and the backoffs across retries,
+            and is sent to the server in the `X-Request-Timeout` header
+            (see :py:mod:`rest_tools.utils.deadline`); defaults to the
+            `waittime_max` of a `CalcRetryFromWaittimeMax`
     """
 
+    #: whether a subclass starts the token renewal itself, at the end of its
+    #: `__init__` (with `_start_token_renewal()`), once its token function works
+    _defer_token_renewal = False
+
     def __init__(
         self,
         address: str,
-        token: Optional[Union[str, bytes, Callable[[], Union[str, bytes]]]] = None,
+        token: Optional[Union[str, bytes, Callable[[], Union[str, bytes]], Callable[[], Awaitable[Union[str, bytes]]]]] = None,
         timeout: float = 60.0,
         retries: Union[int, CalcRetryFromBackoffMax, CalcRetryFromWaittimeMax] = 10,
         backoff_factor: float = 0.3,
         logger: Optional[logging.Logger] = None,
+        async_backend: str = 'requests',
+        pool_connections: int = 10,
+        pool_maxsize: Optional[int] = None,
+        pool_block: bool = False,
+        max_workers: int = 8,
+        token_renewal: Optional[float] = None,
+        compression: Optional[str] = None,
+        compression_threshold: int = 1024,
+        transport: Optional[Transport] = None,
+        cache: Optional[ResponseCache] = None,
+        coalesce: bool = False,
+        circuit_breaker: Union[bool, Dict[str, Any]] = False,
+        concurrency_limit: Union[bool, Dict[str, Any]] = False,
+        hedging: Union[bool, Dict[str, Any]] = False,
+        on_request_start: Optional[RequestHook] = None,
+        on_request_end: Optional[RequestHook] = None,
+        metrics: Union[bool, ClientMetrics] = False,
+        retry_policy: Optional[Dict[str, Any]] = None,
+        retry_budget: Union[bool, RetryBudget] = False,
+        deadline: Optional[float] = None,
         **kwargs: Any,
     ) -> None:
         self.address = address
@@ -174,6 +444,55 @@ class RestClient:
         if self.backoff_factor < 0.0:
             raise ValueError(f"backoff_factor must be positive: {self.backoff_factor}")
 
+        if async_backend not in ('requests', 'tornado'):
+            raise ValueError(f"async_backend must be 'requests' or 'tornado': {async_backend}")
+        self.async_backend = async_backend
+
+        if compression:
+            compression = compression.strip().lower()
+            compress(b'', compression)  # raise early if not supported
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+
+        # connection pool sizing + counters
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.max_workers = max_workers
+        self.pool_stats = PoolStats()
+
+        self.cache = cache
+
+        # in-flight requests to share: {(loop id, request key): _SharedRequest}
+        self.coalesce = coalesce
+        self.coalesced_requests = 0
+        self._inflight: Dict[Tuple[Any, ...], _SharedRequest] = {}
+
+        self.circuit_breaker_config: Optional[Dict[str, Any]] = None
+        if circuit_breaker:
+            self.circuit_breaker_config = dict(circuit_breaker) if isinstance(circuit_breaker, dict) else {}
+
+        # one limiter per host, shared by the sync/async/stream transports
+        self.concurrency_limit_config: Optional[Dict[str, Any]] = None
+        self._concurrency_limiters: Dict[str, AdaptiveLimiter] = {}
+        if concurrency_limit:
+            self.concurrency_limit_config = dict(concurrency_limit) if isinstance(concurrency_limit, dict) else {}
+
+        # instrumentation
+        self.on_request_start = on_request_start
+        self.on_request_end = on_request_end
+        self.metrics: Optional[ClientMetrics] = None
+        if isinstance(metrics, ClientMetrics):
+            self.metrics = metrics
+        elif metrics:
+            self.metrics = ClientMetrics()
+
+        # the hedging layer of the async transport, with its stats
+        self.hedging_config: Optional[Dict[str, Any]] = None
+        self.hedging: Optional[HedgingTransport] = None
+        if hedging:
+            self.hedging_config = dict(hedging) if isinstance(hedging, dict) else {}
+
         # get numerical retries value
         if isinstance(retries, CalcRetryFromBackoffMax):
             self.retries = retries.calculate_retries(self.backoff_factor)
@@ -191,77 +510,450 @@ class RestClient:
         _log_retries_values(
             self.retries, self.timeout, self.backoff_factor, self.logger
         )
+        self.deadline = deadline
+        if self.deadline is None and isinstance(retries, CalcRetryFromWaittimeMax):
+            self.deadline = retries.waittime_max
+        if self.deadline is not None and self.deadline <= 0.0:
+            raise ValueError(f"deadline must be positive: {self.deadline}")
+
+        self.retry_budget: Optional[RetryBudget] = None
+        if isinstance(retry_budget, RetryBudget):
+            self.retry_budget = retry_budget
+        elif retry_budget:
+            self.retry_budget = get_retry_budget()
+        self.retry_policy = make_retry(
+            self.retries,
+            self.backoff_factor,
+            budget=self.retry_budget,
+            **(retry_policy or {}),
+        )
 
         # token handling
         self._token_expire_delay_offset = 5
-        self.access_token: Optional[Union[str, bytes]] = None
+        # (token, expiration) -- set together, so readers never see a mismatched pair
+        self._access_token_state: Tuple[Optional[Union[str, bytes]], float] = (None, 0.0)
+        self._token_acquired = 0.0
         self.token_func: Optional[Callable[[], Union[str, bytes]]] = None
+        self.async_token_func: Optional[Callable[[], Awaitable[Union[str, bytes]]]] = None
+        # single-flight refresh: one `token_func` call at a time, waiters share its result
+        self._token_lock = threading.Lock()
+        self._token_refreshes = 0
+        self._token_refresh_error: Optional[Exception] = None
+        self._token_future: Optional[asyncio.Future] = None
         if token:
             if isinstance(token, (str, bytes)):
                 self.access_token = token
+            elif asyncio.iscoroutinefunction(token):
+                self.async_token_func = token
+                self.token_func = functools.partial(_run_coroutine_sync, token)
             elif callable(token):
-                self.token_func = token
+                self.token_func = token  # type: ignore[assignment]
 
-        self.session = self.open()  # start session
+        # background token renewal
+        if token_renewal is not None and not 0.0 < token_renewal < 1.0:
+            raise ValueError(f"token_renewal must be between 0 and 1: {token_renewal}")
+        self.token_renewal = token_renewal
+        self._token_renewal_stop = threading.Event()
+        self._token_renewal_thread: Optional[threading.Thread] = None
 
-    def open(self, sync: bool = False) -> requests.Session:
-        """Open the http session."""
-        self.logger.debug('establish REST http session')
+        # fallback transports, when `transport` cannot do sync requests or async streaming
+        self._sync_transport: Optional[Transport] = None
+        self._stream_transport: Optional[Transport] = None
+        self._fallback_lock = threading.Lock()
+        self._compat_session: Optional[requests.Session] = None
+        self._batch_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+        self._custom_transport = transport
+        self.transport = self.open_transport()  # start transport
+
+        if not self._defer_token_renewal:
+            self._start_token_renewal()
+
+    @property
+    def session(self) -> requests.Session:
+        """Deprecated: use :py:attr:`transport` instead.
+
+        A `requests` session (a `FuturesSession`, as before), with the
+        client's headers, auth, and retries, for code that sends its own
+        requests with it. The client's requests go through `transport`,
+        so changing this session does not affect them -- but assigning
+        a session sends the client's requests with it (see the setter).
+        """
+        warnings.warn(
+            'RestClient.session is deprecated, and no longer used for requests; use RestClient.transport',
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        with self._fallback_lock:
+            if self._compat_session is None:
+                self._compat_session = self._new_compat_session()
+            return self._compat_session
+
+    @session.setter
+    def session(self, session: requests.Session) -> None:
+        """Deprecated: send the client's requests with `session`.
+
+        Use `RestClient(..., transport=RequestsTransport(session=session))`
+        instead. The session is wrapped in a
+        :py:class:`rest_tools.client.RequestsTransport`, with the client's
+        retries and other policies on top. The session's headers, auth,
+        and ssl settings are used over the client's.
+        """
+        warnings.warn(
+            'setting RestClient.session is deprecated; use RestClient(transport=RequestsTransport(session=...))',
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        transport = self._wrap_transport(RequestsTransport(session=session, stats=self.pool_stats), hedge=True)
+        transport.headers.update({k: _to_str(v) for k, v in session.headers.items()})
+        if session.auth is not None:
+            transport.auth = session.auth  # type: ignore[assignment]
+        if session.cert is not None:
+            transport.cert = session.cert
+        if session.verify is not True:
+            transport.verify = session.verify
+        old, self.transport = self.transport, transport
+        old.close()
+        with self._fallback_lock:
+            if self._compat_session is not None and self._compat_session is not session:
+                self._compat_session.close()
+            self._compat_session = session
+
+    def _new_compat_session(self, sync: bool = False) -> requests.Session:
+        """Internal method for a `requests` session configured like the client."""
         if sync:
-            self.session = Session(
+            session = Session(
                 self.retries,
-                backoff_factor=self.backoff_factor,
+                self.backoff_factor,
+                pool_connections=self.pool_connections,
+                pool_maxsize=self.pool_maxsize or DEFAULT_POOLSIZE,
+                pool_block=self.pool_block,
             )
         else:
-            self.session = AsyncSession(
+            session = AsyncSession(
                 self.retries,
-                backoff_factor=self.backoff_factor,
+                self.backoff_factor,
+                pool_connections=self.pool_connections,
+                pool_maxsize=self.pool_maxsize,
+                pool_block=self.pool_block,
+                max_workers=self.max_workers,
             )
-        self.session.headers = {  # type: ignore[assignment]
+        session.headers.update(self.transport.headers)
+        session.auth = self.transport.auth
+        session.cert = self.transport.cert
+        session.verify = self.transport.verify
+        return session
+
+    def _configure_transport(self, transport: Transport) -> Transport:
+        """Apply the default headers and the auth/ssl settings to a transport."""
+        transport.headers = {
             'Content-Type': 'application/json',
+            'Accept-Encoding': ACCEPT_ENCODING,
         }
         if 'username' in self.kwargs and 'password' in self.kwargs:
-            self.session.auth = (self.kwargs['username'], self.kwargs['password'])
+            transport.auth = (self.kwargs['username'], self.kwargs['password'])
         if 'sslcert' in self.kwargs:
             if 'sslkey' in self.kwargs:
-                self.session.cert = (self.kwargs['sslcert'], self.kwargs['sslkey'])
+                transport.cert = (self.kwargs['sslcert'], self.kwargs['sslkey'])
             else:
-                self.session.cert = self.kwargs['sslcert']
+                transport.cert = self.kwargs['sslcert']
         if 'cacert' in self.kwargs:
-            self.session.verify = self.kwargs['cacert']
+            transport.verify = self.kwargs['cacert']
+        return transport
+
+    def _wrap_transport(self, transport: Transport, hedge: bool = False) -> Transport:
+        """Layer the client's policies (concurrency limit, circuit breaker,
+        hedging, retries) on top of a base transport."""
+        transport = self._configure_transport(transport)
+        if self.concurrency_limit_config is not None:
+            limit_transport = ConcurrencyLimitTransport(
+                transport,
+                limiters=self._concurrency_limiters,
+                **self.concurrency_limit_config,
+            )
+            limit_transport.get_limiter(self.address)  # raise early for bad settings
+            transport = limit_transport
+        if self.circuit_breaker_config is not None:
+            # below the retries, so each attempt is checked
+            breaker_transport = CircuitBreakerTransport(transport, **self.circuit_breaker_config)
+            breaker_transport.get_breaker(self.address)  # raise early for bad settings
+            transport = breaker_transport
+        if hedge and self.hedging_config is not None:
+            # a hedge is a second attempt, so it is limited and checked like one
+            self.hedging = HedgingTransport(transport, **self.hedging_config)
+            transport = self.hedging
+        return RetryTransport(transport, self.retry_policy)
+
+    @property
+    def concurrency_limiter(self) -> Optional[AdaptiveLimiter]:
+        """The concurrency limiter for the server, if enabled."""
+        if self.concurrency_limit_config is None:
+            return None
+        return self._concurrency_limiters[urllib.parse.urlsplit(self.address).netloc]
+
+    @property
+    def circuit_breaker(self) -> Optional[CircuitBreaker]:
+        """The circuit breaker for the server, if enabled."""
+        if self.circuit_breaker_config is None:
+            return None
+        return get_circuit_breaker(self.address)
+
+    def _new_requests_transport(self) -> Transport:
+        return RequestsTransport(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+            max_workers=self.max_workers,
+            stats=self.pool_stats,
+        )
 
-        return self.session
+    def _new_tornado_transport(self) -> Transport:
+        return TornadoTransport(
+            max_clients=self.pool_maxsize or 1000,
+            stats=self.pool_stats,
+        )
+
+    def open(self, sync: bool = False) -> requests.Session:
+        """Deprecated: use :py:meth:`open_transport` instead.
+
+        Open a new `requests` session (a `FuturesSession`, or a plain
+        `Session` with `sync`), configured like the client, which becomes
+        :py:attr:`session`. The client's requests go through `transport`,
+        not this session.
+
+        Args:
+            sync (bool): open a plain (sync) session
+
+        Returns:
+            requests.Session: the session
+        """
+        warnings.warn(
+            'RestClient.open() is deprecated; use RestClient.open_transport()',
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        session = self._new_compat_session(sync)
+        with self._fallback_lock:
+            if self._compat_session is not None:
+                self._compat_session.close()
+            self._compat_session = session
+        return session
+
+    def open_transport(self, sync: bool = False) -> Transport:
+        """Open the http transport.
+
+        Args:
+            sync (bool): get the transport used for sync requests instead
+
+        Returns:
+            Transport: the transport, with retries
+        """
+        if sync:
+            return self._get_sync_transport()
+        self.logger.debug('establish REST http transport')
+        if self._custom_transport is not None:
+            base = self._custom_transport
+        elif self.async_backend == 'tornado':
+            base = self._new_tornado_transport()
+        else:
+            base = self._new_requests_transport()
+        self.transport = self._wrap_transport(base, hedge=True)
+        return self.transport
+
+    def _get_sync_transport(self) -> Transport:
+        """Get the transport for sync requests, opening a fallback if needed."""
+        if self.transport.supports_sync:
+            return self.transport
+        with self._fallback_lock:
+            if self._sync_transport is None:
+                self.logger.debug('establish REST http sync transport')
+                self._sync_transport = self._wrap_transport(self._new_requests_transport())
+            return self._sync_transport
+
+    def _get_stream_transport(self) -> Transport:
+        """Get the transport for async streaming, opening a fallback if needed."""
+        if self.transport.supports_stream:
+            return self.transport
+        with self._fallback_lock:
+            if self._stream_transport is None:
+                self.logger.debug('establish REST http stream transport')
+                self._stream_transport = self._wrap_transport(self._new_tornado_transport())
+            return self._stream_transport
+
+    def _get_batch_pool(self) -> concurrent.futures.ThreadPoolExecutor:
+        """Get the thread pool for `request_many_seq()`, starting it if needed."""
+        with self._fallback_lock:
+            if self._batch_pool is None:
+                self._batch_pool = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=MAX_BATCH_WORKERS,
+                    thread_name_prefix='rest_tools_batch',
+                )
+            return self._batch_pool
 
     def close(self) -> None:
-        """Close the http session."""
+        """Close the http transports."""
         self.logger.info('close REST http session')
-        if self.session:
-            self.session.close()
+        self._token_renewal_stop.set()
+        if self.transport:
+            self.transport.close()
+        with self._fallback_lock:
+            for transport in (self._sync_transport, self._stream_transport):
+                if transport is not None:
+                    transport.close()
+            self._sync_transport = None
+            self._stream_transport = None
+            if self._compat_session is not None:
+                self._compat_session.close()
+                self._compat_session = None
+            if self._batch_pool is not None:
+                self._batch_pool.shutdown(wait=False)
+                self._batch_pool = None
 
-    def _get_token(self) -> None:
-        if self.access_token:
-            # check if expired
-            try:
-                # NOTE: PyJWT mis-type-hinted arg #1 as a str, but byte is also fine
-                # https://github.com/jpadilla/pyjwt/pull/605#issuecomment-772082918
-                data = jwt.decode(
-                    self.access_token,  # type: ignore[arg-type]
-                    algorithms=['RS256', 'RS512'],
-                    options={"verify_signature": False},
-                )
-                # account for an X second delay over the wire, so expire sooner
-                if data['exp'] < time.time() + self._token_expire_delay_offset:
-                    raise Exception()
-                return
-            except Exception:
-                self.access_token = None
+    @property
+    def access_token(self) -> Optional[Union[str, bytes]]:
+        """The current access token."""
+        return self._access_token_state[0]
+
+    @access_token.setter
+    def access_token(self, token: Optional[Union[str, bytes]]) -> None:
+        # parse the expiration once, instead of on every request
+        self._access_token_state = (token, _get_token_expiration(token) if token else 0.0)
+        self._token_acquired = time.time()
+
+    def _get_fresh_token(self) -> Optional[Union[str, bytes]]:
+        """Get the access token, if it's not (about to be) expired."""
+        token, exp = self._access_token_state
+        # account for an X second delay over the wire, so expire sooner
+        if token and exp >= time.time() + self._token_expire_delay_offset:
+            return token
+        return None
+
+    def _get_token(self) -> Optional[Union[str, bytes]]:
+        token = self._get_fresh_token()
+        if token:
+            return token
+
+        refreshes = self._token_refreshes
+        with self._token_lock:
+            # another thread may have refreshed the token while we waited
+            token = self._get_fresh_token()
+            if token:
+                return token
+            if self._token_refreshes != refreshes and self._token_refresh_error:
+                raise self._token_refresh_error  # share the failed refresh we waited on
+
+            if self.access_token:
+                self.logger.debug('token expired')
+            return self._call_token_func()
+
+    async def _aget_token(self) -> Optional[Union[str, bytes]]:
+        """Async version of `_get_token`, which never blocks the event loop."""
+        token = self._get_fresh_token()
+        if token:
+            return token
+
+        # single-flight: coroutines on this loop share one in-flight refresh,
+        # which takes `_token_lock` to be single-flight with the other threads
+        loop = asyncio.get_running_loop()
+        fut = self._token_future
+        if fut is None or fut.done() or fut.get_loop() is not loop:
+            if self.async_token_func:
+                fut = asyncio.ensure_future(self._arefresh_token())
+            else:
+                # run the blocking token function in a thread
+                fut = loop.run_in_executor(None, self._get_token)
+            self._token_future = fut
+        return await asyncio.shield(fut)
+
+    async def _arefresh_token(self) -> Optional[Union[str, bytes]]:
+        """Acquire a new access token with the async token function.
+
+        Takes `_token_lock` (in a thread, so the event loop is not
+        blocked), so it never runs at the same time as a sync refresh
+        or the background renewal.
+        """
+        refreshes = self._token_refreshes
+        acquire = asyncio.get_running_loop().run_in_executor(None, self._token_lock.acquire)
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # release the lock once the thread gets it
+            acquire.add_done_callback(lambda _: self._token_lock.release())
+            raise
+        try:
+            # another thread may have refreshed the token while we waited
+            token = self._get_fresh_token()
+            if token:
+                return token
+            if self._token_refreshes != refreshes and self._token_refresh_error:
+                raise self._token_refresh_error
+
+            if self.access_token:
                 self.logger.debug('token expired')
+            self._token_refreshes += 1
+            try:
+                token = await self.async_token_func()  # type: ignore[misc]
+            except Exception as e:
+                self._token_refresh_error = e
+                self.logger.warning('acquiring access token failed')
+                raise
+            self._token_refresh_error = None
+            self.access_token = token
+            return token
+        finally:
+            self._token_lock.release()
 
+    def _call_token_func(self) -> Optional[Union[str, bytes]]:
+        """Acquire a new access token. Call with `_token_lock` held."""
+        self._token_refreshes += 1
         try:
             self.access_token = self.token_func()  # type: ignore[misc]
-        except Exception:
+        except Exception as e:
+            self._token_refresh_error = e
             self.logger.warning('acquiring access token failed')
             raise
+        self._token_refresh_error = None
+        return self.access_token
+
+    def _start_token_renewal(self) -> None:
+        """Start the background token renewal, if enabled."""
+        if self.token_func and self.token_renewal and self._token_renewal_thread is None:
+            self._token_renewal_thread = threading.Thread(
+                target=self._token_renewal_loop,
+                name=f'{self.logger.name}-token-renewal',
+                daemon=True,
+            )
+            self._token_renewal_thread.start()
+
+    def _token_renewal_loop(self) -> None:
+        """Renew the access token before it expires, until closed.
+
+        If a renewal fails, requests fall back to refreshing the token
+        on demand.
+        """
+        while not self._token_renewal_stop.is_set():
+            _, exp = self._access_token_state
+            if not self.access_token:
+                wait = 0.0
+            elif exp <= self._token_acquired:
+                self.logger.debug('token has no (valid) expiration, stopping background renewal')
+                return
+            else:
+                renew_at = self._token_acquired + self.token_renewal * (exp - self._token_acquired)  # type: ignore[operator]
+                wait = renew_at - time.time()
+            if wait > 0 and self._token_renewal_stop.wait(wait):
+                return
+
+            try:
+                with self._token_lock:
+                    self._call_token_func()
+                self.logger.debug('token renewed in background')
+            except Exception:
+                self.logger.warning('background token renewal failed', exc_info=True)
+                # try again, well before the token expires
+                retry_wait = min(60.0, max(1.0, (exp - time.time()) / 4))
+                if self._token_renewal_stop.wait(retry_wait):
+                    return
 
     def _prepare(
         self,
@@ -269,13 +961,22 @@ class RestClient:
         path: str,
         args: Optional[Dict[str, Any]] = None,
         headers: Optional[Dict[str, str]] = None,
+        token: Optional[Union[str, bytes]] = None,
+        body: Optional[UploadBody] = None,
     ) -> Tuple[str, Dict[str, Any]]:
-        """Internal method for preparing requests."""
+        """Internal method for preparing requests.
+
+        If no `token` is given, the access token is acquired as needed.
+        With a streamed `body`, the `args` go in the query string.
+        """
         if not args:
             args = {}
 
+        if not headers:
+            headers = {}
+
         # auto-inject the current span's info into the HTTP headers
-        wtt.inject_span_carrier_if_recording(self.session.headers)  # type: ignore[arg-type]
+        wtt.inject_span_carrier_if_recording(headers)
 
         if path.startswith('/'):
             path = path[1:]
@@ -283,26 +984,163 @@ class RestClient:
 
         kwargs: Dict[str, Any] = {'timeout': self.timeout}
 
-        if method in ('GET', 'HEAD'):
+        if body is not None:
+            kwargs['params'] = args
+            kwargs['data'] = body
+        elif method in ('GET', 'HEAD'):
             # args should be urlencoded
             kwargs['params'] = args
+        elif self.compression:
+            payload = json.dumps(args, allow_nan=False).encode('utf-8')
+            if len(payload) >= self.compression_threshold:
+                payload = compress(payload, self.compression)
+                headers['Content-Encoding'] = self.compression
+            kwargs['data'] = payload
         else:
             kwargs['json'] = args
 
-        if self.token_func:
-            self._get_token()
-
-        if not headers:
-            headers = {}
-
-        if self.access_token:
-            headers['Authorization'] = 'Bearer ' + _to_str(self.access_token)
+        if token is None:
+            token = self._get_token() if self.token_func else self.access_token
+        if token:
+            headers['Authorization'] = 'Bearer ' + _to_str(token)
 
         if headers:
             kwargs['headers'] = headers
 
         return (url, kwargs)
 
+    async def _aprepare(
+        self,
+        method: str,
+        path: str,
+        args: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        body: Optional[UploadBody] = None,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Internal method for preparing async requests."""
+        token = await self._aget_token() if self.token_func else self.access_token
+        return self._prepare(method, path, args, headers, token=token, body=body)
+
+    def _prepare_request(
+        self,
+        transport: Transport,
+        method: str,
+        url: str,
+        kwargs: Dict[str, Any],
+    ) -> Tuple[requests.PreparedRequest, Optional[float]]:
+        """Internal method for encoding a prepared request, for a transport."""
+        kwargs = dict(kwargs)
+        timeout = kwargs.pop('timeout', None)
+        return transport.prepare_request(method, url, **kwargs), timeout
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        kwargs: Dict[str, Any],
+    ) -> requests.Response:
+        """Internal method for sending a prepared request asynchronously."""
+        prepared, timeout = self._prepare_request(self.transport, method, url, kwargs)
+        return await self.transport.send(prepared, timeout)
+
+    def _cache_lookup(
+        self,
+        method: str,
+        url: str,
+        kwargs: Dict[str, Any],
+    ) -> Tuple[Optional[CacheKey], Optional[CacheEntry]]:
+        """Internal method for finding a cached response.
+
+        For a stale entry, the validators are added to the request headers.
+        """
+        if self.cache is None or method != 'GET':
+            return None, None
+        headers = kwargs.get('headers', {})
+        key = self.cache.key(method, url, kwargs.get('params'), headers.get('Authorization'))
+        entry = self.cache.get(key)
+        if entry is not None and not entry.is_fresh():
+            kwargs['headers'] = {**headers, **entry.validators()}
+        return key, entry
+
+    def _cache_response(
+        self,
+        key: CacheKey,
+        entry: Optional[CacheEntry],
+        r: requests.Response,
+    ) -> JSONType:
+        """Internal method for decoding a response, and caching it."""
+        assert self.cache is not None
+        if r.status_code == 304 and entry is not None:
+            return self.cache.revalidated(entry, r.headers)
+        return self.cache.store(key, r.headers, self._decode(r.content), len(r.content))
+
+    def _run_hook(self, hook: Optional[RequestHook], info: RequestInfo) -> None:
+        if hook is not None:
+            try:
+                hook(info)
+            except Exception:
+                self.logger.warning('request hook %r failed', hook, exc_info=True)
+
+    @contextlib.contextmanager
+    def _instrument(self, method: str, path: str, bind: bool = True) -> Generator[Optional[RequestInfo], None, None]:
+        """Internal method for tracking a request, for the hooks and metrics.
+
+        A generator can be resumed (or closed) in another context, so it
+        should turn `bind` off, and only bind the request around the
+        sends, with `_bind_request()`.
+        """
+        if self.on_request_start is None and self.on_request_end is None and self.metrics is None:
+            yield None
+            return
+        info = RequestInfo(method, path, path_template(path), time.monotonic())
+        token = current_request.set(info) if bind else None
+        self._run_hook(self.on_request_start, info)
+        try:
+            yield info
+        except GeneratorExit:
+            raise  # a stream closed early by the caller
+        except BaseException as e:
+            info.error = e
+            raise
+        finally:
+            if token is not None:
+                current_request.reset(token)
+            info.duration = time.monotonic() - info.start_time
+            if self.metrics is not None:
+                self.metrics.record(info)
+            self._run_hook(self.on_request_end, info)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _bind_request(info: Optional[RequestInfo]) -> Generator[None, None, None]:
+        """Internal method for making a request's info current, for the transports."""
+        if info is None:
+            yield
+            return
+        token = current_request.set(info)
+        try:
+            yield
+        finally:
+            current_request.reset(token)
+
+    @staticmethod
+    def _record_response(r: requests.Response, size: Optional[int] = None) -> None:
+        """Internal method for adding a response to the current request's info.
+
+        For a streamed response, give the `size` of the body read.
+        """
+        info = current_request.get()
+        if info is not None:
+            info.status = r.status_code
+            info.response_size = len(r.content) if size is None else size
+
+    @staticmethod
+    def _record_source(source: str) -> None:
+        """Internal method for noting a request was answered without the network."""
+        info = current_request.get()
+        if info is not None:
+            info.source = source
+
     def _decode(self, content: Union[str, bytes, bytearray]) -> JSONType:
         """Internal method for translating response from json."""
         if not content:
@@ -325,6 +1163,7 @@ class RestClient:
         path: str,
         args: Optional[Dict[str, Any]] = None,
         headers: Optional[Dict[str, str]] = None,
+        deadline: Optional[float] = None,
     ) -> JSONType:
         """Send request to REST Server.
 
@@ -335,15 +1174,78 @@ class RestClient:
             path (str): the url path on the server
             args (dict): any arguments to pass
             headers (dict): any headers to pass to the request
+            deadline (float): (optional) seconds for the whole call,
+                including retries (default: the client's `deadline`)
 
         Returns:
             dict: json dict or raw string
         """
-        url, kwargs = self._prepare(method, path, args, headers)
+        with self._instrument(method, path), deadline_scope(deadline if deadline is not None else self.deadline):
+            url, kwargs = await self._aprepare(method, path, args, headers)
+            if self.coalesce and method in ('GET', 'HEAD'):
+                return await self._request_coalesced(method, path, args, url, kwargs)
+            return await self._request(method, path, args, url, kwargs)
+
+    async def _request_coalesced(
+        self,
+        method: str,
+        path: str,
+        args: Optional[Dict[str, Any]],
+        url: str,
+        kwargs: Dict[str, Any],
+    ) -> JSONType:
+        """Internal method for joining an identical in-flight request, or starting one.
+
+        The request runs in its own task, so cancelling one caller does
+        not affect the others. It is only cancelled once every caller is.
+        """
+        auth = kwargs.get('headers', {}).get('Authorization')
+        key = (id(asyncio.get_running_loop()),) + request_key(method, url, kwargs.get('params'), auth)
+        shared = self._inflight.get(key)
+        if shared is None:
+            shared = _SharedRequest(asyncio.ensure_future(self._request(method, path, args, url, kwargs)))
+            self._inflight[key] = shared
+
+            def done(_: asyncio.Future, shared: _SharedRequest = shared) -> None:
+                if self._inflight.get(key) is shared:
+                    del self._inflight[key]
+            shared.task.add_done_callback(done)
+        else:
+            self.coalesced_requests += 1
+            self._record_source('coalesced')
+
+        shared.waiters += 1
         try:
-            # session: AsyncSession; So, self.session.request() -> Future
-            r: requests.Response = await asyncio.wrap_future(self.session.request(method, url, **kwargs))  # type: ignore[arg-type]
+            ret = await asyncio.shield(shared.task)
+        except asyncio.CancelledError:
+            shared.waiters -= 1
+            if shared.waiters == 0:
+                shared.task.cancel()
+            raise
+        # every caller gets its own copy of the result to modify -- the
+        # last one to resume can have the original, as the others are done copying
+        shared.waiters -= 1
+        return copy.deepcopy(ret) if shared.waiters else ret
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        args: Optional[Dict[str, Any]],
+        url: str,
+        kwargs: Dict[str, Any],
+    ) -> JSONType:
+        """Internal method for sending a prepared request, and decoding the response."""
+        key, entry = self._cache_lookup(method, url, kwargs)
+        if entry is not None and entry.is_fresh():
+            self._record_source('cache')
+            return self.cache.hit(entry)  # type: ignore[union-attr]
+        try:
+            r = await self._send(method, url, kwargs)
+            self._record_response(r)
             r.raise_for_status()
+            if key is not None:
+                return self._cache_response(key, entry, r)
             return self._decode(r.content)
         except requests.exceptions.HTTPError as e:
             if method == 'DELETE' and e.response.status_code == 404:
@@ -351,6 +1253,73 @@ class RestClient:
             self.logger.info('bad request: %s %s %r', method, path, args, exc_info=True)
             raise
 
+    async def request_many_as_completed(
+        self,
+        calls: Iterable[RequestCall],
+        concurrency: int = 10,
+    ) -> AsyncGenerator[Tuple[int, Union[JSONType, Exception]], None]:
+        """Send many requests to REST Server, and stream results back as
+        they complete.
+
+        At most `concurrency` requests are in flight at once, and `calls`
+        is consumed lazily, so it can be a (very large) generator. An
+        exception from a request is yielded as its result, instead of
+        stopping the other requests.
+
+        Args:
+            calls (iterable): tuples of `(method, path[, args[, headers]])`
+            concurrency (int): max number of requests in flight
+
+        Returns:
+            async generator of `(index, result)`, where `index` is the
+            position in `calls` and `result` is the json dict, raw string,
+            or exception
+        """
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be at least 1: {concurrency}")
+
+        async def run(i: int, call: RequestCall) -> Tuple[int, Union[JSONType, Exception]]:
+            try:
+                return i, await self.request(*call)
+            except Exception as e:
+                return i, e
+
+        numbered = enumerate(calls)
+        pending: Set[asyncio.Future] = set()
+        try:
+            while True:
+                for i, call in itertools.islice(numbered, concurrency - len(pending)):
+                    pending.add(asyncio.ensure_future(run(i, call)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    yield fut.result()
+        finally:
+            for fut in pending:
+                fut.cancel()
+
+    async def request_many(
+        self,
+        calls: Iterable[RequestCall],
+        concurrency: int = 10,
+    ) -> List[Union[JSONType, Exception]]:
+        """Send many requests to REST Server, with bounded concurrency.
+
+        Async request - use with coroutines.
+
+        Args:
+            calls (iterable): tuples of `(method, path[, args[, headers]])`
+            concurrency (int): max number of requests in flight
+
+        Returns:
+            list: json dict, raw string, or exception for each call, in input order
+        """
+        results: Dict[int, Union[JSONType, Exception]] = {}
+        async for i, result in self.request_many_as_completed(calls, concurrency):
+            results[i] = result
+        return [results[i] for i in range(len(results))]
+
     @wtt.spanned(
         span_namer=wtt.SpanNamer(use_this_arg='method'),
         these=['method', 'path', 'self.address'],
@@ -362,6 +1331,7 @@ class RestClient:
         path: str,
         args: Optional[Dict[str, Any]] = None,
         headers: Optional[Dict[str, str]] = None,
+        deadline: Optional[float] = None,
     ) -> JSONType:
         """Send request to REST Server.
 
@@ -372,19 +1342,64 @@ class RestClient:
             path (str): the url path on the server
             args (dict): any arguments to pass
             headers (dict): any headers to pass to the request
+            deadline (float): (optional) seconds for the whole call,
+                including retries (default: the client's `deadline`)
 
         Returns:
             dict: json dict or raw string
         """
-        s = self.session
-        try:
-            self.open(sync=True)
+        transport = self._get_sync_transport()
+        with self._instrument(method, path), deadline_scope(deadline if deadline is not None else self.deadline):
             url, kwargs = self._prepare(method, path, args, headers)
-            r = self.session.request(method, url, **kwargs)
+            key, entry = self._cache_lookup(method, url, kwargs)
+            if entry is not None and entry.is_fresh():
+                self._record_source('cache')
+                return self.cache.hit(entry)  # type: ignore[union-attr]
+            prepared, timeout = self._prepare_request(transport, method, url, kwargs)
+            r = transport.send_sync(prepared, timeout)
+            self._record_response(r)
             r.raise_for_status()
+            if key is not None:
+                return self._cache_response(key, entry, r)
             return self._decode(r.content)
-        finally:
-            self.session = s
+
+    def request_many_seq(
+        self,
+        calls: Iterable[RequestCall],
+        concurrency: int = 10,
+    ) -> List[Union[JSONType, Exception]]:
+        """Send many requests to REST Server, with bounded concurrency.
+
+        Sequential version of `request_many` -- requests are run by the
+        client's thread pool (of up to `MAX_BATCH_WORKERS` threads, shared
+        by all calls), at most `concurrency` at a time.
+
+        Args:
+            calls (iterable): tuples of `(method, path[, args[, headers]])`
+            concurrency (int): max number of requests in flight
+
+        Returns:
+            list: json dict, raw string, or exception for each call, in input order
+        """
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be at least 1: {concurrency}")
+
+        slots = threading.Semaphore(concurrency)
+
+        def run(call: RequestCall) -> Union[JSONType, Exception]:
+            try:
+                return self.request_seq(*call)
+            except Exception as e:
+                return e
+            finally:
+                slots.release()
+
+        pool = self._get_batch_pool()
+        futures = []
+        for call in calls:
+            slots.acquire()
+            futures.append(pool.submit(run, call))
+        return [fut.result() for fut in futures]
 
     @wtt.spanned(
         span_namer=wtt.SpanNamer(use_this_arg='method'),
@@ -398,6 +1413,8 @@ class RestClient:
         args: Optional[Dict[str, Any]] = None,
         headers: Optional[Dict[str, str]] = None,
         chunk_size: Optional[int] = 8096,
+        batch_size: Optional[int] = None,
+        deadline: Optional[float] = None,
     ) -> Generator[JSONType, None, None]:
         """Send request to REST Server, and stream results back.
 
@@ -405,28 +1422,623 @@ class RestClient:
         in whatever size the chunks are received. `chunk_size`<`1`
         will be treated as `chunk_size=None`
 
+        For large streams, use a larger `chunk_size` (ex: 1MiB), and a
+        `batch_size` to get lists of results instead of one at a time.
+
         Args:
             method (str): the http method
             path (str): the url path on the server
             args (dict): any arguments to pass
             headers (dict): any headers to pass to the request
             chunk_size (int): chunk size (see above)
+            batch_size (int): (optional) yield lists of up to this many results
+            deadline (float): (optional) seconds to get the response,
+                including retries (default: the client's `deadline`)
 
         Returns:
-            dict: json dict or raw string
+            dict: json dict or raw string (or a list of them, with `batch_size`)
         """
         if chunk_size is not None and chunk_size < 1:
             chunk_size = None
+        decoder = _NDJSONDecoder(self.logger, batch_size)
+
+        transport = self._get_sync_transport()
+        with self._instrument(method, path, bind=False) as info:
+            with self._bind_request(info), deadline_scope(deadline if deadline is not None else self.deadline):
+                url, kwargs = self._prepare(method, path, args, headers)
+                prepared, timeout = self._prepare_request(transport, method, url, kwargs)
+                resp = transport.send_sync(prepared, timeout, stream=True)
+                self._record_response(resp, 0)
+            size = 0
+            try:
+                with resp:
+                    resp.raise_for_status()
+                    for chunk in resp.iter_content(chunk_size=chunk_size):
+                        size += len(chunk)
+                        yield from decoder.feed(chunk)
+                    yield from decoder.close()
+            finally:
+                if info is not None:
+                    info.response_size = size
+
+    async def request_stream_async(
+        self,
+        method: str,
+        path: str,
+        args: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        max_buffered_chunks: int = 16,
+        batch_size: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ) -> AsyncGenerator[JSONType, None]:
+        """Send request to REST Server, and stream results back.
+
+        Async version of `request_stream` - use with `async for`.
+
+        Each line is decoded as soon as it arrives. Only a bounded amount
+        of the response is buffered: while the caller is busy, reading
+        from the server is paused, instead of queueing up the rest of the
+        response in memory.
+
+        Args:
+            method (str): the http method
+            path (str): the url path on the server
+            args (dict): any arguments to pass
+            headers (dict): any headers to pass to the request
+            max_buffered_chunks (int): number of received chunks (up to
+                64KiB each) to buffer before pausing the read
+            batch_size (int): (optional) yield lists of up to this many results
+            deadline (float): (optional) seconds to get the response,
+                including retries (default: the client's `deadline`)
+
+        Returns:
+            async generator of json dicts or raw strings (or lists of them, with `batch_size`)
+        """
+        decoder = _NDJSONDecoder(self.logger, batch_size)
+        transport = self._get_stream_transport()
+        with self._instrument(method, path, bind=False) as info:
+            with self._bind_request(info), deadline_scope(deadline if deadline is not None else self.deadline):
+                url, kwargs = await self._aprepare(method, path, args, headers)
+                prepared, timeout = self._prepare_request(transport, method, url, kwargs)
+                sr = await transport.send_stream(prepared, timeout, max_buffered_chunks)
+                self._record_response(sr.response, 0)
+            size = 0
+            try:
+                if sr.status_code >= 400:
+                    size = len(await sr.read())
+                    sr.response.raise_for_status()
+                async for chunk in sr.chunks():
+                    size += len(chunk)
+                    for obj in decoder.feed(chunk):
+                        yield obj
+            finally:
+                sr.close()
+                if info is not None:
+                    info.response_size = size
+            for obj in decoder.close():
+                yield obj
+
+    @staticmethod
+    def _upload_body(
+        source: Union[UploadSource, UploadBody],
+        headers: Optional[Dict[str, str]],
+        content_type: str,
+        chunk_size: int,
+    ) -> Tuple[UploadBody, Dict[str, str]]:
+        """Internal method for wrapping the source and headers of an upload."""
+        body = source if isinstance(source, UploadBody) else UploadBody(source, chunk_size)
+        headers = dict(headers) if headers else {}
+        if not any(k.lower() == 'content-type' for k in headers):
+            headers['Content-Type'] = content_type
+        return body, headers
+
+    @wtt.spanned(
+        span_namer=wtt.SpanNamer(use_this_arg='method'),
+        these=['method', 'path', 'self.address'],
+        kind=wtt.SpanKind.CLIENT,
+    )
+    async def upload(
+        self,
+        method: str,
+        path: str,
+        source: Union[UploadSource, UploadBody],
+        args: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        content_type: str = 'application/octet-stream',
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        deadline: Optional[float] = None,
+    ) -> JSONType:
+        """Upload a streamed body to REST Server.
+
+        Async request - use with coroutines.
+
+        The body is read in chunks as it is sent, so a file of any size
+        is uploaded in constant memory. A file (by path, or a seekable
+        file object) is re-sent from the start on a retry. An iterator
+        can only be sent once, so it is not retried once it was read
+        (see :py:mod:`rest_tools.client.upload`).
+
+        Args:
+            method (str): the http method (ex: PUT or POST)
+            path (str): the url path on the server
+            source (str | file | bytes | iterable): a file path, a binary
+                file object, bytes, or an iterable of bytes
+            args (dict): any arguments to pass, in the query string
+            headers (dict): any headers to pass to the request
+            content_type (str): the body's `Content-Type`, unless in `headers`
+            chunk_size (int): bytes per read, from a file
+            deadline (float): (optional) seconds for the whole call,
+                including retries (default: the client's `deadline`)
+
+        Returns:
+            dict: json dict or raw string
+        """
+        body, headers = self._upload_body(source, headers, content_type, chunk_size)
+        with self._instrument(method, path), deadline_scope(deadline if deadline is not None else self.deadline):
+            url, kwargs = await self._aprepare(method, path, args, headers, body=body)
+            r = await self._send(method, url, kwargs)
+            self._record_response(r)
+            try:
+                r.raise_for_status()
+            except requests.exceptions.HTTPError:
+                self.logger.info('bad upload: %s %s %r', method, path, body, exc_info=True)
+                raise
+            return self._decode(r.content)
+
+    @wtt.spanned(
+        span_namer=wtt.SpanNamer(use_this_arg='method'),
+        these=['method', 'path', 'self.address'],
+        kind=wtt.SpanKind.CLIENT,
+    )
+    def upload_seq(
+        self,
+        method: str,
+        path: str,
+        source: Union[UploadSource, UploadBody],
+        args: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        content_type: str = 'application/octet-stream',
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        deadline: Optional[float] = None,
+    ) -> JSONType:
+        """Upload a streamed body to REST Server.
+
+        Sequential version of `upload`.
+
+        Args:
+            method (str): the http method (ex: PUT or POST)
+            path (str): the url path on the server
+            source (str | file | bytes | iterable): a file path, a binary
+                file object, bytes, or an iterable of bytes
+            args (dict): any arguments to pass, in the query string
+            headers (dict): any headers to pass to the request
+            content_type (str): the body's `Content-Type`, unless in `headers`
+            chunk_size (int): bytes per read, from a file
+            deadline (float): (optional) seconds for the whole call,
+                including retries (default: the client's `deadline`)
 
-        s = self.session
+        Returns:
+            dict: json dict or raw string
+        """
+        body, headers = self._upload_body(source, headers, content_type, chunk_size)
+        transport = self._get_sync_transport()
+        with self._instrument(method, path), deadline_scope(deadline if deadline is not None else self.deadline):
+            url, kwargs = self._prepare(method, path, args, headers, body=body)
+            prepared, timeout = self._prepare_request(transport, method, url, kwargs)
+            r = transport.send_sync(prepared, timeout)
+            self._record_response(r)
+            r.raise_for_status()
+            return self._decode(r.content)
+
+    @wtt.spanned(
+        these=['path', 'self.address'],
+        kind=wtt.SpanKind.CLIENT,
+    )
+    async def download(
+        self,
+        path: str,
+        dest: DownloadDest,
+        args: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        checksum: Optional[str] = None,
+        progress: Optional[ProgressCallback] = None,
+        max_buffered_chunks: int = 16,
+        deadline: Optional[float] = None,
+        segments: int = 1,
+    ) -> DownloadResult:
+        """GET a file from REST Server, and write it to `dest`.
+
+        Async request - use with coroutines.
+
+        The body is written as it arrives, so a download of any size
+        takes constant memory (see :py:mod:`rest_tools.client.download`).
+
+        With `segments`, a download to a path is split into up to that
+        many byte ranges, fetched concurrently, if a HEAD request shows
+        the server supports ranges for it. Otherwise, it is a single
+        stream. A range that fails part way is resumed, with the client's
+        retry policy.
+
+        Args:
+            path (str): the url path on the server
+            dest (str | file): a file path, or a writable binary file object
+            args (dict): any arguments to pass
+            headers (dict): any headers to pass to the request
+            checksum (str): (optional) a `hashlib` algorithm to digest the body with
+            progress (callable): (optional) called with the bytes written
+                so far, and the total (if known), after each chunk
+            max_buffered_chunks (int): number of received chunks (up to
+                64KiB each) to buffer before pausing the read
+            deadline (float): (optional) seconds for the whole call,
+                including retries (default: the client's `deadline`)
+            segments (int): max number of byte ranges to fetch at once
+
+        Returns:
+            DownloadResult: the size, checksum, and response headers
+        """
+        if segments < 1:
+            raise ValueError(f"segments must be at least 1: {segments}")
+        writer = DownloadWriter(dest, checksum, progress)
+        transport = self._get_stream_transport()
+        with self._instrument('GET', path), deadline_scope(deadline if deadline is not None else self.deadline):
+            if segments > 1 and writer.path is not None:
+                ret = await self._download_segmented(transport, path, writer, args, headers, segments, max_buffered_chunks)
+                if ret is not None:
+                    return ret
+            url, kwargs = await self._aprepare('GET', path, args, headers)
+            prepared, timeout = self._prepare_request(transport, 'GET', url, kwargs)
+            sr = await transport.send_stream(prepared, timeout, max_buffered_chunks)
+            try:
+                if sr.status_code >= 400:
+                    await sr.read()
+                    self._record_response(sr.response)
+                    sr.response.raise_for_status()
+                writer.start(sr.response.headers)
+                try:
+                    async for chunk in sr.chunks():
+                        writer.write(chunk)
+                except BaseException:
+                    writer.abort()
+                    raise
+            finally:
+                sr.close()
+            self._record_response(sr.response, writer.size)
+            return writer.finish()
+
+    @wtt.spanned(
+        these=['path', 'self.address'],
+        kind=wtt.SpanKind.CLIENT,
+    )
+    def download_seq(
+        self,
+        path: str,
+        dest: DownloadDest,
+        args: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        checksum: Optional[str] = None,
+        progress: Optional[ProgressCallback] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        deadline: Optional[float] = None,
+        segments: int = 1,
+    ) -> DownloadResult:
+        """GET a file from REST Server, and write it to `dest`.
+
+        Sequential version of `download` -- byte ranges are fetched by a
+        pool of threads.
+
+        Args:
+            path (str): the url path on the server
+            dest (str | file): a file path, or a writable binary file object
+            args (dict): any arguments to pass
+            headers (dict): any headers to pass to the request
+            checksum (str): (optional) a `hashlib` algorithm to digest the body with
+            progress (callable): (optional) called with the bytes written
+                so far, and the total (if known), after each chunk
+            chunk_size (int): bytes per read
+            deadline (float): (optional) seconds for the whole call,
+                including retries (default: the client's `deadline`)
+            segments (int): max number of byte ranges to fetch at once
+
+        Returns:
+            DownloadResult: the size, checksum, and response headers
+        """
+        if segments < 1:
+            raise ValueError(f"segments must be at least 1: {segments}")
+        writer = DownloadWriter(dest, checksum, progress)
+        transport = self._get_sync_transport()
+        with self._instrument('GET', path), deadline_scope(deadline if deadline is not None else self.deadline):
+            if segments > 1 and writer.path is not None:
+                ret = self._download_segmented_seq(transport, path, writer, args, headers, segments, chunk_size)
+                if ret is not None:
+                    return ret
+            url, kwargs = self._prepare('GET', path, args, headers)
+            prepared, timeout = self._prepare_request(transport, 'GET', url, kwargs)
+            with transport.send_sync(prepared, timeout, stream=True) as resp:
+                if resp.status_code >= 400:
+                    self._record_response(resp)
+                    resp.raise_for_status()
+                writer.start(resp.headers)
+                try:
+                    for chunk in resp.iter_content(chunk_size=chunk_size):
+                        writer.write(chunk)
+                except BaseException:
+                    writer.abort()
+                    raise
+            self._record_response(resp, writer.size)
+            return writer.finish()
+
+    def _retry_segment(
+        self,
+        retry: urllib3.util.retry.Retry,
+        prepared: requests.PreparedRequest,
+        error: Exception,
+    ) -> Tuple[urllib3.util.retry.Retry, float]:
+        """Internal method for getting the next `Retry` and backoff for a
+        range that failed part way, or raising the error if out of retries."""
         try:
-            self.open(sync=True)
-            url, kwargs = self._prepare(method, path, args, headers)
-            resp = self.session.request(method, url, stream=True, **kwargs)
-            resp.raise_for_status()
-            for line in resp.iter_lines(chunk_size=chunk_size, delimiter=b'\n'):
-                decoded = self._decode(line.strip())
-                if decoded:  # skip `None`
-                    yield decoded
+            retry = retry.increment(prepared.method, prepared.url, error=error)
+        except urllib3.exceptions.MaxRetryError:
+            raise error
+        backoff = retry.get_backoff_time()
+        self.logger.debug('resuming %s %s in %.2fs: %r', prepared.method, prepared.url, backoff, error)
+        info = current_request.get()
+        if info is not None:
+            info.retries += 1
+        return retry, backoff
+
+    async def _download_segmented(
+        self,
+        transport: Transport,
+        path: str,
+        writer: DownloadWriter,
+        args: Optional[Dict[str, Any]],
+        headers: Optional[Dict[str, str]],
+        segments: int,
+        max_buffered_chunks: int,
+    ) -> Optional[DownloadResult]:
+        """Internal method for a download in byte ranges, fetched concurrently.
+
+        Returns None if the server does not support ranges for it.
+        """
+        url, kwargs = await self._aprepare('HEAD', path, args, {**(headers or {}), 'Accept-Encoding': 'identity'})
+        prepared, timeout = self._prepare_request(transport, 'HEAD', url, kwargs)
+        probe = await transport.send(prepared, timeout)
+        ranges = plan_segments(probe.headers, segments) if probe.status_code < 300 else None
+        if ranges is None:
+            self.logger.debug('no byte ranges for %s, using a single stream', url)
+            return None
+
+        seg_writer = SegmentedWriter(writer.path, ranges[-1][1] + 1, writer.checksum, writer.progress)  # type: ignore[arg-type]
+        seg_headers = range_headers(headers, probe.headers)
+        seg_writer.start()
+        tasks = [
+            asyncio.ensure_future(self._download_segment(
+                transport, path, args, seg_headers, seg_writer, start, end, max_buffered_chunks,
+            ))
+            for start, end in ranges
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.wait(tasks)
+            seg_writer.abort()
+            raise
+        self._record_response(probe, seg_writer.size)
+        return seg_writer.finish(probe.headers)
+
+    async def _download_segment(
+        self,
+        transport: Transport,
+        path: str,
+        args: Optional[Dict[str, Any]],
+        headers: Dict[str, str],
+        writer: SegmentedWriter,
+        start: int,
+        end: int,
+        max_buffered_chunks: int,
+    ) -> None:
+        """Internal method for fetching one byte range, resuming it if it fails part way."""
+        retry: urllib3.util.retry.Retry = self.retry_policy
+        offset = start
+        while True:
+            url, kwargs = await self._aprepare('GET', path, args, {**headers, 'Range': f'bytes={offset}-{end}'})
+            prepared, timeout = self._prepare_request(transport, 'GET', url, kwargs)
+            sr = await transport.send_stream(prepared, timeout, max_buffered_chunks)
+            try:
+                if sr.status_code >= 400:
+                    await sr.read()
+                check_range(sr.response, offset)
+                async for chunk in sr.chunks():
+                    chunk = chunk[:end + 1 - offset]
+                    writer.write(offset, chunk)
+                    offset += len(chunk)
+                    if offset > end:
+                        return
+                error: Exception = requests.exceptions.ChunkedEncodingError(f'incomplete range: {offset} of {start}-{end}')
+            except _SEGMENT_ERRORS as e:
+                error = e
+            finally:
+                sr.close()
+            retry, backoff = self._retry_segment(retry, prepared, error)
+            if backoff > 0:
+                await asyncio.sleep(backoff)
+
+    def _download_segmented_seq(
+        self,
+        transport: Transport,
+        path: str,
+        writer: DownloadWriter,
+        args: Optional[Dict[str, Any]],
+        headers: Optional[Dict[str, str]],
+        segments: int,
+        chunk_size: int,
+    ) -> Optional[DownloadResult]:
+        """Internal method for a download in byte ranges, fetched by a pool of threads.
+
+        Returns None if the server does not support ranges for it.
+        """
+        url, kwargs = self._prepare('HEAD', path, args, {**(headers or {}), 'Accept-Encoding': 'identity'})
+        prepared, timeout = self._prepare_request(transport, 'HEAD', url, kwargs)
+        probe = transport.send_sync(prepared, timeout)
+        ranges = plan_segments(probe.headers, segments) if probe.status_code < 300 else None
+        if ranges is None:
+            self.logger.debug('no byte ranges for %s, using a single stream', url)
+            return None
+
+        seg_writer = SegmentedWriter(writer.path, ranges[-1][1] + 1, writer.checksum, writer.progress)  # type: ignore[arg-type]
+        seg_headers = range_headers(headers, probe.headers)
+        stop = threading.Event()
+        seg_writer.start()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                futures = [
+                    # each thread gets a copy of the context, for the deadline and metrics
+                    pool.submit(
+                        contextvars.copy_context().run, self._download_segment_seq,
+                        transport, path, args, seg_headers, seg_writer, start, end, chunk_size, stop,
+                    )
+                    for start, end in ranges
+                ]
+                try:
+                    for fut in concurrent.futures.as_completed(futures):
+                        fut.result()
+                except BaseException:
+                    stop.set()
+                    raise
+        except BaseException:
+            seg_writer.abort()
+            raise
+        self._record_response(probe, seg_writer.size)
+        return seg_writer.finish(probe.headers)
+
+    def _download_segment_seq(
+        self,
+        transport: Transport,
+        path: str,
+        args: Optional[Dict[str, Any]],
+        headers: Dict[str, str],
+        writer: SegmentedWriter,
+        start: int,
+        end: int,
+        chunk_size: int,
+        stop: threading.Event,
+    ) -> None:
+        """Internal method for fetching one byte range, resuming it if it fails part way.
+
+        Sequential version of `_download_segment`, which gives up once `stop` is set.
+        """
+        retry: urllib3.util.retry.Retry = self.retry_policy
+        offset = start
+        while not stop.is_set():
+            url, kwargs = self._prepare('GET', path, args, {**headers, 'Range': f'bytes={offset}-{end}'})
+            prepared, timeout = self._prepare_request(transport, 'GET', url, kwargs)
+            with transport.send_sync(prepared, timeout, stream=True) as resp:
+                check_range(resp, offset)
+                try:
+                    for chunk in resp.iter_content(chunk_size=chunk_size):
+                        if stop.is_set():
+                            return
+                        chunk = chunk[:end + 1 - offset]
+                        writer.write(offset, chunk)
+                        offset += len(chunk)
+                        if offset > end:
+                            return
+                    error: Exception = requests.exceptions.ChunkedEncodingError(f'incomplete range: {offset} of {start}-{end}')
+                except _SEGMENT_ERRORS as e:
+                    error = e
+            retry, backoff = self._retry_segment(retry, prepared, error)
+            if backoff > 0:
+                stop.wait(backoff)
+
+    async def _fetch_page(self, request: PageRequest, headers: Optional[Dict[str, str]]) -> Page:
+        """Internal method for fetching one page of `paginate()`."""
+        path, args = request
+        if urllib.parse.urlsplit(path).scheme:
+            # an absolute url, from a Link header
+            if not path.startswith(self.address):
+                raise ValueError(f"next page is not on {self.address}: {path}")
+            path = path[len(self.address):]
+        with self._instrument('GET', path), deadline_scope(self.deadline):
+            url, kwargs = await self._aprepare('GET', path, args, dict(headers) if headers else None)
+            prepared, timeout = self._prepare_request(self.transport, 'GET', url, kwargs)
+            r = await self.transport.send(prepared, timeout)
+            self._record_response(r)
+            r.raise_for_status()
+            return Page(request[0], args, prepared.url, self._decode(r.content), r.headers)  # type: ignore[arg-type]
+
+    async def paginate(
+        self,
+        path: str,
+        pagination: Pagination,
+        args: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        lookahead: int = 1,
+    ) -> AsyncGenerator[JSONType, None]:
+        """GET each page of a collection, and stream the items back.
+
+        Use with `async for`. While the caller works on the items of one
+        page, up to `lookahead` of the next pages are prefetched. With
+        offset pagination those are fetched concurrently (and a few pages
+        past the end may be fetched and dropped); with cursors and links,
+        each page needs the one before it.
+
+        Args:
+            path (str): the url path of the collection
+            pagination (Pagination): the pagination strategy
+                (see :py:mod:`rest_tools.client.pagination`)
+            args (dict): any arguments to pass for the first page
+            headers (dict): any headers to pass to each request
+            lookahead (int): number of pages to prefetch (0 to only fetch
+                a page when it is needed)
+
+        Returns:
+            async generator of items
+        """
+        if lookahead < 0:
+            raise ValueError(f"lookahead must be at least 0: {lookahead}")
+        slots = asyncio.Semaphore(lookahead + 1)
+        pages: 'asyncio.Queue[Optional[Tuple[Optional[PageRequest], asyncio.Future]]]' = asyncio.Queue()
+
+        async def produce() -> None:
+            try:
+                request: Optional[PageRequest] = pagination.first(path, args or {})
+                while request is not None:
+                    await slots.acquire()
+                    fut = asyncio.ensure_future(self._fetch_page(request, headers))
+                    pages.put_nowait((request, fut))
+                    next_request = pagination.predict(request)
+                    if next_request is None:
+                        await asyncio.wait({fut})
+                        if fut.cancelled() or fut.exception() is not None:
+                            return  # the caller gets the error from the page
+                        next_request = pagination.next(request, fut.result())
+                    request = next_request
+            except Exception as e:
+                failed = asyncio.get_running_loop().create_future()
+                failed.set_exception(e)
+                pages.put_nowait((None, failed))
+            else:
+                pages.put_nowait(None)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                entry = await pages.get()
+                if entry is None:
+                    return
+                request, fut = entry
+                page = await fut
+                last = pagination.next(request, page) is None  # type: ignore[arg-type]
+                for item in pagination.items(page):
+                    yield item
+                if last:
+                    return
+                slots.release()
         finally:
-            self.session = s
+            producer.cancel()
+            while not pages.empty():
+                entry = pages.get_nowait()
+                if entry is not None and not entry[1].cancel() and not entry[1].cancelled():
+                    entry[1].exception()  # retrieve it, so it is not logged
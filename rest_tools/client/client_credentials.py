@@ -18,8 +18,11 @@ class ClientCredentialsAuth(RestClient):
         client_secret (str): client secret
         timeout (int): request timeout (optional)
         retries (int): number of retries to attempt (optional)
+        token_renewal (float): renew the token in the background after this fraction of its lifetime (optional)
     """
 
+    _defer_token_renewal = True
+
     def __init__(
         self,
         address: str,
@@ -37,6 +40,7 @@ class ClientCredentialsAuth(RestClient):
             logger=kwargs.pop('logger', logging.getLogger('ClientCredentialsAuth')),
             **kwargs,
         )
+        self._start_token_renewal()
 
     def make_access_token(self) -> str:
         if not self.auth.token_url:
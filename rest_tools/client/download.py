@@ -0,0 +1,274 @@
+"""Streamed response-body downloads, for `RestClient.download()`.
+
+A :py:class:`DownloadWriter` writes the body to a file (or any writable
+binary buffer) as it arrives, so a download of any size takes constant
+memory. A checksum can be computed on the way, and a progress callback
+is called after each chunk.
+
+A download to a path is written to a `.part` file next to it, which
+replaces the path once the download is complete, so a failed download
+never leaves a truncated file behind.
+
+A download to a path can also be split into byte ranges (segments),
+fetched concurrently, when the server advertises `Accept-Ranges: bytes`
+for it. A :py:class:`SegmentedWriter` preallocates the file, and writes
+each range at its offset as it arrives. A segment that fails part way
+is resumed from where it stopped, and the other segments carry on.
+"""
+
+# fmt:off
+
+import dataclasses as dc
+import functools
+import hashlib
+import os
+import threading
+from typing import IO, Callable, Dict, List, Mapping, Optional, Tuple, Union
+
+import requests
+
+DownloadDest = Union[str, 'os.PathLike[str]', IO[bytes]]
+#: called with the bytes written so far, and the total (if known)
+ProgressCallback = Callable[[int, Optional[int]], None]
+#: the smallest segment worth its own request
+MIN_SEGMENT_SIZE = 1024 * 1024
+
+
+@dc.dataclass
+class DownloadResult:
+    """The outcome of a download.
+
+    `checksum` is the hex digest of the body, if a checksum was requested.
+    """
+
+    size: int
+    checksum: Optional[str]
+    headers: Mapping[str, str]
+
+
+def content_length(headers: Mapping[str, str]) -> Optional[int]:
+    """Get the size of the (decoded) body from the headers, if known."""
+    if headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    try:
+        return int(headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+class DownloadWriter:
+    """Write a response body to a destination, as it arrives.
+
+    Args:
+        dest (str | file): a file path, or a writable binary file object
+        checksum (str): (optional) a `hashlib` algorithm to digest the body with
+        progress (callable): (optional) called with the bytes written so
+            far, and the total (if known), after each chunk
+    """
+
+    def __init__(
+        self,
+        dest: DownloadDest,
+        checksum: Optional[str] = None,
+        progress: Optional[ProgressCallback] = None,
+    ) -> None:
+        self.path: Optional[str] = None
+        self._file: Optional[IO[bytes]] = None
+        if isinstance(dest, (str, os.PathLike)):
+            self.path = os.fspath(dest)
+        else:
+            self._file = dest
+        # raises ValueError for an unknown algorithm, before any request
+        self.checksum = checksum
+        self._hash = hashlib.new(checksum) if checksum else None
+        self.progress = progress
+        self.size = 0
+        self.total: Optional[int] = None
+        self.headers: Mapping[str, str] = {}
+
+    @property
+    def part_path(self) -> str:
+        """The path the body is written to, until it is complete."""
+        assert self.path is not None
+        return self.path + '.part'
+
+    def start(self, headers: Mapping[str, str]) -> None:
+        """Start writing the body of a response."""
+        self.headers = headers
+        self.total = content_length(headers)
+        if self.path is not None:
+            self._file = open(self.part_path, 'wb')
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)  # type: ignore[union-attr]
+        if self._hash is not None:
+            self._hash.update(chunk)
+        self.size += len(chunk)
+        if self.progress is not None:
+            self.progress(self.size, self.total)
+
+    def finish(self) -> DownloadResult:
+        """Complete the download, once the whole body is written."""
+        if self.total is not None and self.size != self.total:
+            self.abort()
+            raise requests.exceptions.ChunkedEncodingError(f'incomplete download: {self.size} of {self.total} bytes')
+        if self.path is not None:
+            self._file.close()  # type: ignore[union-attr]
+            os.replace(self.part_path, self.path)
+        return DownloadResult(
+            size=self.size,
+            checksum=self._hash.hexdigest() if self._hash is not None else None,
+            headers=self.headers,
+        )
+
+    def abort(self) -> None:
+        """Stop a failed download, removing the partial file (if any)."""
+        if self.path is not None and self._file is not None:
+            self._file.close()
+            try:
+                os.remove(self.part_path)
+            except FileNotFoundError:
+                pass
+
+
+def plan_segments(headers: Mapping[str, str], segments: int) -> Optional[List[Tuple[int, int]]]:
+    """Split a body into byte ranges, from the headers of a HEAD request.
+
+    Args:
+        headers (mapping): the response headers
+        segments (int): max number of ranges
+
+    Returns:
+        list: `(start, end)` of each range (the end is inclusive), or None
+        if ranges are not supported, or not worth it
+    """
+    if headers.get('Accept-Ranges', '').lower() != 'bytes':
+        return None
+    size = content_length(headers)
+    if size is None:
+        return None
+    num = min(segments, size // MIN_SEGMENT_SIZE)
+    if num < 2:
+        return None
+    step = -(-size // num)
+    return [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+
+def range_headers(headers: Optional[Mapping[str, str]], probe_headers: Mapping[str, str]) -> Dict[str, str]:
+    """Get the request headers for the ranges of a segmented download.
+
+    Ranges are of the raw body, so it must not be compressed. `If-Range`
+    makes the server send the whole body (which is an error) instead of
+    a range, if the body changed since the HEAD request.
+    """
+    ret = dict(headers) if headers else {}
+    ret['Accept-Encoding'] = 'identity'
+    validator = probe_headers.get('ETag', '')
+    if not validator or validator.startswith('W/'):  # weak etags cannot be used for ranges
+        validator = probe_headers.get('Last-Modified', '')
+    if validator:
+        ret['If-Range'] = validator
+    return ret
+
+
+def check_range(r: requests.Response, start: int) -> None:
+    """Check that a response is the byte range from `start`."""
+    r.raise_for_status()
+    if r.status_code != 206 or not r.headers.get('Content-Range', '').startswith(f'bytes {start}-'):
+        raise requests.exceptions.HTTPError(
+            f'expected a byte range from {start}, got status {r.status_code} '
+            f'(the file may have changed): {r.url}',
+            response=r,
+        )
+
+
+class SegmentedWriter:
+    """Write the byte ranges of a body to a file, in any order.
+
+    The file is preallocated to the full size, and each range is written
+    at its offset. Ranges can be written from several threads at once.
+
+    Args:
+        path (str): the file path
+        size (int): the size of the body
+        checksum (str): (optional) a `hashlib` algorithm to digest the body
+            with, once it is complete
+        progress (callable): (optional) called with the bytes written so
+            far, and the total, after each chunk
+    """
+
+    def __init__(
+        self,
+        path: Union[str, 'os.PathLike[str]'],
+        size: int,
+        checksum: Optional[str] = None,
+        progress: Optional[ProgressCallback] = None,
+    ) -> None:
+        self.path = os.fspath(path)
+        self.size = size
+        self.checksum = checksum
+        if checksum:
+            hashlib.new(checksum)  # raises ValueError for an unknown algorithm
+        self.progress = progress
+        self.written = 0
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+
+    @property
+    def part_path(self) -> str:
+        """The path the body is written to, until it is complete."""
+        return self.path + '.part'
+
+    def start(self) -> None:
+        """Create and preallocate the file."""
+        self._fd = os.open(self.part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            # reserve the space, so a full disk fails now rather than part way
+            os.posix_fallocate(self._fd, 0, self.size)
+        except (AttributeError, OSError):
+            os.ftruncate(self._fd, self.size)
+
+    def write(self, offset: int, chunk: bytes) -> None:
+        """Write a chunk of a range, at its offset in the body."""
+        assert self._fd is not None
+        if offset + len(chunk) > self.size:
+            raise requests.exceptions.ChunkedEncodingError(f'range past the end of the body: {offset + len(chunk)} > {self.size}')
+        view = memoryview(chunk)
+        while view:
+            if hasattr(os, 'pwrite'):
+                n = os.pwrite(self._fd, view, offset)
+            else:
+                with self._lock:
+                    os.lseek(self._fd, offset, os.SEEK_SET)
+                    n = os.write(self._fd, view)
+            view = view[n:]
+            offset += n
+        with self._lock:
+            self.written += len(chunk)
+            if self.progress is not None:
+                self.progress(self.written, self.size)
+
+    def finish(self, headers: Mapping[str, str]) -> DownloadResult:
+        """Complete the download, once every range is written."""
+        assert self._fd is not None
+        os.close(self._fd)
+        self._fd = None
+        digest = None
+        if self.checksum:
+            h = hashlib.new(self.checksum)
+            with open(self.part_path, 'rb') as f:
+                for chunk in iter(functools.partial(f.read, MIN_SEGMENT_SIZE), b''):
+                    h.update(chunk)
+            digest = h.hexdigest()
+        os.replace(self.part_path, self.path)
+        return DownloadResult(size=self.size, checksum=digest, headers=headers)
+
+    def abort(self) -> None:
+        """Stop a failed download, removing the partial file."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            try:
+                os.remove(self.part_path)
+            except FileNotFoundError:
+                pass
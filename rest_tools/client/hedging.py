@@ -0,0 +1,189 @@
+"""Hedged requests for `RestClient`.
+
+Against replicated backends, tail latency is often just one slow
+replica. A hedged request sends a duplicate once the first attempt has
+taken longer than most requests to the same route (a latency
+percentile), takes whichever response arrives first, and cancels the
+other. A budget keeps the duplicates to a fraction of all requests, so
+hedging cannot double the load on a struggling backend.
+
+Only idempotent methods (GET, HEAD) are hedged.
+"""
+
+# fmt:off
+
+import asyncio
+import collections
+import logging
+import math
+import threading
+import time
+from typing import Collection, Deque, Dict, Optional
+
+import requests
+
+from .transport import Transport, TransportWrapper, _route
+
+LOGGER = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Track recent latencies per route, and get their percentiles.
+
+    Args:
+        window (int): number of recent latencies to keep per route
+        max_routes (int): max number of routes to track
+    """
+
+    def __init__(self, window: int = 1000, max_routes: int = 256) -> None:
+        self.window = window
+        self.max_routes = max_routes
+        self._lock = threading.Lock()
+        self._latencies: 'collections.OrderedDict[str, Deque[float]]' = collections.OrderedDict()
+
+    def add(self, route: str, latency: float) -> None:
+        with self._lock:
+            latencies = self._latencies.get(route)
+            if latencies is None:
+                latencies = self._latencies[route] = collections.deque(maxlen=self.window)
+                if len(self._latencies) > self.max_routes:
+                    self._latencies.popitem(last=False)
+            latencies.append(latency)
+
+    def percentile(self, route: str, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """Get a latency percentile (0-100) for a route, or None without enough samples."""
+        with self._lock:
+            latencies = self._latencies.get(route)
+            if latencies is None or len(latencies) < min_samples:
+                return None
+            values = sorted(latencies)
+        index = min(len(values) - 1, max(0, math.ceil(percentile / 100.0 * len(values)) - 1))
+        return values[index]
+
+
+class HedgingTransport(TransportWrapper):
+    """Hedge slow GET/HEAD attempts with a duplicate.
+
+    Wrap this inside a :py:class:`rest_tools.client.RetryTransport`, so
+    each attempt is hedged. Only async requests are hedged. With the
+    `requests` backend, a cancelled loser runs to the end in its thread,
+    and holds its concurrency limit slot until then.
+
+    The budget is a token bucket: each request adds `budget_ratio`
+    tokens (up to `budget_burst`), and each hedge spends one, so at most
+    about `budget_ratio` of requests are duplicated.
+
+    Args:
+        transport (Transport): the transport to wrap
+        percentile (float): hedge after this latency percentile of the route (0-100)
+        min_delay (float): never hedge sooner than this (seconds)
+        min_samples (int): number of latencies of a route to see before hedging it
+        budget_ratio (float): max fraction of requests to hedge
+        budget_burst (float): max number of hedges saved up in the budget
+        methods (collection): the http methods to hedge
+    """
+
+    def __init__(
+        self,
+        transport: Transport,
+        percentile: float = 95.0,
+        min_delay: float = 0.005,
+        min_samples: int = 20,
+        budget_ratio: float = 0.1,
+        budget_burst: float = 10.0,
+        methods: Collection[str] = ('GET', 'HEAD'),
+    ) -> None:
+        super().__init__(transport)
+        if not 0.0 < percentile <= 100.0:
+            raise ValueError(f"percentile must be between 0 and 100: {percentile}")
+        if not 0.0 <= budget_ratio <= 1.0:
+            raise ValueError(f"budget_ratio must be between 0 and 1: {budget_ratio}")
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self.methods = methods
+        self.latencies = LatencyTracker()
+
+        self._lock = threading.Lock()
+        self._tokens = budget_burst
+
+        # counters
+        self.requests = 0
+        self.hedges = 0
+        self.hedges_won = 0
+        self.budget_exhausted = 0
+
+    def _spend_token(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                self.budget_exhausted += 1
+                return False
+            self._tokens -= 1.0
+            self.hedges += 1
+            return True
+
+    async def _timed_send(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float],
+        route: str,
+    ) -> requests.Response:
+        start = time.monotonic()
+        try:
+            r = await self.transport.send(prepared, timeout)
+        except asyncio.CancelledError:
+            # the loser of a hedge took at least this long, so keep it in the stats
+            self.latencies.add(route, time.monotonic() - start)
+            raise
+        self.latencies.add(route, time.monotonic() - start)
+        return r
+
+    async def send(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        if prepared.method not in self.methods:
+            return await self.transport.send(prepared, timeout)
+
+        route = _route(prepared)
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.budget_burst, self._tokens + self.budget_ratio)
+        delay = self.latencies.percentile(route, self.percentile, self.min_samples)
+
+        primary = asyncio.ensure_future(self._timed_send(prepared, timeout, route))
+        if delay is None:
+            return await primary
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=max(delay, self.min_delay))
+            if not done and self._spend_token():
+                LOGGER.debug('hedging %s %s after %.3fs', prepared.method, prepared.url, delay)
+                hedge = asyncio.ensure_future(self._timed_send(prepared.copy(), timeout, route))
+                tasks.add(hedge)
+            # the first response wins; an error only wins if it is the last one left
+            while True:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in done if not task.cancelled() and task.exception() is None]
+                if winners or not tasks:
+                    winner = winners[0] if winners else done.pop()
+                    if winner is not primary:
+                        with self._lock:
+                            self.hedges_won += 1
+                    return winner.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def as_dict(self) -> Dict[str, float]:
+        """Get a snapshot of the counters."""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedges_won': self.hedges_won,
+                'budget_exhausted': self.budget_exhausted,
+            }
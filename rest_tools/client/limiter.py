@@ -0,0 +1,319 @@
+"""Adaptive client-side concurrency limiting for `RestClient`.
+
+A `RestHandler` answers `503` (with `Retry-After`) when a route is
+overloaded. Retrying each request on its own keeps the pressure on, so
+instead each target gets an AIMD limit on the number of attempts in
+flight (like TCP congestion control):
+
+* every successful attempt raises the limit by `1/limit` (so about +1
+  per round-trip of a full window)
+* an overload signal -- a `503`/`429` status, a read timeout, or a
+  latency more than `latency_tolerance` times the best recent latency
+  of the same route -- multiplies the limit by `decrease_factor`
+
+Only one decrease happens per round-trip: signals from attempts that
+started before the last decrease are ignored, so a burst of `503`s from
+one window does not collapse the limit to the minimum.
+"""
+
+# fmt:off
+
+import asyncio
+import collections
+import logging
+import threading
+import time
+from typing import Any, Collection, Deque, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from .transport import StreamResponse, Transport, TransportWrapper, _CancelledInThread, _route
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AdaptiveLimiter:
+    """An AIMD limit on the number of attempts in flight to one target.
+
+    Can be used from threads and event loops at the same time.
+
+    Args:
+        initial_limit (int): the starting limit
+        min_limit (int): the lowest limit
+        max_limit (int): the highest limit
+        decrease_factor (float): multiply the limit by this on an overload signal
+        latency_tolerance (float): latencies above this multiple of the
+            best recent latency are an overload signal (0 to disable)
+        latency_window (int): number of recent latencies (per route) to
+            find the best one in
+    """
+
+    #: max number of routes to track latencies for
+    MAX_ROUTES = 256
+
+    def __init__(
+        self,
+        initial_limit: int = 20,
+        min_limit: int = 1,
+        max_limit: int = 200,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        latency_window: int = 100,
+    ) -> None:
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError(f"limits must be 1 <= min_limit <= initial_limit <= max_limit: {min_limit}, {initial_limit}, {max_limit}")
+        if not 0.0 < decrease_factor < 1.0:
+            raise ValueError(f"decrease_factor must be between 0 and 1: {decrease_factor}")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self.latency_window = latency_window
+        self._latencies: 'collections.OrderedDict[str, Deque[float]]' = collections.OrderedDict()
+        self._last_decrease = 0.0
+        # async waiters: (loop, future)
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = collections.deque()
+
+        # counters
+        self.waits = 0
+        self.increases = 0
+        self.decreases = 0
+        self.max_in_flight = 0
+
+    @property
+    def limit(self) -> int:
+        """The current limit."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _try_acquire(self) -> Optional[float]:
+        """Take a slot, if there is one. Call with the lock held."""
+        if self._in_flight >= int(self._limit):
+            return None
+        self._in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        return time.monotonic()
+
+    def acquire(self) -> float:
+        """Wait for a slot, blocking.
+
+        Returns:
+            float: the start time, to pass on to `release()`
+        """
+        with self._cond:
+            start = self._try_acquire()
+            if start is None:
+                self.waits += 1
+                while start is None:
+                    self._cond.wait()
+                    start = self._try_acquire()
+            return start
+
+    async def acquire_async(self) -> float:
+        """Wait for a slot, without blocking the event loop.
+
+        Returns:
+            float: the start time, to pass on to `release()`
+        """
+        loop = asyncio.get_running_loop()
+        waited = False
+        while True:
+            with self._lock:
+                start = self._try_acquire()
+                if start is not None:
+                    return start
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                fut = loop.create_future()
+                self._waiters.append((loop, fut))
+            try:
+                await fut
+            except asyncio.CancelledError:
+                with self._lock:
+                    try:
+                        self._waiters.remove((loop, fut))
+                    except ValueError:
+                        # already woken, so pass the wakeup on
+                        self._wake()
+                raise
+
+    def _wake(self) -> None:
+        """Wake up waiters for the free slots. Call with the lock held."""
+        free = int(self._limit) - self._in_flight
+        if free <= 0:
+            return
+        self._cond.notify(free)
+        while free > 0 and self._waiters:
+            loop, fut = self._waiters.popleft()
+            loop.call_soon_threadsafe(_set_result, fut)
+            free -= 1
+
+    def _is_slow(self, route: str, latency: float) -> bool:
+        """Record a latency, and check it against the route's best. Call with the lock held."""
+        latencies = self._latencies.get(route)
+        if latencies is None:
+            latencies = self._latencies[route] = collections.deque(maxlen=self.latency_window)
+            if len(self._latencies) > self.MAX_ROUTES:
+                self._latencies.popitem(last=False)
+        else:
+            self._latencies.move_to_end(route)
+        slow = bool(self.latency_tolerance and latencies and latency > self.latency_tolerance * min(latencies))
+        latencies.append(latency)
+        return slow
+
+    def release(self, start: float, overloaded: Optional[bool] = None, route: str = '') -> None:
+        """Give back a slot, with the outcome of the attempt.
+
+        Args:
+            start (float): the start time, from `acquire()`
+            overloaded (bool): whether the server signalled overload
+                (None if the attempt failed for another reason)
+            route (str): the route, to compare latencies of like requests
+        """
+        latency = time.monotonic() - start
+        with self._lock:
+            self._in_flight -= 1
+            if overloaded is not None:
+                if not overloaded and self._is_slow(route, latency):
+                    overloaded = True
+                if overloaded:
+                    # one decrease per round-trip
+                    if start >= self._last_decrease:
+                        self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+                        self._last_decrease = time.monotonic()
+                        self.decreases += 1
+                        LOGGER.info('concurrency limit decreased to %d', self.limit)
+                elif self._limit < self.max_limit:
+                    self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+                    self.increases += 1
+            self._wake()
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Get a snapshot of the limit and counters."""
+        with self._lock:
+            return {
+                'limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                'waits': self.waits,
+                'increases': self.increases,
+                'decreases': self.decreases,
+            }
+
+
+def _set_result(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+class ConcurrencyLimitTransport(TransportWrapper):
+    """Limit the attempts in flight to each target host, adaptively.
+
+    Wrap this inside a :py:class:`rest_tools.client.RetryTransport`, so
+    each attempt takes a slot, and no slot is held during a backoff.
+    A streamed response holds its slot until the headers arrive.
+
+    Args:
+        transport (Transport): the transport to wrap
+        overload_statuses (collection): statuses that signal overload
+        limiters (dict): (optional) the limiters by host, to share them
+            with other transports
+        **kwargs: settings for new limiters (see :py:class:`AdaptiveLimiter`)
+    """
+
+    def __init__(
+        self,
+        transport: Transport,
+        overload_statuses: Collection[int] = (429, 503),
+        limiters: Optional[Dict[str, AdaptiveLimiter]] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(transport)
+        self.overload_statuses = overload_statuses
+        self.limiters = limiters if limiters is not None else {}
+        self.limiter_kwargs = kwargs
+        self._limiters_lock = threading.Lock()
+
+    def get_limiter(self, url: str) -> AdaptiveLimiter:
+        """Get the limiter for the host of `url`."""
+        host = urlsplit(url).netloc
+        with self._limiters_lock:
+            limiter = self.limiters.get(host)
+            if limiter is None:
+                limiter = self.limiters[host] = AdaptiveLimiter(**self.limiter_kwargs)
+            return limiter
+
+    async def send(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        limiter = self.get_limiter(prepared.url)  # type: ignore[arg-type]
+        start = await limiter.acquire_async()
+        overloaded = None
+        running = False
+        try:
+            r = await self.transport.send(prepared, timeout)
+            overloaded = r.status_code in self.overload_statuses
+            return r
+        except ReadTimeoutError:
+            overloaded = True
+            raise
+        except _CancelledInThread as e:
+            # the attempt still has a connection, so keep its slot until the thread is done
+            running = True
+            route = _route(prepared)
+            e.future.add_done_callback(lambda _: limiter.release(start, None, route))
+            raise
+        finally:
+            if not running:
+                limiter.release(start, overloaded, _route(prepared))
+
+    def send_sync(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        limiter = self.get_limiter(prepared.url)  # type: ignore[arg-type]
+        start = limiter.acquire()
+        overloaded = None
+        try:
+            r = self.transport.send_sync(prepared, timeout, stream)
+            overloaded = r.status_code in self.overload_statuses
+            return r
+        except ReadTimeoutError:
+            overloaded = True
+            raise
+        finally:
+            limiter.release(start, overloaded, _route(prepared))
+
+    async def send_stream(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        max_buffered_chunks: int = 16,
+    ) -> StreamResponse:
+        limiter = self.get_limiter(prepared.url)  # type: ignore[arg-type]
+        start = await limiter.acquire_async()
+        overloaded = None
+        try:
+            sr = await self.transport.send_stream(prepared, timeout, max_buffered_chunks)
+            overloaded = sr.status_code in self.overload_statuses
+            return sr
+        except ReadTimeoutError:
+            overloaded = True
+            raise
+        finally:
+            limiter.release(start, overloaded, _route(prepared))
@@ -0,0 +1,310 @@
+"""An in-process transport, which dispatches requests straight into a
+`tornado`_ application.
+
+.. _tornado: https://www.tornadoweb.org
+
+Requests go through the application's router and handlers exactly as
+they would from a real server (headers, auth, logging, route stats),
+but without a socket or the HTTP/1.1 wire format. This is useful for
+fast integration tests, and for benchmarking handler cost in isolation.
+"""
+
+# fmt:off
+
+import asyncio
+import io
+import time
+from typing import Any, AsyncGenerator, Awaitable, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+import tornado.httpclient
+import tornado.httputil
+import tornado.iostream
+import tornado.web
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+from ..utils.compression import Decompressor
+from .tornado_session import _to_requests_response
+from .transport import StreamResponse, Transport, _request_url
+from .upload import UploadBody
+
+
+class _LoopbackContext:
+    """The connection details a handler can see (`request.remote_ip`, etc)."""
+
+    def __init__(self, protocol: str, remote_ip: str) -> None:
+        self.protocol = protocol
+        self.remote_ip = remote_ip
+        self.address = (remote_ip, 0)
+
+
+class _LoopbackConnection(tornado.httputil.HTTPConnection):
+    """Collect a handler's response, in place of an HTTP/1.1 connection.
+
+    With a `queue`, body chunks are handed to it as they are written,
+    and a full queue makes the handler's `flush()` wait.
+    """
+
+    def __init__(self, context: _LoopbackContext, queue: Optional[asyncio.Queue] = None) -> None:
+        loop = asyncio.get_running_loop()
+        self.context = context
+        self.start_line: Optional[tornado.httputil.ResponseStartLine] = None
+        self.headers: Optional[tornado.httputil.HTTPHeaders] = None
+        self.started: asyncio.Future = loop.create_future()
+        self.finished: asyncio.Future = loop.create_future()
+        self.chunks: List[bytes] = []
+        self._queue = queue
+        self._queue_tail: Optional[asyncio.Future] = None
+        self._closed = False
+        self._close_callback: Any = None
+
+    def set_close_callback(self, callback: Any) -> None:
+        self._close_callback = callback
+
+    def write_headers(  # type: ignore[override]
+        self,
+        start_line: tornado.httputil.ResponseStartLine,
+        headers: tornado.httputil.HTTPHeaders,
+        chunk: Optional[bytes] = None,
+    ) -> 'asyncio.Future[None]':
+        self.start_line = start_line
+        self.headers = headers
+        if not self.started.done():
+            self.started.set_result(None)
+        return self.write(chunk or b'')
+
+    def write(self, chunk: bytes) -> 'asyncio.Future[None]':  # type: ignore[override]
+        if self._closed:
+            fut = asyncio.get_running_loop().create_future()
+            fut.set_exception(tornado.iostream.StreamClosedError())
+            return fut
+        if chunk and self._queue is not None:
+            return self._enqueue(chunk)
+        if chunk:
+            self.chunks.append(chunk)
+        fut = asyncio.get_running_loop().create_future()
+        fut.set_result(None)
+        return fut
+
+    def _enqueue(self, chunk: Optional[bytes]) -> 'asyncio.Future[None]':
+        """Put a chunk in the queue, after any chunks still waiting for room."""
+        async def put(prev: Optional[asyncio.Future]) -> None:
+            if prev is not None:
+                await asyncio.shield(prev)
+            if not self._closed:
+                await self._queue.put(chunk)  # type: ignore[union-attr]
+        self._queue_tail = asyncio.ensure_future(put(self._queue_tail))
+        return self._queue_tail
+
+    def finish(self) -> None:
+        if self._queue is not None and not self._closed:
+            self._enqueue(None)
+        if not self.started.done():
+            self.started.set_exception(ProtocolError('no response received'))
+        if not self.finished.done():
+            self.finished.set_result(None)
+
+    def close(self) -> None:
+        """The client went away: tell the handler, and drop any buffered body."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._queue is not None:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+        callback, self._close_callback = self._close_callback, None
+        if callback is not None:
+            callback()
+
+
+async def _maybe_await(ret: Optional[Awaitable[None]]) -> None:
+    if ret is not None:
+        await ret
+
+
+class LoopbackTransport(Transport):
+    """A transport that runs requests in-process, against a tornado application.
+
+    The host part of request urls is ignored, so a client can use any
+    base address (e.g. `http://loopback`).
+
+    Async requests run on the current event loop. Sync requests run on
+    the event loop of the last async request, if it is running in
+    another thread, or else on a new event loop per request.
+
+    Args:
+        app (Application or RestServer): the application, or a
+            :py:class:`rest_tools.server.RestServer` to make one from
+        remote_ip (str): the client address the handlers see
+    """
+
+    supports_sync = True
+    supports_stream = True
+
+    def __init__(self, app: Any, remote_ip: str = '127.0.0.1') -> None:
+        super().__init__()
+        if not isinstance(app, tornado.web.Application):
+            app = app.make_app()
+        self.app: tornado.web.Application = app
+        self.remote_ip = remote_ip
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _dispatch(
+        self,
+        prepared: requests.PreparedRequest,
+        connection: _LoopbackConnection,
+    ) -> None:
+        """Hand the request to the application, as a server connection would."""
+        url = urlsplit(_request_url(prepared))
+        path = (url.path or '/') + (f'?{url.query}' if url.query else '')
+        headers = tornado.httputil.HTTPHeaders()
+        for k, v in prepared.headers.items():
+            headers.add(k, v)
+        if 'Host' not in headers:
+            headers['Host'] = url.netloc
+        body = prepared.body
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if body and not isinstance(body, UploadBody):
+            headers['Content-Length'] = str(len(body))
+
+        start_line = tornado.httputil.RequestStartLine(prepared.method, path, 'HTTP/1.1')  # type: ignore[arg-type]
+        delegate = self.app.start_request(self, connection)
+        await _maybe_await(delegate.headers_received(start_line, headers))
+        if isinstance(body, UploadBody):
+            # a streamed body arrives in chunks, as from a socket
+            for chunk in body:
+                await _maybe_await(delegate.data_received(chunk))
+        elif body:
+            await _maybe_await(delegate.data_received(body))
+        delegate.finish()
+
+    def _to_response(
+        self,
+        prepared: requests.PreparedRequest,
+        connection: _LoopbackConnection,
+        start_time: float,
+        body: bytes = b'',
+    ) -> requests.Response:
+        assert connection.start_line is not None and connection.headers is not None
+        url = _request_url(prepared)
+        resp = tornado.httpclient.HTTPResponse(
+            tornado.httpclient.HTTPRequest(url, prepared.method),  # type: ignore[arg-type]
+            connection.start_line.code,
+            reason=connection.start_line.reason,
+            headers=connection.headers,
+            buffer=io.BytesIO(body),
+            effective_url=url,
+            request_time=time.monotonic() - start_time,
+        )
+        return _to_requests_response(resp, prepared)
+
+    async def send(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        """Run a single attempt of a prepared request through the application."""
+        self._loop = asyncio.get_running_loop()
+        start_time = time.monotonic()
+        url = _request_url(prepared)
+        connection = _LoopbackConnection(_LoopbackContext(urlsplit(url).scheme, self.remote_ip))
+        try:
+            await asyncio.wait_for(self._run(prepared, connection), timeout)
+        except asyncio.TimeoutError:
+            connection.close()
+            raise ReadTimeoutError(None, url, f'Read timed out. (read timeout={timeout})')  # type: ignore[arg-type]
+        except BaseException:
+            connection.close()
+            raise
+        r = self._to_response(prepared, connection, start_time, b''.join(connection.chunks))
+        r._content_consumed = True  # type: ignore[attr-defined]
+        return r
+
+    async def _run(self, prepared: requests.PreparedRequest, connection: _LoopbackConnection) -> None:
+        await self._dispatch(prepared, connection)
+        await connection.finished
+
+    def send_sync(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        """Run a single attempt of a prepared request, blocking.
+
+        The body is always read up front, even with `stream=True`.
+        """
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            try:
+                running: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                raise RuntimeError('cannot make a sync loopback request from the event loop that runs the application')
+            return asyncio.run_coroutine_threadsafe(self.send(prepared, timeout), loop).result()
+        return asyncio.run(self.send(prepared, timeout))
+
+    async def send_stream(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        max_buffered_chunks: int = 16,
+    ) -> StreamResponse:
+        """Run a single attempt of a prepared request, and stream the body.
+
+        At most `max_buffered_chunks` writes are buffered before the
+        handler's `flush()` waits on the consumer.
+        """
+        if max_buffered_chunks < 1:
+            raise ValueError(f"max_buffered_chunks must be at least 1: {max_buffered_chunks}")
+        self._loop = asyncio.get_running_loop()
+        start_time = time.monotonic()
+        queue: asyncio.Queue = asyncio.Queue(max_buffered_chunks)
+        url = _request_url(prepared)
+        connection = _LoopbackConnection(_LoopbackContext(urlsplit(url).scheme, self.remote_ip), queue)
+        task = asyncio.ensure_future(self._dispatch(prepared, connection))
+
+        def dispatched(t: asyncio.Future) -> None:
+            if not t.cancelled() and t.exception() is not None and not connection.started.done():
+                connection.started.set_exception(t.exception())  # type: ignore[arg-type]
+        task.add_done_callback(dispatched)
+
+        def close() -> None:
+            connection.close()
+            task.cancel()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(connection.started), timeout)
+        except asyncio.TimeoutError:
+            close()
+            raise ReadTimeoutError(None, url, f'Read timed out. (read timeout={timeout})')  # type: ignore[arg-type]
+        except BaseException:
+            close()
+            raise
+        r = self._to_response(prepared, connection, start_time)
+
+        async def chunks() -> AsyncGenerator[bytes, None]:
+            try:
+                decoder = Decompressor(r.headers.get('Content-Encoding', ''))
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        raise requests.exceptions.ReadTimeout('Timeout while streaming the response body', request=prepared)
+                    if chunk is None:
+                        break
+                    chunk = decoder.decompress(chunk)
+                    if chunk:
+                        yield chunk
+                chunk = decoder.flush()
+                if chunk:
+                    yield chunk
+            except ValueError as e:
+                raise requests.exceptions.ContentDecodingError(e, request=prepared) from e
+            finally:
+                close()
+
+        return StreamResponse(r, chunks(), close)
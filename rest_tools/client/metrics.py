@@ -0,0 +1,189 @@
+"""Client-side request instrumentation for `RestClient`.
+
+Each request made with `request()` / `request_seq()` produces a
+:py:class:`RequestInfo`, which is passed to the `on_request_start` and
+`on_request_end` hooks, and can be aggregated in memory by a
+:py:class:`ClientMetrics` into per-route histograms (latency, retries,
+response size) and status counts. Nothing here needs OpenTelemetry.
+
+Routes are `(method, path template)`: path segments that look like ids
+(numbers, uuids, long hex strings) are replaced by `{id}`, so
+`/datasets/1234` and `/datasets/5678` are one route.
+"""
+
+# fmt:off
+
+import bisect
+import contextvars
+import dataclasses as dc
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+#: the request being made, for the layers below the client to annotate (e.g. with retries)
+current_request: 'contextvars.ContextVar[Optional[RequestInfo]]' = contextvars.ContextVar('current_request', default=None)
+
+_ID_SEGMENT = re.compile(r'^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|[0-9a-fA-F]{16,})$')
+
+
+def path_template(path: str) -> str:
+    """Get the template of a url path, replacing id-like segments with `{id}`."""
+    path = path.split('?', 1)[0]
+    if not path.startswith('/'):
+        path = '/' + path
+    return '/'.join('{id}' if _ID_SEGMENT.match(s) else s for s in path.split('/'))
+
+
+@dc.dataclass
+class RequestInfo:
+    """The details of one request, from start to end.
+
+    `source` is 'network', 'cache' (a fresh cache hit), or 'coalesced'
+    (shared another caller's in-flight request).
+    """
+
+    method: str
+    path: str
+    route: str
+    start_time: float
+    duration: float = 0.0
+    status: Optional[int] = None
+    response_size: int = 0
+    retries: int = 0
+    source: str = 'network'
+    error: Optional[BaseException] = None
+
+
+class Histogram:
+    """A fixed-bucket histogram.
+
+    Args:
+        buckets (sequence): the upper bounds of the buckets (ascending) --
+            larger values go in an overflow bucket
+    """
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Estimate a percentile (0-100), as the upper bound of its bucket."""
+        if not self.count:
+            return None
+        rank = percentile / 100.0 * self.count
+        total = 0
+        for i, count in enumerate(self.counts):
+            total += count
+            if total >= rank and count:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            # the overflow bucket's bound is '+Inf', as infinity is not valid json
+            'buckets': list(zip([*self.buckets, '+Inf'], self.counts)),
+        }
+
+
+#: latency buckets, in seconds
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+#: response size buckets, in bytes
+SIZE_BUCKETS = tuple(float(4 ** i) for i in range(3, 15))  # 64B to 64MB
+#: retry count buckets
+RETRY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 30)
+
+
+class RouteMetrics:
+    """The histograms and counts of one route."""
+
+    def __init__(self) -> None:
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.retries = Histogram(RETRY_BUCKETS)
+        self.statuses: Dict[str, int] = defaultdict(int)
+        self.sources: Dict[str, int] = defaultdict(int)
+
+    def add(self, info: RequestInfo) -> None:
+        self.latency.add(info.duration)
+        self.sources[info.source] += 1
+        if info.source != 'network':
+            return
+        self.retries.add(info.retries)
+        if info.status is not None:
+            self.statuses[str(info.status)] += 1
+            self.response_size.add(info.response_size)
+        else:
+            self.statuses[type(info.error).__name__ if info.error else 'unknown'] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'latency': self.latency.as_dict(),
+            'response_size': self.response_size.as_dict(),
+            'retries': self.retries.as_dict(),
+            'statuses': dict(self.statuses),
+            'sources': dict(self.sources),
+        }
+
+
+class ClientMetrics:
+    """In-memory per-route request metrics.
+
+    One instance can be shared by several clients. It is thread-safe.
+
+    Args:
+        max_routes (int): max number of routes to track -- further routes
+            are counted under the route `(method, '{other}')`
+    """
+
+    def __init__(self, max_routes: int = 1000) -> None:
+        self.max_routes = max_routes
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+
+    def record(self, info: RequestInfo) -> None:
+        """Add a finished request (usable as an `on_request_end` hook)."""
+        key = (info.method, info.route)
+        with self._lock:
+            route = self._routes.get(key)
+            if route is None:
+                if len(self._routes) >= self.max_routes:
+                    key = (info.method, '{other}')
+                route = self._routes.setdefault(key, RouteMetrics())
+            route.add(info)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Get a copy of the metrics, as plain data (json-serializable).
+
+        Returns:
+            dict: `{"METHOD /route": {latency, response_size, retries, statuses, sources}}`
+        """
+        with self._lock:
+            return {f'{method} {route}': m.as_dict() for (method, route), m in self._routes.items()}
+
+    def reset(self) -> None:
+        """Drop all the metrics."""
+        with self._lock:
+            self._routes.clear()
+
+
+#: a request hook
+RequestHook = Callable[[RequestInfo], None]
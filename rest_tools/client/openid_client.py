@@ -28,8 +28,11 @@ class OpenIDRestClient(RestClient):
         update_func (callable): a function that gets called when the access and refresh tokens are updated (optional)
         timeout (int): request timeout (optional)
         retries (int): number of retries to attempt (optional)
+        token_renewal (float): renew the token in the background after this fraction of its lifetime (optional)
     """
 
+    _defer_token_renewal = True
+
     def __init__(
         self,
         address: str,
@@ -55,8 +58,10 @@ class OpenIDRestClient(RestClient):
             **kwargs,
         )
 
-        # initial call to verify things work
-        self._openid_token()
+        # initial call to verify things work -- the token is kept, and the
+        # renewal only starts after, so the refresh token is never sent twice
+        self._get_token()
+        self._start_token_renewal()
 
     def _openid_token(self) -> str:
         if not self.auth.token_url:
@@ -0,0 +1,163 @@
+"""Pagination strategies for `RestClient.paginate()`.
+
+A strategy knows how to find the items in a page, and how to ask for
+the next page:
+
+* :py:class:`CursorPagination` -- the body has an opaque cursor for
+  the next page, passed back as an arg
+* :py:class:`OffsetPagination` -- `offset` / `limit` args, so the next
+  pages are known in advance, and can be fetched concurrently
+* :py:class:`LinkHeaderPagination` -- an RFC 8288 `Link: <url>;
+  rel="next"` response header
+
+A page request is a `(path, args)` tuple. The path may be an absolute
+url (from a `Link` header), as long as it is on the client's address.
+"""
+
+# fmt:off
+
+import dataclasses as dc
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import urljoin
+
+import requests
+
+from ..utils.json_util import JSONType
+
+#: a page request: (path, args)
+PageRequest = Tuple[str, Dict[str, Any]]
+
+
+@dc.dataclass
+class Page:
+    """A fetched page."""
+
+    path: str
+    args: Dict[str, Any]
+    url: str
+    body: JSONType
+    headers: Mapping[str, str]
+
+
+class Pagination:
+    """Base class for pagination strategies.
+
+    Args:
+        items_key (str): the key of the list of items in the body
+            (None if the body is the list)
+    """
+
+    def __init__(self, items_key: Optional[str] = 'results') -> None:
+        self.items_key = items_key
+
+    def items(self, page: Page) -> List[JSONType]:
+        """Get the items of a page."""
+        if self.items_key is None:
+            return page.body  # type: ignore[return-value]
+        return page.body[self.items_key]  # type: ignore[index,call-overload]
+
+    def first(self, path: str, args: Dict[str, Any]) -> PageRequest:
+        """Get the request for the first page."""
+        return (path, args)
+
+    def predict(self, request: PageRequest) -> Optional[PageRequest]:
+        """Get the request for the page after `request`, without seeing
+        the response (None if that needs the response)."""
+        return None
+
+    def next(self, request: PageRequest, page: Page) -> Optional[PageRequest]:
+        """Get the request for the page after `page` (None at the end)."""
+        raise NotImplementedError()
+
+
+class CursorPagination(Pagination):
+    """Follow a cursor from the body of each page.
+
+    Args:
+        cursor_key (str): the key of the next cursor in the body
+            (missing, null, or empty at the end)
+        cursor_param (str): the arg to pass the cursor in
+        items_key (str): the key of the list of items in the body
+    """
+
+    def __init__(self, cursor_key: str = 'next', cursor_param: str = 'cursor', items_key: Optional[str] = 'results') -> None:
+        super().__init__(items_key)
+        self.cursor_key = cursor_key
+        self.cursor_param = cursor_param
+
+    def next(self, request: PageRequest, page: Page) -> Optional[PageRequest]:
+        cursor = page.body.get(self.cursor_key)  # type: ignore[union-attr]
+        if not cursor:
+            return None
+        return (request[0], {**request[1], self.cursor_param: cursor})
+
+
+class OffsetPagination(Pagination):
+    """Step through the collection with offset and limit args.
+
+    The collection ends at a page with fewer than `limit` items, or at
+    the total count, if the body has one.
+
+    Args:
+        limit (int): the number of items per page
+        offset_param (str): the offset arg
+        limit_param (str): the limit arg
+        items_key (str): the key of the list of items in the body
+        total_key (str): (optional) the key of the total count in the body
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        offset_param: str = 'offset',
+        limit_param: str = 'limit',
+        items_key: Optional[str] = 'results',
+        total_key: Optional[str] = None,
+    ) -> None:
+        super().__init__(items_key)
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1: {limit}")
+        self.limit = limit
+        self.offset_param = offset_param
+        self.limit_param = limit_param
+        self.total_key = total_key
+
+    def first(self, path: str, args: Dict[str, Any]) -> PageRequest:
+        return (path, {**args, self.offset_param: int(args.get(self.offset_param, 0)), self.limit_param: self.limit})
+
+    def predict(self, request: PageRequest) -> Optional[PageRequest]:
+        path, args = request
+        return (path, {**args, self.offset_param: args[self.offset_param] + self.limit})
+
+    def next(self, request: PageRequest, page: Page) -> Optional[PageRequest]:
+        if len(self.items(page)) < self.limit:
+            return None
+        if self.total_key is not None:
+            total = page.body.get(self.total_key)  # type: ignore[union-attr]
+            if total is not None and request[1][self.offset_param] + self.limit >= total:
+                return None
+        return self.predict(request)
+
+
+class LinkHeaderPagination(Pagination):
+    """Follow the `Link` response header.
+
+    Args:
+        rel (str): the relation of the next page's link
+        items_key (str): the key of the list of items in the body
+            (None if the body is the list)
+    """
+
+    def __init__(self, rel: str = 'next', items_key: Optional[str] = None) -> None:
+        super().__init__(items_key)
+        self.rel = rel
+
+    def next(self, request: PageRequest, page: Page) -> Optional[PageRequest]:
+        header = page.headers.get('Link')
+        if not header:
+            return None
+        for link in requests.utils.parse_header_links(header):
+            if self.rel in link.get('rel', '').split():
+                # the link has the args in its query string
+                return (urljoin(page.url, link['url']), {})
+        return None
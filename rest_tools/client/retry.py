@@ -0,0 +1,252 @@
+"""The retry policy of `RestClient` and the sessions.
+
+:py:class:`RetryPolicy` is a `urllib3`_ `Retry`, so it works the same
+in a :py:class:`rest_tools.client.RetryTransport` and in a `requests`
+adapter. On top of `Retry`, it adds:
+
+* decorrelated jitter -- each backoff is random, between the backoff
+  factor and 3x the previous backoff (capped at the usual exponential
+  backoff), so clients that failed together do not retry together
+* safe retries of unsafe methods -- POST and PATCH are only retried
+  when the request was not processed: on a connection error, or on a
+  status in `unsafe_statuses` (e.g. `503` from an overloaded server)
+* per-status and per-method caps on the number of retries
+* a :py:class:`RetryBudget`, shared by every client in the process,
+  which caps retries to a fraction of the successful requests, so a
+  backend blip cannot turn into a retry storm
+
+.. _urllib3: https://urllib3.readthedocs.io
+"""
+
+# fmt:off
+
+import random
+import threading
+import time
+from types import TracebackType
+from typing import Any, Collection, Dict, Mapping, Optional
+
+from urllib3.connectionpool import ConnectionPool
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.response import BaseHTTPResponse
+from urllib3.util.retry import Retry
+
+#: methods that are safe to retry after any failure
+IDEMPOTENT_METHODS = ('HEAD', 'TRACE', 'GET', 'PUT', 'OPTIONS', 'DELETE')
+#: statuses that mean the request was not processed, so any method can be retried
+UNSAFE_STATUSES = (408, 429, 503)
+
+
+class RetryBudget:
+    """A token bucket of retries, earned by successful requests.
+
+    Each successful request (a final status below 500) adds `ratio`
+    tokens, and each retry spends one, so retries stay below about
+    `ratio` of the successful traffic. A trickle of `min_per_second`
+    tokens lets a quiet client retry at all. When the bucket is empty,
+    the retry is denied, and the attempt's error (or status) is final.
+
+    Args:
+        ratio (float): retries allowed per successful request
+        min_per_second (float): retries allowed per second, regardless of traffic
+        max_tokens (float): max number of retries saved up
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 10.0, max_tokens: float = 100.0) -> None:
+        if ratio < 0.0:
+            raise ValueError(f"ratio must be positive: {ratio}")
+        if max_tokens < 1.0:
+            raise ValueError(f"max_tokens must be at least 1: {max_tokens}")
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+
+        self._lock = threading.Lock()
+        self._tokens = max_tokens
+        self._last_refill = time.monotonic()
+
+        # counters
+        self.successes = 0
+        self.retries = 0
+        self.denied = 0
+
+    def _refill(self) -> None:
+        """Add the per-second tokens. Call with the lock held."""
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._last_refill) * self.min_per_second)
+        self._last_refill = now
+
+    def deposit(self) -> None:
+        """Record a successful request."""
+        with self._lock:
+            self.successes += 1
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Try to spend a retry.
+
+        Returns:
+            bool: whether the retry is allowed
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < 1.0:
+                self.denied += 1
+                return False
+            self._tokens -= 1.0
+            self.retries += 1
+            return True
+
+    def refund(self) -> None:
+        """Give back a retry that was allowed, but not made."""
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + 1.0)
+            self.retries -= 1
+
+    def as_dict(self) -> Dict[str, float]:
+        """Get a snapshot of the tokens and counters."""
+        with self._lock:
+            self._refill()
+            return {
+                'tokens': self._tokens,
+                'successes': self.successes,
+                'retries': self.retries,
+                'denied': self.denied,
+            }
+
+
+_budget: Optional[RetryBudget] = None
+_budget_lock = threading.Lock()
+
+
+def get_retry_budget(**kwargs: Any) -> RetryBudget:
+    """Get the process-wide retry budget.
+
+    The `kwargs` (see :py:class:`RetryBudget`) only apply when the
+    budget is created, by the first caller.
+    """
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = RetryBudget(**kwargs)
+        return _budget
+
+
+class RetryPolicy(Retry):
+    """A `urllib3` `Retry`, with jitter, rules, and a budget.
+
+    Args:
+        jitter (bool): use decorrelated jitter for the backoff
+        unsafe_statuses (collection): statuses (in the `status_forcelist`)
+            to retry for methods that are not in `allowed_methods`
+        status_retries (mapping): max retries for a status, by status
+        method_retries (mapping): max retries for a method, by method
+        budget (RetryBudget): (optional) the budget to spend retries from
+        prev_backoff (float): the previous backoff (for the jitter)
+        **kwargs: the `Retry` settings
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        jitter: bool = True,
+        unsafe_statuses: Collection[int] = UNSAFE_STATUSES,
+        status_retries: Optional[Mapping[int, int]] = None,
+        method_retries: Optional[Mapping[str, int]] = None,
+        budget: Optional[RetryBudget] = None,
+        prev_backoff: float = 0.0,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.jitter = jitter
+        self.unsafe_statuses = unsafe_statuses
+        self.status_retries = status_retries or {}
+        self.method_retries = method_retries or {}
+        self.budget = budget
+        self.prev_backoff = prev_backoff
+        self._backoff: Optional[float] = None
+
+    def new(self, **kw: Any) -> 'RetryPolicy':
+        params: Dict[str, Any] = dict(
+            jitter=self.jitter,
+            unsafe_statuses=self.unsafe_statuses,
+            status_retries=self.status_retries,
+            method_retries=self.method_retries,
+            budget=self.budget,
+            prev_backoff=self._backoff if self._backoff is not None else self.prev_backoff,
+        )
+        params.update(kw)
+        return super().new(**params)
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        if not self.jitter or backoff <= 0.0:
+            return backoff
+        if self._backoff is None:
+            # decorrelated jitter, capped by the exponential backoff
+            upper = max(self.backoff_factor, 3.0 * self.prev_backoff)
+            self._backoff = min(backoff, random.uniform(self.backoff_factor, upper))
+        return self._backoff
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if self._is_method_retryable(method):
+            retry = super().is_retry(method, status_code, has_retry_after)
+        else:
+            retry = bool(self.status_forcelist and status_code in self.status_forcelist and status_code in self.unsafe_statuses)
+        if not retry and status_code < 500 and self.budget is not None:
+            # every final response comes through here, in urllib3 and RetryTransport alike
+            self.budget.deposit()
+        return retry
+
+    def increment(
+        self,
+        method: Optional[str] = None,
+        url: Optional[str] = None,
+        response: Optional[BaseHTTPResponse] = None,
+        error: Optional[Exception] = None,
+        _pool: Optional[ConnectionPool] = None,
+        _stacktrace: Optional[TracebackType] = None,
+    ) -> 'RetryPolicy':
+        new_retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        cause = None
+        status = response.status if response is not None and error is None else None
+        if status is not None and status in self.status_retries:
+            if sum(1 for h in new_retry.history if h.status == status) > self.status_retries[status]:
+                cause = ResponseError.SPECIFIC_ERROR.format(status_code=status)
+        if method is not None and method in self.method_retries and len(new_retry.history) > self.method_retries[method]:
+            cause = f'too many retries of {method}'
+        if cause is None and self.budget is not None and not self.budget.withdraw():
+            cause = 'retry budget exhausted'
+        if cause is not None:
+            reason = error or ResponseError(cause)
+            raise MaxRetryError(_pool, url, reason) from reason  # type: ignore[arg-type]
+        return new_retry
+
+
+def make_retry(
+    retries: int,
+    backoff_factor: float,
+    allowed_methods: Collection[str] = IDEMPOTENT_METHODS,
+    status_forcelist: Collection[int] = (408, 429, 500, 502, 503, 504),
+    **kwargs: Any,
+) -> RetryPolicy:
+    """Get the default retry policy for a number of retries.
+
+    Args:
+        retries (int): number of retries
+        backoff_factor (float): speed factor for retries (in seconds)
+        allowed_methods (collection): http methods to retry on any failure
+        status_forcelist (collection): http status codes to retry on
+        **kwargs: more settings (see :py:class:`RetryPolicy`)
+    """
+    return RetryPolicy(
+        total=retries,
+        connect=retries,
+        read=retries,
+        redirect=retries,
+        # status=retries,
+        allowed_methods=allowed_methods,
+        status_forcelist=status_forcelist,
+        backoff_factor=backoff_factor,
+        **kwargs,
+    )
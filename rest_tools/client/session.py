@@ -6,45 +6,249 @@
 # fmt:off
 # pylint: skip-file
 
-from typing import Collection
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Collection, Dict, Optional
 
 import requests
-from requests.adapters import HTTPAdapter
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
 from requests_futures.sessions import FuturesSession  # type: ignore[import]
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.poolmanager import PoolManager
 from urllib3.util.retry import Retry
 
+from .retry import make_retry
+
+
+class PoolStats:
+    """Connection-pool counters, for sizing pools from data.
+
+    One instance can be shared by several sessions (e.g. the async
+    session and the sync sessions of a `RestClient`).
+
+    Counters:
+        connections_opened: new connections made
+        connections_reused: connections taken from the pool
+        connections_discarded: connections closed because the pool was full
+        pool_waits: number of times a request blocked for a free connection
+        pool_wait_time: total seconds spent blocked for a free connection
+        waiting / max_waiting: requests currently (or at most) blocked for a connection
+        queued / max_queued: requests currently (or at most) queued for a worker thread
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.connection_checkouts = 0
+        self.connections_discarded = 0
+        self.pool_waits = 0
+        self.pool_wait_time = 0.0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.queued = 0
+        self.max_queued = 0
+
+    @property
+    def connections_reused(self) -> int:
+        return max(0, self.connection_checkouts - self.connections_opened)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """Increment a counter."""
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def enter(self, gauge: str) -> None:
+        """Increment a gauge, and track its max."""
+        with self._lock:
+            value = getattr(self, gauge) + 1
+            setattr(self, gauge, value)
+            if value > getattr(self, f'max_{gauge}'):
+                setattr(self, f'max_{gauge}', value)
+
+    def exit(self, gauge: str) -> None:
+        """Decrement a gauge."""
+        with self._lock:
+            setattr(self, gauge, getattr(self, gauge) - 1)
+
+    def as_dict(self) -> Dict[str, float]:
+        """Get a snapshot of all the counters."""
+        with self._lock:
+            return {
+                'connections_opened': self.connections_opened,
+                'connections_reused': self.connections_reused,
+                'connections_discarded': self.connections_discarded,
+                'pool_waits': self.pool_waits,
+                'pool_wait_time': self.pool_wait_time,
+                'waiting': self.waiting,
+                'max_waiting': self.max_waiting,
+                'queued': self.queued,
+                'max_queued': self.max_queued,
+            }
+
+
+class _StatsPoolMixin:
+    """Count connection-pool events on a `urllib3` connection pool."""
+    rt_stats: Optional[PoolStats] = None
+
+    def _new_conn(self) -> Any:
+        if self.rt_stats is not None:
+            self.rt_stats.incr('connections_opened')
+        return super()._new_conn()  # type: ignore[misc]
+
+    def _get_conn(self, timeout: Optional[float] = None) -> Any:
+        stats = self.rt_stats
+        if stats is None:
+            return super()._get_conn(timeout)  # type: ignore[misc]
+        stats.incr('connection_checkouts')
+        if not (self.block and self.pool is not None and self.pool.empty()):  # type: ignore[attr-defined]
+            return super()._get_conn(timeout)  # type: ignore[misc]
+        # every connection is in use, so this will block
+        start = time.monotonic()
+        stats.enter('waiting')
+        try:
+            return super()._get_conn(timeout)  # type: ignore[misc]
+        finally:
+            stats.exit('waiting')
+            stats.incr('pool_waits')
+            stats.incr('pool_wait_time', time.monotonic() - start)
+
+    def _put_conn(self, conn: Any) -> None:
+        if self.rt_stats is not None and conn is not None and self.pool is not None and self.pool.full():  # type: ignore[attr-defined]
+            self.rt_stats.incr('connections_discarded')
+        super()._put_conn(conn)  # type: ignore[misc]
+
+
+class _StatsHTTPConnectionPool(_StatsPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _StatsHTTPSConnectionPool(_StatsPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _StatsPoolManager(PoolManager):
+    def __init__(self, rt_stats: PoolStats, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.rt_stats = rt_stats
+        self.pool_classes_by_scheme = {
+            'http': _StatsHTTPConnectionPool,
+            'https': _StatsHTTPSConnectionPool,
+        }
+
+    def _new_pool(self, *args: Any, **kwargs: Any) -> HTTPConnectionPool:
+        pool = super()._new_pool(*args, **kwargs)
+        pool.rt_stats = self.rt_stats  # type: ignore[attr-defined]
+        return pool
+
+
+class StatsHTTPAdapter(HTTPAdapter):
+    """An `HTTPAdapter` that records connection-pool events in a `PoolStats`."""
+
+    def __init__(self, stats: PoolStats, **kwargs: Any) -> None:
+        self.rt_stats = stats  # needed by `init_poolmanager()`, called by `__init__()`
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections: int, maxsize: int, block: bool = False, **pool_kwargs: Any) -> None:
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _StatsPoolManager(
+            self.rt_stats,
+            num_pools=connections,
+            maxsize=maxsize,
+            block=block,
+            **pool_kwargs,
+        )
+
+
+class _StatsThreadPoolExecutor(ThreadPoolExecutor):
+    """A `ThreadPoolExecutor` that tracks how many tasks wait for a worker."""
+
+    def __init__(self, stats: PoolStats, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.rt_stats = stats
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:  # type: ignore[override]
+        stats = self.rt_stats
+
+        def run() -> Any:
+            stats.exit('queued')
+            return fn(*args, **kwargs)
+
+        stats.enter('queued')
+        try:
+            return super().submit(run)
+        except Exception:
+            stats.exit('queued')
+            raise
+
+
+def _mount_adapter(
+    session: requests.Session,
+    retry: Retry,
+    pool_connections: int,
+    pool_maxsize: int,
+    pool_block: bool,
+    stats: Optional[PoolStats],
+) -> None:
+    if stats is not None:
+        adapter: HTTPAdapter = StatsHTTPAdapter(
+            stats,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry,
+            pool_block=pool_block,
+        )
+    else:
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry,
+            pool_block=pool_block,
+        )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
 
 def AsyncSession(
     retries: int,
     backoff_factor: float,
     allowed_methods: Collection[str] = ('HEAD', 'TRACE', 'GET', 'POST', 'PATCH', 'PUT', 'OPTIONS', 'DELETE'),
     status_forcelist: Collection[int] = (408, 429, 500, 502, 503, 504),
+    pool_connections: int = DEFAULT_POOLSIZE,
+    pool_maxsize: Optional[int] = None,
+    pool_block: bool = False,
+    max_workers: int = 8,
+    stats: Optional[PoolStats] = None,
 ) -> FuturesSession:
     """Return a Session object with full retry capabilities.
 
     Args:
         retries (int): number of retries
         backoff_factor (float): speed factor for retries (in seconds)
-        allowed_methods (collection): http methods to retry on
+        allowed_methods (collection): http methods to retry on any failure
+            (others are only retried when the request was not processed --
+            see :py:class:`rest_tools.client.retry.RetryPolicy`)
         status_forcelist (collection): http status codes to retry on
+        pool_connections (int): number of connection pools (hosts) to cache
+        pool_maxsize (int): max connections per pool (default: at least `max_workers`)
+        pool_block (bool): whether to block for a free connection when the pool is full
+        max_workers (int): number of worker threads
+        stats (PoolStats): (optional) record connection-pool events here
 
     Returns:
         :py:class:`requests.Session`: session object
     """
-    session = FuturesSession()
-    retry = Retry(
-        total=retries,
-        connect=retries,
-        read=retries,
-        redirect=retries,
-        # status=retries,
-        allowed_methods=allowed_methods,
-        status_forcelist=status_forcelist,
-        backoff_factor=backoff_factor,
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
+    if pool_maxsize is None:
+        pool_maxsize = max(DEFAULT_POOLSIZE, max_workers)
+    session = FuturesSession(max_workers=max_workers)
+    if stats is not None:
+        # swap in an (equivalent) executor that tracks its queue depth
+        session.executor.shutdown(wait=False)
+        session.executor = _StatsThreadPoolExecutor(stats, max_workers=max_workers)
+    retry = make_retry(retries, backoff_factor, allowed_methods, status_forcelist)
+    _mount_adapter(session, retry, pool_connections, pool_maxsize, pool_block, stats)
     return session
 
 
@@ -53,30 +257,29 @@ def Session(
     backoff_factor: float,
     allowed_methods: Collection[str] = ('HEAD', 'TRACE', 'GET', 'POST', 'PUT', 'OPTIONS', 'DELETE'),
     status_forcelist: Collection[int] = (408, 429, 500, 502, 503, 504),
+    pool_connections: int = DEFAULT_POOLSIZE,
+    pool_maxsize: int = DEFAULT_POOLSIZE,
+    pool_block: bool = False,
+    stats: Optional[PoolStats] = None,
 ) -> requests.Session:
     """Return a Session object with full retry capabilities.
 
     Args:
         retries (int): number of retries
         backoff_factor (float): speed factor for retries (in seconds)
-        allowed_methods (collection): http methods to retry on
+        allowed_methods (collection): http methods to retry on any failure
+            (others are only retried when the request was not processed --
+            see :py:class:`rest_tools.client.retry.RetryPolicy`)
         status_forcelist (collection): http status codes to retry on
+        pool_connections (int): number of connection pools (hosts) to cache
+        pool_maxsize (int): max connections per pool
+        pool_block (bool): whether to block for a free connection when the pool is full
+        stats (PoolStats): (optional) record connection-pool events here
 
     Returns:
         :py:class:`requests.Session`: session object
     """
     session = requests.Session()
-    retry = Retry(
-        total=retries,
-        connect=retries,
-        read=retries,
-        redirect=retries,
-        # status=retries,
-        allowed_methods=allowed_methods,
-        status_forcelist=status_forcelist,
-        backoff_factor=backoff_factor,
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
+    retry = make_retry(retries, backoff_factor, allowed_methods, status_forcelist)
+    _mount_adapter(session, retry, pool_connections, pool_maxsize, pool_block, stats)
     return session
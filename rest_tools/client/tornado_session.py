@@ -0,0 +1,635 @@
+"""Get an asyncio-native `tornado`_ transport, and a Session that fully
+retries errors.
+
+.. _tornado: https://www.tornadoweb.org
+
+Unlike :py:func:`rest_tools.client.session.AsyncSession`, requests are
+not run in a thread pool. Each in-flight request is a coroutine on the
+current event loop, so cancelling the caller also stops the retry loop.
+Retries and backoff follow the same `urllib3`_ `Retry` semantics.
+
+Response bodies can also be streamed with backpressure: a slow consumer
+pauses reading from the socket, instead of buffering the whole body.
+
+.. _urllib3: https://urllib3.readthedocs.io
+"""
+
+# fmt:off
+
+import asyncio
+import datetime
+import logging
+import ssl
+import sys
+import threading
+import urllib.parse
+from typing import Any, AsyncGenerator, Awaitable, Callable, Collection, Dict, Optional, Union
+
+import requests
+import tornado.http1connection
+import tornado.httpclient
+import tornado.httputil
+import tornado.iostream
+import tornado.simple_httpclient
+import tornado.tcpclient
+from requests.structures import CaseInsensitiveDict
+from urllib3.exceptions import (
+    ConnectTimeoutError,
+    NewConnectionError,
+    ProtocolError,
+    ReadTimeoutError,
+)
+from urllib3.exceptions import SSLError as urllib3_SSLError
+
+from ..utils.compression import Decompressor, decompress
+from .retry import IDEMPOTENT_METHODS
+from .session import PoolStats
+from .transport import (
+    RETRYABLE_ERRORS,
+    RetryTransport,
+    StreamResponse,
+    Transport,
+    _request_url,
+    _to_requests_error_type,
+    make_retry,
+)
+from .upload import UploadBody
+
+LOGGER = logging.getLogger(__name__)
+
+#: redirects to follow, for a streamed response (tornado's default)
+_MAX_REDIRECTS = 5
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+def _body_producer(body: UploadBody) -> Callable[[Callable[[bytes], Awaitable[None]]], Awaitable[None]]:
+    """Get a tornado `body_producer`, to stream a request body."""
+    async def produce(write: Callable[[bytes], Awaitable[None]]) -> None:
+        loop = asyncio.get_running_loop()
+        chunks = iter(body)
+        while True:
+            # read in a thread, so a slow disk does not block the event loop
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                return
+            await write(chunk)
+    return produce
+
+
+def _to_urllib3_error(exc: Exception, url: str) -> Exception:
+    """Translate a tornado error into a `urllib3` error, for `Retry`."""
+    if isinstance(exc, tornado.simple_httpclient.HTTPTimeoutError):
+        if 'connect' in str(exc):
+            return ConnectTimeoutError(str(exc))
+        return ReadTimeoutError(None, url, str(exc))  # type: ignore[arg-type]
+    if isinstance(exc, ssl.SSLError):
+        return urllib3_SSLError(str(exc))
+    if isinstance(exc, OSError):
+        return NewConnectionError(None, str(exc))  # type: ignore[arg-type]
+    return ProtocolError(str(exc), exc)
+
+
+def _to_requests_response(
+    resp: tornado.httpclient.HTTPResponse,
+    prepared: requests.PreparedRequest,
+) -> requests.Response:
+    """Wrap a tornado response so callers can use the `requests` API."""
+    r = requests.Response()
+    r.status_code = resp.code
+    r.headers = CaseInsensitiveDict({k: v for k, v in resp.headers.items()})
+    r._content = resp.body or b''
+    # decode the content-codings (tornado's own decoding is off)
+    if r._content and r.headers.get('Content-Encoding'):
+        try:
+            r._content = decompress(r._content, r.headers['Content-Encoding'])
+        except ValueError as e:
+            raise requests.exceptions.ContentDecodingError(e, request=prepared) from e
+    r.url = resp.effective_url
+    r.reason = resp.reason
+    r.request = prepared
+    r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+    r.elapsed = datetime.timedelta(seconds=resp.request_time or 0)
+    return r
+
+
+class _ResponseStream:
+    """Hand a response body from a connection to a consumer, in chunks.
+
+    At most `max_chunks` chunks are buffered. When the buffer is full,
+    the connection stops reading until the consumer catches up.
+    """
+
+    def __init__(self, max_chunks: int) -> None:
+        self.started: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._queue: asyncio.Queue = asyncio.Queue(max_chunks)
+        self._iostream: Optional[tornado.iostream.IOStream] = None
+        self._aborted = False
+        self._error: Optional[Exception] = None
+
+    def attach(self, iostream: tornado.iostream.IOStream) -> None:
+        """Called once connected, so an abort can close the connection."""
+        self._iostream = iostream
+        if self._aborted:
+            self._close()
+
+    def start(self, start_line: tornado.httputil.ResponseStartLine, headers: tornado.httputil.HTTPHeaders) -> None:
+        """Called by the connection once the final headers are received."""
+        if not self._aborted and not self.started.done():
+            self.started.set_result((start_line, headers))
+
+    async def response(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        """Wait for the response headers, and get a response without a body."""
+        url = _request_url(prepared)
+        try:
+            start_line, headers = await asyncio.wait_for(asyncio.shield(self.started), timeout)
+        except asyncio.TimeoutError:
+            raise ReadTimeoutError(None, url, 'Timeout while waiting for the response')  # type: ignore[arg-type]
+        return _to_requests_response(
+            tornado.httpclient.HTTPResponse(
+                tornado.httpclient.HTTPRequest(url, prepared.method),  # type: ignore[arg-type]
+                start_line.code,
+                reason=start_line.reason,
+                headers=headers,
+                effective_url=url,
+            ),
+            prepared,
+        )
+
+    async def put(self, chunk: bytes) -> None:
+        """Called by the connection for each chunk of the body."""
+        if not self._aborted:
+            await self._queue.put(chunk)
+
+    async def finish(self, error: Optional[Exception] = None) -> None:
+        """Called once the request is done, successfully or not."""
+        if not self.started.done():
+            self.started.set_exception(error or ProtocolError('no response received'))
+        self._error = error
+        if not self._aborted:
+            await self._queue.put(None)
+
+    async def chunks(self, timeout: Optional[float] = None) -> AsyncGenerator[bytes, None]:
+        """Get the body chunks, waiting at most `timeout` seconds for each."""
+        while True:
+            try:
+                chunk = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                raise ReadTimeoutError(None, '', 'Timeout while streaming the response body')  # type: ignore[arg-type]
+            if chunk is None:
+                if self._error:
+                    raise self._error
+                return
+            yield chunk
+
+    def abort(self) -> None:
+        """Stop reading the response, and release the connection."""
+        self._aborted = True
+        if not self.started.done():
+            self.started.cancel()
+        # unblock the connection if it is waiting on a full buffer
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._close()
+
+    def _close(self) -> None:
+        if self._iostream is not None:
+            self._iostream.close()
+
+
+class _StreamDelegate(tornado.httputil.HTTPMessageDelegate):
+    """Pass a response from a connection to a `_ResponseStream`.
+
+    The connection waits on what `data_received()` returns before it
+    reads more, so waiting on the consumer is what provides the
+    backpressure. The body of a redirect (to follow) is discarded.
+    """
+
+    def __init__(self, stream: _ResponseStream, follow_redirects: bool) -> None:
+        self.stream = stream
+        self.follow_redirects = follow_redirects
+        self.code: Optional[int] = None
+        self.location: Optional[str] = None
+        self.finished = False
+
+    def headers_received(
+        self,
+        start_line: Union[tornado.httputil.RequestStartLine, tornado.httputil.ResponseStartLine],
+        headers: tornado.httputil.HTTPHeaders,
+    ) -> None:
+        assert isinstance(start_line, tornado.httputil.ResponseStartLine)
+        if start_line.code < 200:
+            return  # an interim response
+        self.code = start_line.code
+        if self.follow_redirects and start_line.code in _REDIRECT_CODES and 'Location' in headers:
+            self.location = headers['Location']
+            return
+        self.stream.start(start_line, headers)
+
+    def data_received(self, chunk: bytes) -> Optional[Awaitable[None]]:
+        if self.location is not None:
+            return None
+        return self.stream.put(chunk)
+
+    def finish(self) -> None:
+        self.finished = True
+
+
+def _redirect(prepared: requests.PreparedRequest, code: int, location: str) -> requests.PreparedRequest:
+    """Get the request to send for a redirect, the way tornado's client does."""
+    url = _request_url(prepared)
+    new = prepared.copy()
+    new.url = urllib.parse.urljoin(url, location)
+    if urllib.parse.urlsplit(url)[:2] != urllib.parse.urlsplit(new.url)[:2]:
+        # cross-origin, so do not send the credentials
+        for key in ('Authorization', 'Cookie'):
+            new.headers.pop(key, None)
+    if (code == 303 and prepared.method != 'HEAD') or (code in (301, 302) and prepared.method == 'POST'):
+        new.method = 'GET'
+        new.body = None
+        for key in ('Content-Length', 'Content-Type', 'Content-Encoding', 'Transfer-Encoding'):
+            new.headers.pop(key, None)
+    return new
+
+
+class _LoopClients:
+    """The http clients for one event loop."""
+
+    def __init__(self, max_clients: int) -> None:
+        self.client = tornado.httpclient.AsyncHTTPClient(
+            force_instance=True,
+            max_clients=max_clients,
+        )
+        self.tcp_client = tornado.tcpclient.TCPClient()
+        self.stream_slots = asyncio.Semaphore(max_clients)
+        self.active = 0
+
+    def close(self) -> None:
+        self.client.close()
+        self.tcp_client.close()
+
+
+class TornadoTransport(Transport):
+    """An asyncio-native transport, using tornado's http client.
+
+    Each in-flight request is a coroutine on the current event loop, so
+    cancelling the caller also cancels the request. Streamed responses
+    have backpressure: a slow consumer pauses reading from the socket.
+    One transport can be used from several event loops (e.g. in
+    different threads); each loop gets its own clients.
+
+    This backend does not pool connections: tornado's simple http client
+    does not keep connections alive, so each request opens a new
+    connection (and TLS session). For many small requests to one server,
+    the `requests` backend, which pools connections, can be faster.
+
+    Args:
+        max_clients (int): max number of concurrent requests per event loop
+        stats (PoolStats): (optional) record connection events here
+    """
+
+    supports_stream = True
+
+    def __init__(
+        self,
+        max_clients: int = 1000,
+        stats: Optional[PoolStats] = None,
+    ) -> None:
+        super().__init__()
+        self.max_clients = max_clients
+        self.stats = stats
+
+        # one set of clients per event loop
+        self._loops: Dict[asyncio.AbstractEventLoop, _LoopClients] = {}
+        self._loops_lock = threading.Lock()
+
+    def _loop_clients(self) -> _LoopClients:
+        """Get the clients for the running event loop, opening them if needed."""
+        loop = asyncio.get_running_loop()
+        with self._loops_lock:
+            clients = self._loops.get(loop)
+            if clients is None:
+                # the clients hold a reference to their loop, so drop closed loops here
+                for old in [old for old in self._loops if old.is_closed()]:
+                    self._loops.pop(old).close()
+                clients = self._loops[loop] = _LoopClients(self.max_clients)
+            return clients
+
+    def _record_checkout(self, clients: _LoopClients) -> None:
+        if self.stats is not None:
+            # tornado's simple client opens a new connection for every request
+            self.stats.incr('connection_checkouts')
+            self.stats.incr('connections_opened')
+            if clients.active >= self.max_clients:
+                self.stats.incr('pool_waits')
+
+    def _build_request(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float],
+    ) -> tornado.httpclient.HTTPRequest:
+        kwargs: Dict[str, Any] = {}
+        if self.cert:
+            if isinstance(self.cert, (tuple, list)):
+                kwargs['client_cert'], kwargs['client_key'] = self.cert
+            else:
+                kwargs['client_cert'] = self.cert
+        if isinstance(self.verify, str):
+            kwargs['ca_certs'] = self.verify
+        headers = dict(prepared.headers)
+        if isinstance(prepared.body, UploadBody):
+            # tornado does the chunked encoding itself, when there is no length
+            headers.pop('Transfer-Encoding', None)
+            kwargs['body_producer'] = _body_producer(prepared.body)
+        else:
+            kwargs['body'] = prepared.body
+        return tornado.httpclient.HTTPRequest(
+            url=_request_url(prepared),
+            method=prepared.method,  # type: ignore[arg-type]
+            headers=headers,
+            connect_timeout=timeout,
+            request_timeout=timeout,
+            validate_cert=bool(self.verify),
+            allow_nonstandard_methods=True,
+            # tornado only decodes gzip, and would replace our Accept-Encoding
+            # with `gzip`, so send it as-is and decode every coding here
+            decompress_response=False,
+            **kwargs,
+        )
+
+    def _ssl_context(self) -> ssl.SSLContext:
+        """Get the TLS settings for a streamed request."""
+        ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=self.verify if isinstance(self.verify, str) else None)
+        if not self.verify:
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+        if self.cert:
+            if isinstance(self.cert, (tuple, list)):
+                ctx.load_cert_chain(*self.cert)
+            else:
+                ctx.load_cert_chain(self.cert)
+        return ctx
+
+    async def send(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        """Send a single attempt of a prepared request (no retries).
+
+        Raises `urllib3` errors, so they can be classified by a `Retry`.
+        """
+        clients = self._loop_clients()
+        self._record_checkout(clients)
+        url = _request_url(prepared)
+        clients.active += 1
+        try:
+            resp = await clients.client.fetch(
+                self._build_request(prepared, timeout),
+                raise_error=False,
+            )
+        except tornado.httpclient.HTTPClientError as e:
+            if e.response is None:
+                raise _to_urllib3_error(e, url) from e
+            resp = e.response
+        except (OSError, tornado.iostream.StreamClosedError) as e:
+            raise _to_urllib3_error(e, url) from e
+        finally:
+            clients.active -= 1
+        return _to_requests_response(resp, prepared)
+
+    async def _fetch_stream(
+        self,
+        clients: _LoopClients,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float],
+        stream: _ResponseStream,
+        follow_redirects: bool,
+    ) -> _StreamDelegate:
+        """Send one request over a new connection, streaming the response."""
+        url = urllib.parse.urlsplit(_request_url(prepared))
+        if url.scheme not in ('http', 'https'):
+            raise ValueError(f'unsupported url scheme: {url.scheme}')
+        host, port = tornado.httputil.split_host_and_port(url.netloc.rpartition('@')[-1])
+        if port is None:
+            port = 443 if url.scheme == 'https' else 80
+        if host.startswith('[') and host.endswith(']'):
+            host = host[1:-1]
+
+        try:
+            iostream = await asyncio.wait_for(
+                clients.tcp_client.connect(host, port, ssl_options=self._ssl_context() if url.scheme == 'https' else None),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            raise ConnectTimeoutError(f'Timeout while connecting to {host}:{port}')
+        stream.attach(iostream)
+        try:
+            iostream.set_nodelay(True)
+            connection = tornado.http1connection.HTTP1Connection(
+                iostream,
+                True,
+                # the body is never held in memory, so do not limit its size
+                tornado.http1connection.HTTP1ConnectionParameters(no_keep_alive=True, max_body_size=sys.maxsize),
+            )
+            headers = tornado.httputil.HTTPHeaders()
+            for k, v in prepared.headers.items():
+                headers.add(k, v)
+            if 'Host' not in headers:
+                headers['Host'] = url.netloc.rpartition('@')[-1]
+            headers['Connection'] = 'close'
+            body = prepared.body
+            if isinstance(body, UploadBody):
+                # the connection does the chunked encoding itself, when there is no length
+                headers.pop('Transfer-Encoding', None)
+            elif isinstance(body, str):
+                body = body.encode('utf-8')
+            path = (url.path or '/') + (f'?{url.query}' if url.query else '')
+            connection.write_headers(tornado.httputil.RequestStartLine(prepared.method, path, ''), headers)  # type: ignore[arg-type]
+            if isinstance(body, UploadBody):
+                await _body_producer(body)(connection.write)
+            elif body:
+                await connection.write(body)
+            connection.finish()
+
+            delegate = _StreamDelegate(stream, follow_redirects)
+            await connection.read_response(delegate)
+            if not delegate.finished:
+                raise ProtocolError('Connection closed before the response was complete')
+            return delegate
+        finally:
+            iostream.close()
+
+    async def _send_stream(
+        self,
+        clients: _LoopClients,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float],
+        stream: _ResponseStream,
+    ) -> None:
+        """Send a single attempt of a prepared request, streaming the body.
+
+        Redirects are followed, as by tornado's client.
+        """
+        url = _request_url(prepared)
+        error: Optional[Exception] = None
+        try:
+            async with clients.stream_slots:
+                for redirects_left in range(_MAX_REDIRECTS, -1, -1):
+                    self._record_checkout(clients)
+                    clients.active += 1
+                    try:
+                        delegate = await self._fetch_stream(clients, prepared, timeout, stream, follow_redirects=redirects_left > 0)
+                    finally:
+                        clients.active -= 1
+                    if delegate.location is None:
+                        break
+                    prepared = _redirect(prepared, delegate.code, delegate.location)  # type: ignore[arg-type]
+        except (OSError, tornado.iostream.StreamClosedError, tornado.httputil.HTTPInputError) as e:
+            error = _to_urllib3_error(e, url)
+            error.__cause__ = e
+        except Exception as e:
+            error = e
+        await stream.finish(error)
+
+    async def send_stream(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        max_buffered_chunks: int = 16,
+    ) -> StreamResponse:
+        """Send a single attempt of a prepared request, and stream the body.
+
+        Raises `urllib3` errors, so they can be classified by a `Retry`.
+        """
+        if max_buffered_chunks < 1:
+            raise ValueError(f"max_buffered_chunks must be at least 1: {max_buffered_chunks}")
+
+        clients = self._loop_clients()
+        stream = _ResponseStream(max_buffered_chunks)
+        task = asyncio.ensure_future(self._send_stream(clients, prepared, timeout, stream))
+
+        def close() -> None:
+            stream.abort()
+            task.cancel()
+
+        try:
+            r = await stream.response(prepared, timeout)
+        except BaseException:
+            close()
+            raise
+
+        async def chunks() -> AsyncGenerator[bytes, None]:
+            try:
+                decoder = Decompressor(r.headers.get('Content-Encoding', ''))
+                async for chunk in stream.chunks(timeout):
+                    chunk = decoder.decompress(chunk)
+                    if chunk:
+                        yield chunk
+                chunk = decoder.flush()
+                if chunk:
+                    yield chunk
+            except RETRYABLE_ERRORS as e:
+                raise _to_requests_error_type(e)(e, request=prepared) from e
+            except ValueError as e:
+                raise requests.exceptions.ContentDecodingError(e, request=prepared) from e
+            finally:
+                close()
+
+        return StreamResponse(r, chunks(), close)
+
+    def close(self) -> None:
+        """Close the http clients of every event loop."""
+        with self._loops_lock:
+            loops = list(self._loops.values())
+            self._loops.clear()
+        for clients in loops:
+            clients.close()
+
+
+class TornadoSession(TornadoTransport):
+    """An asyncio-native session object with full retry capabilities.
+
+    Provides the `headers`, `auth`, `cert`, and `verify` attributes of a
+    :py:class:`requests.Session`, and returns
+    :py:class:`requests.Response` objects.
+
+    Args:
+        retries (int): number of retries
+        backoff_factor (float): speed factor for retries (in seconds)
+        allowed_methods (collection): http methods to retry on any failure
+            (others are only retried when the request was not processed --
+            see :py:class:`rest_tools.client.retry.RetryPolicy`)
+        status_forcelist (collection): http status codes to retry on
+        max_clients (int): max number of concurrent requests per event loop
+        stats (PoolStats): (optional) record connection events here
+    """
+
+    def __init__(
+        self,
+        retries: int,
+        backoff_factor: float,
+        allowed_methods: Collection[str] = IDEMPOTENT_METHODS,
+        status_forcelist: Collection[int] = (408, 429, 500, 502, 503, 504),
+        max_clients: int = 1000,
+        stats: Optional[PoolStats] = None,
+    ) -> None:
+        super().__init__(max_clients=max_clients, stats=stats)
+        self.retry = make_retry(retries, backoff_factor, allowed_methods, status_forcelist)
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Any = None,
+        data: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        """Send a request, retrying according to the session's `Retry`.
+
+        Returns:
+            :py:class:`requests.Response`: the final response
+        """
+        prepared = self.prepare_request(method, url, params, json, data, headers)
+        return await RetryTransport(self, self.retry).send(prepared, timeout)
+
+    async def stream(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Any = None,
+        data: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        max_buffered_chunks: int = 16,
+    ) -> AsyncGenerator[bytes, None]:
+        """Send a request, and stream back the response body.
+
+        Retries follow the session's `Retry`, until the first chunk of the
+        body is returned. After that, errors are raised as-is. The
+        `timeout` applies to connecting, and to each wait on the server.
+
+        Args:
+            max_buffered_chunks (int): number of received chunks to buffer
+                before pausing the read
+
+        Returns:
+            async generator of `bytes` chunks
+        """
+        prepared = self.prepare_request(method, url, params, json, data, headers)
+        transport = RetryTransport(self, self.retry)
+        sr = await transport.send_stream(prepared, timeout, max_buffered_chunks)
+        try:
+            if sr.status_code >= 400:
+                await sr.read()
+                sr.response.raise_for_status()
+            async for chunk in sr.chunks():
+                yield chunk
+        finally:
+            sr.close()
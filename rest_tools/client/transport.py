@@ -0,0 +1,607 @@
+"""Pluggable http transports for `RestClient`.
+
+A transport sends a single attempt of a prepared request, and returns
+the raw response (whatever its status). A failed attempt raises a
+`urllib3`_ error, so it can be classified by a `Retry`. Policies, like
+retries, are layered on top by wrapping a transport::
+
+    transport = RetryTransport(RequestsTransport(), make_retry(10, 0.3))
+
+Transports return :py:class:`requests.Response` objects, so the
+backends can be swapped (or benchmarked against each other) without
+changing the caller.
+
+.. _urllib3: https://urllib3.readthedocs.io
+"""
+
+# fmt:off
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple, Type
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import DEFAULT_POOLSIZE
+from urllib3.exceptions import (
+    ConnectTimeoutError,
+    HTTPError,
+    MaxRetryError,
+    NewConnectionError,
+    ProtocolError,
+    ReadTimeoutError,
+)
+from urllib3.exceptions import SSLError as urllib3_SSLError
+from urllib3.response import HTTPResponse
+from urllib3.util.retry import Retry
+
+from ..utils.deadline import DEADLINE_EXCEEDED_HEADER, DEADLINE_HEADER, current_deadline
+from .metrics import current_request
+from .retry import RetryPolicy, make_retry  # noqa: F401  # (re-exported)
+from .session import AsyncSession, PoolStats, Session
+from .upload import UploadBody
+
+LOGGER = logging.getLogger(__name__)
+
+#: the `urllib3` errors of a failed attempt, which a `Retry` can classify
+RETRYABLE_ERRORS = (ConnectTimeoutError, ReadTimeoutError, ProtocolError, urllib3_SSLError)
+
+
+class DeadlineExceededError(requests.exceptions.Timeout):
+    """Raised when the deadline of a request passes before it succeeds."""
+
+
+class _CancelledInThread(asyncio.CancelledError):
+    """A cancelled attempt that is still running in a thread.
+
+    `future` is done once the thread finishes with the attempt.
+    """
+
+    def __init__(self, future: 'concurrent.futures.Future[Any]') -> None:
+        super().__init__()
+        self.future = future
+
+
+def _to_requests_error_type(exc: Exception) -> Type[requests.exceptions.RequestException]:
+    """Get the `requests` exception type for a `urllib3` error."""
+    if isinstance(exc, NewConnectionError):
+        return requests.exceptions.ConnectionError
+    if isinstance(exc, ConnectTimeoutError):
+        return requests.exceptions.ConnectTimeout
+    if isinstance(exc, ReadTimeoutError):
+        return requests.exceptions.ReadTimeout
+    if isinstance(exc, urllib3_SSLError):
+        return requests.exceptions.SSLError
+    return requests.exceptions.ConnectionError
+
+
+def _from_requests_error(exc: requests.exceptions.RequestException) -> Optional[Exception]:
+    """Get the `urllib3` error behind a `requests` connection error."""
+    cause = exc.args[0] if exc.args else None
+    if isinstance(cause, MaxRetryError) and cause.reason is not None:
+        cause = cause.reason
+    if isinstance(cause, HTTPError):
+        return cause
+    if isinstance(cause, OSError):
+        return ProtocolError(str(cause), cause)
+    return None
+
+
+def _replayable(prepared: requests.PreparedRequest) -> bool:
+    """Check whether the request body can be sent again, for a retry."""
+    return not isinstance(prepared.body, UploadBody) or prepared.body.replayable
+
+
+def _request_url(prepared: requests.PreparedRequest) -> str:
+    """Get the url of a prepared request, as a str."""
+    url = prepared.url or ''
+    return url.decode() if isinstance(url, bytes) else url
+
+
+def _route(prepared: requests.PreparedRequest) -> str:
+    """Get the route of a request, as `METHOD /path`."""
+    return f'{prepared.method} {urlsplit(_request_url(prepared)).path}'
+
+
+def _to_urllib3_response(r: requests.Response) -> HTTPResponse:
+    """Wrap a response so a `Retry` can inspect its status and headers."""
+    return HTTPResponse(
+        body=b'',
+        headers=dict(r.headers),
+        status=r.status_code,
+        preload_content=False,
+    )
+
+
+def get_backoff(retry: Retry, response: Optional[HTTPResponse] = None) -> float:
+    """Get the time to sleep before the next attempt.
+
+    Mirrors `Retry.sleep()`, without the blocking sleep.
+    """
+    if response is not None and retry.respect_retry_after_header:
+        retry_after = retry.get_retry_after(response)
+        if retry_after:
+            return retry_after
+    return retry.get_backoff_time()
+
+
+class StreamResponse:
+    """A response whose body is read incrementally.
+
+    Args:
+        response (requests.Response): the status and headers
+        chunks (async iterator): the (decoded) body, in chunks
+        close (callable): release the connection
+    """
+
+    def __init__(
+        self,
+        response: requests.Response,
+        chunks: AsyncIterator[bytes],
+        close: Callable[[], None],
+    ) -> None:
+        self.response = response
+        self._chunks = chunks
+        self._close = close
+
+    @property
+    def status_code(self) -> int:
+        return self.response.status_code
+
+    def chunks(self) -> AsyncIterator[bytes]:
+        """Get the body, in chunks."""
+        return self._chunks
+
+    async def read(self) -> bytes:
+        """Read the whole body, and set it as the response content."""
+        self.response._content = b''.join([chunk async for chunk in self._chunks])
+        return self.response._content
+
+    def close(self) -> None:
+        """Stop reading the body, and release the connection."""
+        self._close()
+
+
+class Transport:
+    """Base class for http transports.
+
+    Provides the `headers`, `auth`, `cert`, and `verify` attributes of a
+    :py:class:`requests.Session`.
+
+    Subclasses must implement `send()`, and can implement `send_sync()`
+    and `send_stream()` (setting `supports_sync` and `supports_stream`).
+    """
+
+    #: whether `send_sync()` is implemented
+    supports_sync = False
+    #: whether `send_stream()` is implemented
+    supports_stream = False
+
+    def __init__(self) -> None:
+        self.headers: Dict[str, str] = {}
+        self.auth: Optional[Tuple[str, str]] = None
+        self.cert: Any = None
+        self.verify: Any = True
+
+    def prepare_request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Any = None,
+        data: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> requests.PreparedRequest:
+        """Encode the request the same way a `requests.Session` would.
+
+        An :py:class:`rest_tools.client.upload.UploadBody` is streamed,
+        with a `Content-Length` if its size is known, or chunked.
+        """
+        prepared = requests.Request(
+            method=method.upper(),
+            url=url,
+            headers={**self.headers, **(headers or {})},
+            params=params,
+            json=json,
+            data=data,
+            auth=self.auth,
+        ).prepare()
+        if isinstance(data, UploadBody) and data.length is not None:
+            del prepared.headers['Transfer-Encoding']
+            prepared.headers['Content-Length'] = str(data.length)
+        return prepared
+
+    async def send(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        """Send a single attempt of a prepared request."""
+        raise NotImplementedError()
+
+    def send_sync(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        """Send a single attempt of a prepared request, blocking.
+
+        With `stream=True`, the body is not read up front -- use the
+        response as a context manager to release the connection.
+        """
+        raise NotImplementedError()
+
+    async def send_stream(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        max_buffered_chunks: int = 16,
+    ) -> StreamResponse:
+        """Send a single attempt of a prepared request, and stream the body.
+
+        The `timeout` applies to connecting, and to each wait on the server.
+        """
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        """Release any resources."""
+
+
+def _delegated(name: str) -> Any:
+    """Get a property that reads and writes the wrapped transport's attribute."""
+    return property(
+        lambda self: getattr(self.transport, name),
+        lambda self, value: setattr(self.transport, name, value),
+    )
+
+
+class TransportWrapper(Transport):
+    """Base class for a transport that adds a policy to another transport.
+
+    Everything not overridden is delegated to the wrapped transport.
+
+    Args:
+        transport (Transport): the transport to wrap
+    """
+
+    supports_sync = _delegated('supports_sync')
+    supports_stream = _delegated('supports_stream')
+    headers = _delegated('headers')
+    auth = _delegated('auth')
+    cert = _delegated('cert')
+    verify = _delegated('verify')
+
+    def __init__(self, transport: Transport) -> None:  # pylint: disable=super-init-not-called
+        self.transport = transport
+
+    def prepare_request(self, *args: Any, **kwargs: Any) -> requests.PreparedRequest:
+        return self.transport.prepare_request(*args, **kwargs)
+
+    async def send(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        return await self.transport.send(prepared, timeout)
+
+    def send_sync(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        return self.transport.send_sync(prepared, timeout, stream)
+
+    async def send_stream(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        max_buffered_chunks: int = 16,
+    ) -> StreamResponse:
+        return await self.transport.send_stream(prepared, timeout, max_buffered_chunks)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class RetryTransport(TransportWrapper):
+    """Retry failed attempts, according to a `urllib3` `Retry`.
+
+    Connection errors and statuses in the `status_forcelist` are retried,
+    with backoff (or `Retry-After`). Once retries run out, the matching
+    `requests` exception is raised, as a `requests.Session` would.
+
+    Within a :py:func:`rest_tools.utils.deadline.deadline_scope`, each
+    attempt's timeout is capped by the time left, which is also sent in
+    the `X-Request-Timeout` header. There is no retry when the backoff
+    would pass the deadline: the last response is returned, or a
+    :py:class:`DeadlineExceededError` is raised.
+    Streamed responses are only retried before the body is returned.
+    A streamed request body is only retried if it can be sent again
+    (see :py:mod:`rest_tools.client.upload`).
+
+    Args:
+        transport (Transport): the transport to wrap
+        retry (Retry): the retry configuration
+    """
+
+    def __init__(self, transport: Transport, retry: Retry) -> None:
+        super().__init__(transport)
+        self.retry = retry
+
+    def _on_error(
+        self,
+        retry: Retry,
+        prepared: requests.PreparedRequest,
+        error: Exception,
+    ) -> Tuple[Retry, float]:
+        """Get the next `Retry` and backoff, or raise if out of retries."""
+        if not _replayable(prepared):
+            raise _to_requests_error_type(error)(error, request=prepared) from error
+        try:
+            retry = retry.increment(prepared.method, prepared.url, error=error)
+        except (MaxRetryError, type(error)):
+            raise _to_requests_error_type(error)(error, request=prepared) from error
+        return retry, get_backoff(retry)
+
+    def _on_response(
+        self,
+        retry: Retry,
+        prepared: requests.PreparedRequest,
+        r: requests.Response,
+    ) -> Optional[Tuple[Retry, float]]:
+        """Get the next `Retry` and backoff, or None if `r` is the final response."""
+        if r.headers.get(DEADLINE_EXCEEDED_HEADER):
+            return None  # the server gave up on the deadline, so would a retry
+        has_retry_after = bool(r.headers.get('Retry-After'))
+        if not retry.is_retry(prepared.method, r.status_code, has_retry_after):  # type: ignore[arg-type]
+            return None
+        if not _replayable(prepared):
+            return None
+        response = _to_urllib3_response(r)
+        try:
+            retry = retry.increment(prepared.method, prepared.url, response=response)
+        except MaxRetryError as e:
+            if retry.raise_on_status:
+                raise requests.exceptions.RetryError(e, request=prepared) from e
+            return None
+        return retry, get_backoff(retry, response)
+
+    def _attempt_timeout(self, prepared: requests.PreparedRequest, timeout: Optional[float]) -> Optional[float]:
+        """Get the timeout of the next attempt, capped by the deadline (if
+        any), and send the time left in the deadline header."""
+        deadline = current_deadline.get()
+        if deadline is None:
+            return timeout
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            raise DeadlineExceededError(f'deadline exceeded: {prepared.method} {prepared.url}', request=prepared)
+        prepared.headers[DEADLINE_HEADER] = f'{remaining:.3f}'
+        return remaining if timeout is None else min(timeout, remaining)
+
+    @staticmethod
+    def _out_of_time(retry: Retry, backoff: float) -> bool:
+        """Check whether the deadline leaves no time to back off and retry.
+
+        If so, the retry is not made, so its token goes back to the budget.
+        """
+        deadline = current_deadline.get()
+        if deadline is None or backoff < deadline.remaining():
+            return False
+        if isinstance(retry, RetryPolicy) and retry.budget is not None:
+            retry.budget.refund()
+        return True
+
+    def _log_retry(self, prepared: requests.PreparedRequest, retry: Retry, backoff: float) -> None:
+        LOGGER.debug('retrying %s %s in %.2fs: %r', prepared.method, prepared.url, backoff, retry)
+        info = current_request.get()
+        if info is not None:
+            info.retries += 1
+
+    async def send(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        retry = self.retry
+        while True:
+            attempt_timeout = self._attempt_timeout(prepared, timeout)
+            try:
+                r = await self.transport.send(prepared, attempt_timeout)
+            except RETRYABLE_ERRORS as e:
+                retry, backoff = self._on_error(retry, prepared, e)
+                if self._out_of_time(retry, backoff):
+                    raise DeadlineExceededError(e, request=prepared) from e
+            else:
+                nxt = self._on_response(retry, prepared, r)
+                if nxt is None or self._out_of_time(*nxt):
+                    return r
+                retry, backoff = nxt
+            self._log_retry(prepared, retry, backoff)
+            if backoff > 0:
+                await asyncio.sleep(backoff)
+
+    def send_sync(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        retry = self.retry
+        while True:
+            attempt_timeout = self._attempt_timeout(prepared, timeout)
+            try:
+                r = self.transport.send_sync(prepared, attempt_timeout, stream)
+            except RETRYABLE_ERRORS as e:
+                retry, backoff = self._on_error(retry, prepared, e)
+                if self._out_of_time(retry, backoff):
+                    raise DeadlineExceededError(e, request=prepared) from e
+            else:
+                nxt = self._on_response(retry, prepared, r)
+                if nxt is None or self._out_of_time(*nxt):
+                    return r
+                retry, backoff = nxt
+                r.close()
+            self._log_retry(prepared, retry, backoff)
+            if backoff > 0:
+                time.sleep(backoff)
+
+    async def send_stream(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        max_buffered_chunks: int = 16,
+    ) -> StreamResponse:
+        retry = self.retry
+        while True:
+            attempt_timeout = self._attempt_timeout(prepared, timeout)
+            try:
+                sr = await self.transport.send_stream(prepared, attempt_timeout, max_buffered_chunks)
+            except RETRYABLE_ERRORS as e:
+                retry, backoff = self._on_error(retry, prepared, e)
+                if self._out_of_time(retry, backoff):
+                    raise DeadlineExceededError(e, request=prepared) from e
+            else:
+                try:
+                    nxt = self._on_response(retry, prepared, sr.response)
+                except BaseException:
+                    sr.close()
+                    raise
+                if nxt is None or self._out_of_time(*nxt):
+                    return sr
+                retry, backoff = nxt
+                sr.close()
+            self._log_retry(prepared, retry, backoff)
+            if backoff > 0:
+                await asyncio.sleep(backoff)
+
+
+def _close_result(fut: 'concurrent.futures.Future[requests.Response]') -> None:
+    if not fut.cancelled() and fut.exception() is None:
+        fut.result().close()
+
+
+class RequestsTransport(Transport):
+    """A transport using `requests` sessions.
+
+    Async requests run in a thread pool, sharing one connection pool.
+    A cancelled async request returns at once, but a thread cannot be
+    interrupted, so one that has started runs to the end, and keeps its
+    concurrency limit slot until then. Sync requests from all threads
+    share one long-lived session, so calls reuse pooled (keep-alive)
+    connections, and at most `pool_maxsize` of them are kept open.
+
+    Args:
+        pool_connections (int): number of connection pools (hosts) to cache
+        pool_maxsize (int): max connections per pool --
+            default: `max_workers` for async requests (at least 10), 10 for sync requests
+        pool_block (bool): whether to block for a free connection when the pool is full
+        max_workers (int): number of worker threads for async requests
+        stats (PoolStats): (optional) record connection-pool events here
+        session (requests.Session): (optional) send all requests with this
+            session, instead of the transport's own (async requests still
+            run in the transport's thread pool)
+    """
+
+    supports_sync = True
+
+    def __init__(
+        self,
+        pool_connections: int = DEFAULT_POOLSIZE,
+        pool_maxsize: Optional[int] = None,
+        pool_block: bool = False,
+        max_workers: int = 8,
+        stats: Optional[PoolStats] = None,
+        session: Optional[requests.Session] = None,
+    ) -> None:
+        super().__init__()
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.max_workers = max_workers
+        self.stats = stats
+
+        # retries are up to the caller, so the sessions never retry
+        self._async_session = AsyncSession(
+            0, 0,
+            status_forcelist=(),
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            max_workers=max_workers,
+            stats=stats,
+        )
+        self._session = session
+        self._sync_session: Optional[requests.Session] = None
+        self._sync_session_lock = threading.Lock()
+
+    def _get_sync_session(self) -> requests.Session:
+        """Get the long-lived sync session, opening it if needed."""
+        if self._session is not None:
+            return self._session
+        with self._sync_session_lock:
+            if self._sync_session is None:
+                LOGGER.debug('establish http sync session')
+                self._sync_session = Session(
+                    0, 0,
+                    status_forcelist=(),
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize or DEFAULT_POOLSIZE,
+                    pool_block=self.pool_block,
+                    stats=self.stats,
+                )
+            return self._sync_session
+
+    def _send(
+        self,
+        session: requests.Session,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float],
+        stream: bool,
+    ) -> requests.Response:
+        settings = session.merge_environment_settings(prepared.url, {}, stream, self.verify, self.cert)
+        try:
+            return session.send(prepared, timeout=timeout, **settings)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = _from_requests_error(e)
+            if error is None:
+                raise
+            raise error from e
+
+    async def send(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        session = self._async_session if self._session is None else self._session
+        fut = self._async_session.executor.submit(self._send, session, prepared, timeout, False)
+        wrapped = asyncio.wrap_future(fut)
+        try:
+            return await asyncio.shield(wrapped)
+        except asyncio.CancelledError as e:
+            if fut.cancel():
+                raise
+            # already running, so drop its response once the thread is done
+            fut.add_done_callback(_close_result)
+            raise _CancelledInThread(fut) from e
+
+    def send_sync(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        return self._send(self._get_sync_session(), prepared, timeout, stream)
+
+    def close(self) -> None:
+        self._async_session.close()
+        if self._session is not None:
+            self._session.close()
+        with self._sync_session_lock:
+            if self._sync_session is not None:
+                self._sync_session.close()
+                self._sync_session = None
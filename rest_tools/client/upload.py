@@ -0,0 +1,99 @@
+"""Streamed request bodies, for `RestClient.upload()`.
+
+An :py:class:`UploadBody` is read in chunks while it is sent, so a body
+of any size is uploaded in constant memory, without being buffered or
+encoded first. The transports send it with a `Content-Length` when the
+size is known (a file), and with chunked transfer encoding otherwise (an
+iterator).
+
+A retry has to send the body again. Files (by path, or a seekable file
+object) are re-read from where they started. An iterator can only be
+read once, so a request with one is only retried if it failed before
+any of the body was read.
+"""
+
+# fmt:off
+
+import io
+import os
+from typing import IO, Iterable, Iterator, Optional, Union
+
+#: bytes per read, from a file
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+UploadSource = Union[str, 'os.PathLike[str]', IO[bytes], bytes, Iterable[bytes]]
+
+
+class UploadBody:
+    """A request body, read in chunks as it is sent.
+
+    Args:
+        source (str | file | bytes | iterable): a file path, a binary
+            file object, bytes, or an iterable of bytes
+        chunk_size (int): bytes per read, from a file
+    """
+
+    def __init__(self, source: UploadSource, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be at least 1: {chunk_size}")
+        self.chunk_size = chunk_size
+        self.path: Optional[str] = None
+        self.length: Optional[int] = None
+        self._file: Optional[IO[bytes]] = None
+        self._start = 0
+        self._iterable: Optional[Iterable[bytes]] = None
+        self._seekable = False
+        self._started = False
+
+        if isinstance(source, (str, os.PathLike)):
+            self.path = os.fspath(source)
+            self.length = os.path.getsize(self.path)
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            self._set_file(io.BytesIO(source))
+        elif hasattr(source, 'read'):
+            self._set_file(source)  # type: ignore[arg-type]
+        else:
+            self._iterable = source
+
+    def _set_file(self, f: IO[bytes]) -> None:
+        self._file = f
+        try:
+            self._seekable = f.seekable()
+            if self._seekable:
+                self._start = f.tell()
+                self.length = f.seek(0, io.SEEK_END) - self._start
+                f.seek(self._start)
+        except (AttributeError, OSError):
+            self._seekable = False
+
+    @property
+    def replayable(self) -> bool:
+        """Whether the body can be sent (again)."""
+        return self.path is not None or self._seekable or not self._started
+
+    def __iter__(self) -> Iterator[bytes]:
+        if not self.replayable:
+            raise ValueError("a streamed body from an iterator or pipe can only be sent once")
+        self._started = True
+        if self.path is not None:
+            with open(self.path, 'rb') as f:
+                yield from self._read(f)
+        elif self._file is not None:
+            if self._seekable:
+                self._file.seek(self._start)
+            yield from self._read(self._file)
+        else:
+            for chunk in self._iterable:  # type: ignore[union-attr]
+                if chunk:
+                    yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+    def _read(self, f: IO[bytes]) -> Iterator[bytes]:
+        while True:
+            chunk = f.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def __repr__(self) -> str:
+        source = self.path if self.path is not None else type(self._file or self._iterable).__name__
+        return f'UploadBody({source!r}, length={self.length})'
@@ -1,6 +1,5 @@
 """Utility functions for RestClient."""
 
-import asyncio
 import logging
 from typing import Any, Dict, Optional
 
@@ -33,10 +32,10 @@ async def request_and_validate(
 
     NOTE: this essentially mimics RestClient.request() with added features.
     """
-    url, kwargs = rc._prepare(method, path, args=args)
+    url, kwargs = await rc._aprepare(method, path, args=args)
 
     # run request as async in case of other dependent, concurrent actions (ex: test suite runs server in same process)
-    response = await asyncio.wrap_future(rc.session.request(method, url, **kwargs))  # type: ignore[var-annotated,arg-type]
+    response = await rc._send(method, url, kwargs)
 
     try:
         openapi_spec.validate_response(
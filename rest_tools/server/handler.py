@@ -2,6 +2,7 @@
 
 # fmt:off
 
+import asyncio
 import base64
 import functools
 import hmac
@@ -10,12 +11,13 @@ import logging
 import time
 import urllib.parse
 from collections import defaultdict
-from typing import Any, Dict, Union
+from typing import Any, Dict, Optional, Union
 
 import tornado.escape
 import tornado.gen
 import tornado.httpclient
 import tornado.httputil
+import tornado.ioloop
 import tornado.web
 from tornado.auth import OAuth2Mixin
 
@@ -24,11 +26,16 @@ from .decorators import catch_error
 from .stats import RouteStats
 from .. import telemetry as wtt
 from ..utils.auth import Auth, OpenIDAuth
+from ..utils.compression import DecompressedSizeError, decompress
+from ..utils.deadline import DEADLINE_EXCEEDED_HEADER, DEADLINE_HEADER, Deadline, current_deadline
 from ..utils.json_util import json_decode
 from ..utils.pkce import PKCEMixin
 
 LOGGER = logging.getLogger(__name__)
 
+#: default max size of a decompressed request body (tornado's default `max_body_size`)
+MAX_DECOMPRESSED_SIZE = 100 * 1024 * 1024
+
 
 def _log_auth_failed(e: Exception):
     LOGGER.info('failed auth')
@@ -91,20 +98,43 @@ def RestHandlerSetup(config={}):
         'auth_url': auth_url,
         'module_auth_key': module_auth_key,
         'server_header': config.get('server_header', 'REST'),
-        'route_stats': route_stats
+        'route_stats': route_stats,
+        'deadline_cancel': config.get('deadline_cancel', True),
+        'decompress_request': config.get('decompress_request', False),
+        'max_decompressed_size': config.get('max_decompressed_size', MAX_DECOMPRESSED_SIZE),
     }
 
 
 class RestHandler(tornado.web.RequestHandler):
-    """Default REST handler."""
+    """Default REST handler.
+
+    A client can send the time it has left for the request in the
+    `X-Request-Timeout` header (see :py:mod:`rest_tools.utils.deadline`).
+    Then the request is rejected with `504` if it cannot finish in time
+    (the deadline passed, or is sooner than the route's median time),
+    `deadline_remaining` has the time left, and the handler is cancelled
+    with `504` when the deadline passes (unless `deadline_cancel` is off).
+    These `504` responses have an `X-Deadline-Exceeded` header, so a
+    `RestClient` does not retry them. Requests made with a `RestClient`
+    while handling the request share the deadline.
+
+    With `decompress_request`, a request body with a `Content-Encoding`
+    is decoded before the handler sees it. A body that cannot be decoded
+    is rejected with `415`, and one that decodes to more than
+    `max_decompressed_size` bytes with `413`.
+    """
     def __init__(self, *args, **kwargs) -> None:
         self.server_header = ''
+        self.deadline: Optional[Deadline] = None
+        self._deadline_timer: Optional[object] = None
+        self._deadline_cancelled = False
+        self._deadline_missed = False
         try:
             super().__init__(*args, **kwargs)
         except Exception:
             LOGGER.error('error', exc_info=True)
 
-    def initialize(self, debug=False, auth=None, auth_url=None, module_auth_key='', server_header='', route_stats=None, **kwargs):
+    def initialize(self, debug=False, auth=None, auth_url=None, module_auth_key='', server_header='', route_stats=None, deadline_cancel=True, decompress_request=False, max_decompressed_size=MAX_DECOMPRESSED_SIZE, **kwargs):
         super().initialize(**kwargs)
         self.debug = debug
         self.auth = auth
@@ -114,6 +144,9 @@ class RestHandler(tornado.web.RequestHandler):
         self.module_auth_key = module_auth_key
         self.server_header = server_header
         self.route_stats = route_stats
+        self.deadline_cancel = deadline_cancel
+        self.decompress_request = decompress_request
+        self.max_decompressed_size = max_decompressed_size
 
     @wtt.spanned(
         span_namer=wtt.SpanNamer(use_this_arg='self.request.method'),
@@ -130,7 +163,69 @@ class RestHandler(tornado.web.RequestHandler):
             - `on_finish()`,
             - etc.
         """
-        return await super()._execute(*args, **kwargs)
+        try:
+            return await super()._execute(*args, **kwargs)
+        except asyncio.CancelledError:
+            if not self._deadline_cancelled:
+                raise
+            LOGGER.info('deadline exceeded, cancelled %s', self._request_summary())
+            if not self._finished:
+                self._deadline_missed = True
+                self.send_error(504, reason="deadline exceeded")
+        finally:
+            if self._deadline_timer is not None:
+                tornado.ioloop.IOLoop.current().remove_timeout(self._deadline_timer)
+                self._deadline_timer = None
+
+    @property
+    def deadline_remaining(self) -> Optional[float]:
+        """The seconds left before the client's deadline (None without one)."""
+        return None if self.deadline is None else self.deadline.remaining()
+
+    def check_deadline(self) -> None:
+        """Raise `504` if the client's deadline has passed.
+
+        Call this between the steps of long work, to stop early.
+        """
+        if self.deadline is not None and self.deadline.expired():
+            raise self._deadline_error("deadline exceeded")
+
+    def _deadline_error(self, reason: str) -> tornado.web.HTTPError:
+        """Get the `504` for a missed deadline, marked so clients do not retry it."""
+        self._deadline_missed = True
+        return tornado.web.HTTPError(504, reason=reason)
+
+    def _cancel_for_deadline(self, task: 'asyncio.Task[Any]') -> None:
+        self._deadline_timer = None
+        if not self._finished:
+            self._deadline_cancelled = True
+            task.cancel()
+
+    def _start_deadline(self) -> None:
+        """Read the client's deadline, and reject the request if it cannot finish in time."""
+        value = self.request.headers.get(DEADLINE_HEADER)
+        if not value:
+            return
+        try:
+            timeout = Deadline.parse_header(value)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason=f"invalid {DEADLINE_HEADER} header")
+        # counted from when the request arrived
+        self.deadline = Deadline(timeout, start=time.monotonic() - self.request.request_time())
+        self.check_deadline()
+        if self.route_stats is not None:
+            median = self.route_stats[self.request.path].get_median()
+            if median is not None and median > self.deadline.remaining():
+                raise self._deadline_error("deadline too soon")
+
+        # share the deadline with any requests made while handling this one
+        current_deadline.set(self.deadline)
+        if self.deadline_cancel:
+            task = asyncio.current_task()
+            if task is not None:
+                self._deadline_timer = tornado.ioloop.IOLoop.current().call_later(
+                    self.deadline.remaining(), self._cancel_for_deadline, task,
+                )
 
     def set_default_headers(self):
         self._headers['Server'] = self.server_header
@@ -179,6 +274,19 @@ class RestHandler(tornado.web.RequestHandler):
                 raise tornado.web.HTTPError(503, reason="server overloaded")
             self.start_time = time.time()
 
+        self._start_deadline()
+
+        # decode a compressed request body (tornado only does gzip, and only if enabled)
+        content_encoding = self.request.headers.get('Content-Encoding')
+        if self.decompress_request and content_encoding and self.request.body:
+            try:
+                self.request.body = decompress(self.request.body, content_encoding, max_size=self.max_decompressed_size)
+            except DecompressedSizeError:
+                raise tornado.web.HTTPError(413, reason="decoded request body is too large")
+            except ValueError:
+                raise tornado.web.HTTPError(415, reason="cannot decode request body")
+            del self.request.headers['Content-Encoding']
+
     @wtt.evented()
     def on_finish(self):
         """Cleanup after http-method request handlers."""
@@ -193,6 +301,8 @@ class RestHandler(tornado.web.RequestHandler):
             'code': status_code,
             'error': self._reason,
         }
+        if self._deadline_missed:
+            self.set_header(DEADLINE_EXCEEDED_HEADER, 'true')
         self.write(data)
         self.finish()
 
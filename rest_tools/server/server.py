@@ -47,6 +47,10 @@ class RestServer:
     def add_route(self, *args):
         self.routes.append(tuple(args))
 
+    def make_app(self):
+        """Get a :py:class:`tornado.web.Application` for the routes."""
+        return tornado.web.Application(self.routes, **self.app_args)
+
     def startup(self, address='localhost', port=8080):
         """
         Start up a Tornado server.
@@ -61,7 +65,7 @@ class RestServer:
         """
         LOGGER.warning('tornado bound to %s:%d', address, port)
 
-        app = tornado.web.Application(self.routes, **self.app_args)
+        app = self.make_app()
 
         if self.http_server:
             self.http_server.stop()
@@ -72,6 +72,12 @@ class RouteStats:
                 median = med
         return median > 0 and random.random()*median >= self.timeout
 
+    def get_median(self):
+        """Get the median call time, or None without enough data."""
+        if len(self.data) < 4:
+            return None
+        return statistics.median(self.data)
+
     def get_backoff_time(self):
         if len(self.data) < 4:
             return 1
@@ -1,11 +1,13 @@
 """Sub-package __init__."""
 
-from . import json_util
+from . import compression, deadline, json_util
 from .auth import Auth, OpenIDAuth
 from .config import from_environment
 from .daemon import Daemon
 
 __all__ = [
+    "compression",
+    "deadline",
     "json_util",
     "Auth",
     "OpenIDAuth",
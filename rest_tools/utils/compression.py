@@ -0,0 +1,165 @@
+"""HTTP content-coding (compression) utilities.
+
+`gzip` and `deflate` are always available. `zstd` needs the `zstandard`
+package, and `br` needs the `brotli` (or `brotlicffi`) package -- the
+same packages `urllib3` uses, so both backends agree on what they can
+decode.
+"""
+
+# fmt:off
+
+import zlib
+from typing import Any, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+
+def available_encodings() -> List[str]:
+    """Get the content-codings that can be decoded, in order of preference."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.extend(['gzip', 'deflate'])
+    return encodings
+
+
+#: value for an `Accept-Encoding` header, with everything that can be decoded
+ACCEPT_ENCODING = ', '.join(available_encodings())
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress `data` with a content-coding ('gzip', 'deflate', 'zstd', or 'br')."""
+    encoding = encoding.strip().lower()
+    if encoding == 'gzip':
+        # gzip.compress() embeds a timestamp, so use zlib for repeatable output
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == 'deflate':
+        return zlib.compress(data)
+    if encoding == 'zstd':
+        if zstandard is None:
+            raise ValueError("content-coding 'zstd' requires the `zstandard` package")
+        return zstandard.ZstdCompressor().compress(data)
+    if encoding == 'br':
+        if brotli is None:
+            raise ValueError("content-coding 'br' requires the `brotli` package")
+        return brotli.compress(data)
+    raise ValueError(f'unsupported content-coding: {encoding}')
+
+
+class _Decompressor:
+    """Wrap a streaming decompressor, so they all have the same API."""
+
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        self._obj: Any
+        if encoding in ('gzip', 'x-gzip'):
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._obj = zlib.decompressobj()
+            self._first = True
+        elif encoding == 'zstd' and zstandard is not None:
+            self._obj = zstandard.ZstdDecompressor().decompressobj()
+        elif encoding == 'br' and brotli is not None:
+            self._obj = brotli.Decompressor()
+        else:
+            raise ValueError(f'unsupported content-coding: {encoding}')
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.encoding == 'deflate' and self._first and data:
+            self._first = False
+            try:
+                return self._obj.decompress(data)
+            except zlib.error:
+                # some servers send raw deflate, without the zlib header
+                self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+        if self.encoding == 'br':
+            return self._obj.process(data) if hasattr(self._obj, 'process') else self._obj.decompress(data)
+        return self._obj.decompress(data)
+
+    def flush(self) -> bytes:
+        if hasattr(self._obj, 'flush'):
+            return self._obj.flush()
+        return b''
+
+
+class Decompressor:
+    """Decode a stream with the (possibly multiple) content-codings of a
+    `Content-Encoding` header.
+
+    Raises `ValueError` for an unsupported content-coding, or bad data.
+
+    Args:
+        content_encoding (str): the `Content-Encoding` header value
+    """
+
+    def __init__(self, content_encoding: str) -> None:
+        encodings = [e.strip().lower() for e in content_encoding.split(',')]
+        # codings are listed in the order they were applied, so undo them in reverse
+        self._decoders = [_Decompressor(e) for e in reversed(encodings) if e and e != 'identity']
+
+    def decompress(self, data: bytes) -> bytes:
+        """Decode the next chunk of data."""
+        try:
+            for d in self._decoders:
+                data = d.decompress(data)
+        except Exception as e:
+            raise ValueError(f'cannot decode content: {e}') from e
+        return data
+
+    def flush(self) -> bytes:
+        """Decode anything left over at the end of the stream."""
+        data = b''
+        try:
+            for d in self._decoders:
+                data = d.decompress(data) + d.flush()
+        except Exception as e:
+            raise ValueError(f'cannot decode content: {e}') from e
+        return data
+
+
+class DecompressedSizeError(ValueError):
+    """The decoded data is larger than allowed."""
+
+
+#: bytes of encoded data per step, when the decoded size is capped
+_STEP = 1024
+
+
+def decompress(data: bytes, content_encoding: str, max_size: Optional[int] = None) -> bytes:
+    """Decode `data` with the content-codings of a `Content-Encoding` header.
+
+    With `max_size`, the data is decoded a little at a time, and
+    `DecompressedSizeError` is raised as soon as the output is larger,
+    so a small but highly compressed input cannot use up the memory.
+
+    Args:
+        data (bytes): the encoded data
+        content_encoding (str): the `Content-Encoding` header value
+        max_size (int): (optional) max size of the decoded data
+    """
+    d = Decompressor(content_encoding)
+    if max_size is None:
+        return d.decompress(data) + d.flush()
+    out = []
+    size = 0
+    for i in range(0, len(data) + 1, _STEP):
+        chunk = d.decompress(data[i:i + _STEP]) if i < len(data) else d.flush()
+        size += len(chunk)
+        if size > max_size:
+            raise DecompressedSizeError(f'decoded content is larger than {max_size} bytes')
+        out.append(chunk)
+    return b''.join(out)
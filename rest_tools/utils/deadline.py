@@ -0,0 +1,87 @@
+"""Request deadlines, shared by `RestClient` and `RestHandler`.
+
+A client sends the time it has left for a request, in seconds, in the
+`X-Request-Timeout` header of each attempt. The value is relative, so
+the client and server clocks need not agree. The server can then stop
+working on requests the client has already given up on.
+
+Within a :py:func:`deadline_scope`, every request a `RestClient` makes
+shares the deadline -- including the requests a `RestHandler` makes to
+other services while handling a request with a deadline, so deadlines
+propagate end to end.
+"""
+
+# fmt:off
+
+import contextlib
+import contextvars
+import math
+import time
+from typing import Iterator, Optional, Union
+
+#: the header with the time left for a request, in seconds
+DEADLINE_HEADER = 'X-Request-Timeout'
+#: the header marking a `504` for a missed deadline, which is not worth retrying
+DEADLINE_EXCEEDED_HEADER = 'X-Deadline-Exceeded'
+
+
+class Deadline:
+    """A (monotonic) time that work must finish by.
+
+    Args:
+        timeout (float): seconds from `start` to the deadline
+        start (float): (optional) the `time.monotonic()` to count from (default: now)
+    """
+
+    def __init__(self, timeout: float, start: Optional[float] = None) -> None:
+        self.expires = (time.monotonic() if start is None else start) + timeout
+
+    def remaining(self) -> float:
+        """Get the seconds left (0 once expired)."""
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires <= time.monotonic()
+
+    def header_value(self) -> str:
+        """Get the time left, for the deadline header."""
+        return f'{self.remaining():.3f}'
+
+    @staticmethod
+    def parse_header(value: str) -> float:
+        """Parse the deadline header, raising `ValueError` if it is invalid."""
+        timeout = float(value)
+        if not math.isfinite(timeout) or timeout < 0:
+            raise ValueError(f'invalid {DEADLINE_HEADER}: {value!r}')
+        return timeout
+
+    def __repr__(self) -> str:
+        return f'Deadline(remaining={self.remaining():.3f})'
+
+
+#: the deadline of the requests being made
+current_deadline: 'contextvars.ContextVar[Optional[Deadline]]' = contextvars.ContextVar('current_deadline', default=None)
+
+
+@contextlib.contextmanager
+def deadline_scope(timeout: Union[float, Deadline, None]) -> Iterator[Optional[Deadline]]:
+    """Set the deadline for the requests made in this scope.
+
+    An enclosing deadline that is sooner still applies.
+
+    Args:
+        timeout (float | Deadline): seconds from now, or a deadline (None for no new deadline)
+
+    Returns:
+        context manager giving the deadline in effect (or None)
+    """
+    deadline = Deadline(timeout) if isinstance(timeout, (int, float)) else timeout
+    outer = current_deadline.get()
+    if deadline is None or (outer is not None and outer.expires <= deadline.expires):
+        yield outer
+        return
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
@@ -10,10 +10,16 @@ import json
 import logging
 import zlib
 from datetime import date, datetime, time
-from typing import Any, Optional, Union
+from typing import Any, Iterable, List, Optional, Union
 
 from tornado.escape import recursive_unicode
 
+try:
+    import orjson
+    _HAVE_ORJSON = True
+except ImportError:
+    _HAVE_ORJSON = False  # fall back to the stdlib json module
+
 LOGGER = logging.getLogger(__name__)
 
 
@@ -183,3 +189,27 @@ def json_encode(value: JSONType, indent: Optional[Union[int, str]] = None) -> st
 def json_decode(value: Union[str, bytes, bytearray]) -> JSONType:
     """Return Python objects for the given JSON string."""
     return json.loads(value, object_hook=JSONToObj)
+
+
+def json_decode_plain(value: Union[str, bytes, bytearray]) -> JSONType:
+    """Return Python objects for the given JSON string, without converting
+    `__jsonclass__` objects.
+
+    Faster than `json_decode`, and uses `orjson` if it is installed.
+    """
+    if _HAVE_ORJSON:
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            pass  # let the stdlib handle what orjson rejects (ex: NaN, big ints)
+    return json.loads(value)
+
+
+def json_decode_lines(lines: Iterable[Union[bytes, bytearray]], plain: bool = False) -> List[JSONType]:
+    """Return Python objects for each non-blank line of newline-delimited JSON.
+
+    Lines do not need to be stripped. Use `plain=True` when the data has
+    no `__jsonclass__` objects, to skip converting them.
+    """
+    loads = json_decode_plain if plain else json_decode
+    return [loads(line) for line in lines if line and not line.isspace()]
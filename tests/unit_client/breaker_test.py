@@ -0,0 +1,97 @@
+"""Test the per-host circuit breaker."""
+
+# fmt:quotes-ok
+
+import time
+from typing import List, Optional
+
+import pytest
+import requests
+from rest_tools.client import CircuitBreaker, CircuitOpenError, RestClient, Transport
+from rest_tools.client.breaker import get_circuit_breaker
+from urllib3.exceptions import ProtocolError
+
+
+class DownTransport(Transport):
+    """Fail every attempt, until `up` is set."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.up = False
+        self.sent: List[str] = []
+
+    async def send(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        self.sent.append(prepared.url)  # type: ignore[arg-type]
+        if not self.up:
+            raise ProtocolError('connection refused')
+        r = requests.Response()
+        r.status_code = 200
+        r._content = b'{}'
+        return r
+
+
+def test_000_states() -> None:
+    """Test the closed -> open -> half-open -> closed cycle."""
+    cb = CircuitBreaker('test', failure_threshold=0.5, window=4, min_requests=4, reset_timeout=0.1)
+    for success in (True, False, True):
+        cb.after(success, cb.before())
+    assert cb.state == 'closed'
+    cb.after(False, cb.before())
+    assert cb.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        cb.before()
+
+    time.sleep(0.1)
+    assert cb.state == 'half-open'
+    probe = cb.before()
+    assert probe
+    with pytest.raises(CircuitOpenError):
+        cb.before()  # only one probe at a time
+    cb.after(False, probe)
+    assert cb.state == 'open'
+
+    time.sleep(0.1)
+    cb.after(True, cb.before())
+    assert cb.state == 'closed'
+    assert cb.as_dict() == {'state': 'closed', 'opened': 2, 'rejected': 2, 'successes': 3, 'failures': 3}
+
+    # an abandoned probe frees its slot
+    cb._open()
+    time.sleep(0.1)
+    cb.after(None, cb.before())
+    assert cb.before()
+
+    with pytest.raises(ValueError):
+        CircuitBreaker(failure_threshold=2)
+
+
+async def test_010_client() -> None:
+    """Test that clients fail fast, and share the breaker of a host."""
+    t = DownTransport()
+    config = {'window': 4, 'min_requests': 4, 'reset_timeout': 0.2}
+    rc = RestClient("http://breaker-test-010", transport=t, retries=10, backoff_factor=0, circuit_breaker=config)
+    with pytest.raises(CircuitOpenError):
+        await rc.request('GET', '/foo')
+    # the retries stopped once the circuit opened
+    assert len(t.sent) == 4
+    assert rc.circuit_breaker is get_circuit_breaker("http://breaker-test-010/bar")
+    assert rc.circuit_breaker.state == 'open'  # type: ignore[union-attr]
+
+    rc2 = RestClient("http://breaker-test-010", transport=t, circuit_breaker=True)
+    with pytest.raises(CircuitOpenError):
+        rc2.request_seq('GET', '/foo')  # falls back to the sync transport, still checked
+    assert len(t.sent) == 4
+
+    t.up = True
+    time.sleep(0.2)
+    assert await rc2.request('GET', '/foo') == {}
+    assert rc.circuit_breaker.state == 'closed'  # type: ignore[union-attr]
+    rc.close()
+    rc2.close()
+
+    # not enabled
+    assert RestClient("http://breaker-test-010").circuit_breaker is None
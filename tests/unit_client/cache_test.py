@@ -0,0 +1,103 @@
+"""Test the RestClient response cache."""
+
+# fmt:quotes-ok
+
+import asyncio
+from typing import Dict
+
+import pytest
+from rest_tools.client import LoopbackTransport, ResponseCache, RestClient
+from rest_tools.client.cache import get_max_age, is_cacheable, parse_cache_control
+
+from .conftest import StateHandler, make_app
+
+
+class ConfigHandler(StateHandler):
+    def get(self, name: str) -> None:
+        self.state[name] = self.state.get(name, 0) + 1
+        cache_control = self.get_argument('cc', '')
+        if cache_control:
+            self.set_header('Cache-Control', cache_control)
+        # tornado adds an ETag, and answers 304 to a matching If-None-Match
+        self.write({'name': name, 'auth': self.request.headers.get('Authorization', '')})
+
+
+ROUTES = [(r'/config/(\w+)', ConfigHandler)]
+
+
+def test_000_headers() -> None:
+    """Test parsing the caching headers."""
+    assert parse_cache_control('public, max-age=60, no-transform') == {'public': None, 'max-age': '60', 'no-transform': None}
+    assert get_max_age({'Cache-Control': 'max-age=60'}) == 60
+    assert get_max_age({'Cache-Control': 'max-age=60', 'Age': '50'}) == 10
+    assert get_max_age({'Cache-Control': 'no-cache, max-age=60'}) == 0
+    assert get_max_age({'Cache-Control': 'max-age=foo'}) == 0
+    assert is_cacheable({'Cache-Control': 'max-age=60'})
+    assert is_cacheable({'ETag': '"abc"'})
+    assert not is_cacheable({'ETag': '"abc"', 'Cache-Control': 'no-store'})
+    assert not is_cacheable({})
+
+
+async def test_010_max_age() -> None:
+    """Test fresh hits, and that auth identities are kept apart."""
+    counts: Dict[str, int] = {}
+    cache = ResponseCache()
+    rc = RestClient("http://test", "token1", transport=LoopbackTransport(make_app(ROUTES, counts)), cache=cache)
+    for _ in range(3):
+        ret = await rc.request('GET', '/config/foo', {'cc': 'max-age=60'})
+        assert ret == {'name': 'foo', 'auth': 'Bearer token1'}
+    assert counts['foo'] == 1
+    assert cache.as_dict()['hits'] == 2
+
+    # cached bodies are copies
+    ret['name'] = 'bar'
+    assert (await rc.request('GET', '/config/foo', {'cc': 'max-age=60'}))['name'] == 'foo'
+
+    # a different identity does not see the other's entry
+    rc2 = RestClient("http://test", "token2", transport=LoopbackTransport(make_app(ROUTES, counts)), cache=cache)
+    ret = await rc2.request('GET', '/config/foo', {'cc': 'max-age=60'})
+    assert ret == {'name': 'foo', 'auth': 'Bearer token2'}
+    assert counts['foo'] == 2
+
+    # no-store is never cached
+    await rc.request('GET', '/config/foo', {'cc': 'no-store'})
+    await rc.request('GET', '/config/foo', {'cc': 'no-store'})
+    assert counts['foo'] == 4
+    rc.close()
+    rc2.close()
+
+
+async def test_020_revalidate() -> None:
+    """Test revalidating a stale entry with its ETag."""
+    counts: Dict[str, int] = {}
+    cache = ResponseCache()
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(ROUTES, counts)), cache=cache)
+    for _ in range(3):
+        assert await rc.request('GET', '/config/foo') == {'name': 'foo', 'auth': ''}
+    assert counts['foo'] == 3
+    stats = cache.as_dict()
+    assert stats['misses'] == 1
+    assert stats['revalidations'] == 2
+    assert stats['bytes_saved'] > 0
+
+    # sync requests share the cache
+    loop = asyncio.get_running_loop()
+    assert await loop.run_in_executor(None, rc.request_seq, 'GET', '/config/foo') == {'name': 'foo', 'auth': ''}
+    assert cache.as_dict()['revalidations'] == 3
+    rc.close()
+
+
+async def test_030_evict() -> None:
+    """Test the LRU bound."""
+    counts: Dict[str, int] = {}
+    cache = ResponseCache(max_entries=2)
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(ROUTES, counts)), cache=cache)
+    for name in ('a', 'b', 'a', 'c', 'a', 'b'):
+        await rc.request('GET', f'/config/{name}', {'cc': 'max-age=60'})
+    assert counts == {'a': 1, 'b': 2, 'c': 1}
+    assert len(cache) == 2
+    assert cache.as_dict()['evictions'] == 2
+
+    with pytest.raises(ValueError):
+        ResponseCache(max_entries=0)
+    rc.close()
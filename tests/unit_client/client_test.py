@@ -2,24 +2,30 @@
 
 # fmt:quotes-ok
 
+import asyncio
 import json
 import logging
 import re
 import signal
+import threading
+import time
 from contextlib import contextmanager
-from typing import Any, Iterable, Iterator
+from typing import Any, Iterable, Iterator, Tuple
 from unittest.mock import Mock
 
+import jwt
 import pytest
 import urllib3
 from httpretty import HTTPretty, httprettified  # type: ignore[import]
 from requests import PreparedRequest
-from requests.exceptions import SSLError, Timeout
+from requests.exceptions import HTTPError, SSLError, Timeout
 from rest_tools.client import (
     MAX_RETRIES,
     CalcRetryFromBackoffMax,
     CalcRetryFromWaittimeMax,
+    RequestsTransport,
     RestClient,
+    RetryTransport,
 )
 from rest_tools.utils.json_util import json_decode, json_encode
 
@@ -119,6 +125,112 @@ async def test_030_request(requests_mock: Mock) -> None:
     assert ret is None
 
 
+def _make_token(exp: float) -> str:
+    return jwt.encode({"exp": exp}, "a-secret-that-is-long-enough-for-hs256", algorithm="HS256")
+
+
+@pytest.mark.asyncio
+async def test_035_token_expiration(requests_mock: Mock, mocker: Any) -> None:
+    """Test the token expiration is parsed once, not on every request."""
+    tokens = [_make_token(time.time() + 2), _make_token(time.time() + 3600)]
+    token_func = Mock(side_effect=tokens)
+    rpc = RestClient("http://test", token_func, timeout=0.1)
+    requests_mock.get("/test", content=b"")
+    decode = mocker.spy(jwt, "decode")
+
+    # 1st token is within the expiration offset, so is refreshed right away
+    await rpc.request("GET", "test")
+    await rpc.request("GET", "test")
+    assert token_func.call_count == 2
+    assert rpc.access_token == tokens[1]
+
+    for _ in range(10):
+        await rpc.request("GET", "test")
+    assert token_func.call_count == 2
+    assert decode.call_count == 2  # once per acquired token
+    assert requests_mock.last_request.headers["Authorization"] == f"Bearer {tokens[1]}"
+
+    # an unreadable token is treated as expired
+    rpc.access_token = "not-a-jwt"
+    assert rpc._access_token_state == ("not-a-jwt", 0.0)
+
+
+def test_036_token_single_flight(requests_mock: Mock) -> None:
+    """Test concurrent requests share one token refresh."""
+    calls = 0
+    fail = False
+
+    def token_func() -> str:
+        nonlocal calls
+        calls += 1
+        time.sleep(0.1)  # slow token endpoint
+        if fail:
+            raise Exception("token endpoint is down")
+        return _make_token(time.time() + 3600)
+
+    rpc = RestClient("http://test", token_func, timeout=0.1)
+    requests_mock.get("/test", content=b"")
+
+    rets = rpc.request_many_seq([("GET", "test")] * 20, concurrency=20)
+    assert rets == [None] * 20
+    assert calls == 1
+
+    # expire the token, and fail the refresh: waiters share the failure
+    rpc.access_token = _make_token(time.time())
+    fail = True
+    rets = rpc.request_many_seq([("GET", "test")] * 20, concurrency=20)
+    assert all(str(r) == "token endpoint is down" for r in rets)
+    assert calls < 20
+
+    # the next request tries again
+    fail = False
+    calls = 0
+    rpc.request_seq("GET", "test")
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_037_token_renewal(requests_mock: Mock) -> None:
+    """Test background token renewal."""
+    tokens = []
+    fail = False
+
+    def token_func() -> str:
+        if fail:
+            raise Exception("token endpoint is down")
+        tokens.append(_make_token(time.time() + 8))
+        return tokens[-1]
+
+    with pytest.raises(ValueError):
+        RestClient("http://test", token_func, token_renewal=1.5)
+
+    rpc = RestClient("http://test", token_func, timeout=0.1, token_renewal=0.05)
+    requests_mock.get("/test", content=b"")
+
+    await asyncio.sleep(0.1)
+    assert len(tokens) == 1  # acquired up front
+    await rpc.request("GET", "test")
+    assert len(tokens) == 1
+
+    await asyncio.sleep(0.4)  # renewed after 5% of 8 sec
+    assert len(tokens) == 2
+    await rpc.request("GET", "test")
+    assert requests_mock.last_request.headers["Authorization"] == f"Bearer {tokens[1]}"
+
+    # a failed renewal leaves the current token in place
+    fail = True
+    await asyncio.sleep(0.4)
+    assert len(tokens) == 2
+    await rpc.request("GET", "test")
+    assert requests_mock.last_request.headers["Authorization"] == f"Bearer {tokens[1]}"
+
+    fail = False
+    rpc.close()
+    assert rpc._token_renewal_thread is not None
+    rpc._token_renewal_thread.join(timeout=1)
+    assert not rpc._token_renewal_thread.is_alive()
+
+
 @pytest.mark.asyncio
 async def test_040_request_autocalc_retries() -> None:
     """Test auto-calculated retries options in `RestClient`."""
@@ -242,6 +354,163 @@ async def test_102_request_seq(requests_mock: Mock) -> None:
         rpc.request_seq("POST", "test", {})
 
 
+def test_103_request_seq_session_reuse(requests_mock: Mock) -> None:
+    """Test `request_seq()` reuses one sync session, in every thread."""
+    rpc = RestClient("http://test", "passkey", timeout=0.1)
+    requests_mock.get("/test", content=b'{"foo": 1}')
+
+    assert isinstance(rpc.transport, RetryTransport)
+    transport = rpc.transport.transport
+    assert isinstance(transport, RequestsTransport)
+    session = transport._get_sync_session()
+    for _ in range(3):
+        assert rpc.request_seq("GET", "test") == {"foo": 1}
+        assert transport._get_sync_session() is session
+    assert requests_mock.call_count == 3
+    assert transport._async_session is not session  # the async session is untouched
+
+    # other threads share it
+    other = []
+    thread = threading.Thread(target=lambda: other.append(transport._get_sync_session()))
+    thread.start()
+    thread.join()
+    assert other[0] is session
+
+    rpc.close()
+    assert transport._sync_session is None
+    assert transport._get_sync_session() is not session
+
+
+class _InFlight:
+    """Track the max number of requests in flight at once."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.now = 0
+        self.max = 0
+
+    def response(self, req: PreparedRequest, ctx: Any) -> bytes:  # pylint: disable=W0613
+        with self.lock:
+            self.now += 1
+            self.max = max(self.max, self.now)
+        time.sleep(0.01)
+        with self.lock:
+            self.now -= 1
+        if req.path_url.endswith('/bad'):
+            ctx.status_code = 400
+            return b''
+        return json_encode({"path": req.path_url}).encode("utf-8")
+
+
+@pytest.mark.asyncio
+async def test_110_request_many(requests_mock: Mock) -> None:
+    """Test `request_many()`."""
+    rpc = RestClient("http://test", "passkey", timeout=0.1)
+    in_flight = _InFlight()
+    requests_mock.get(re.compile("/test"), content=in_flight.response)
+
+    calls = [("GET", f"/test/{i}" if i % 7 else "/test/bad") for i in range(30)]
+    rets = await rpc.request_many(iter(calls), concurrency=4)
+
+    assert len(rets) == 30
+    for i, ret in enumerate(rets):
+        if i % 7:
+            assert ret == {"path": f"/test/{i}"}
+        else:
+            assert isinstance(ret, HTTPError)
+    assert in_flight.max <= 4
+
+    with pytest.raises(ValueError):
+        await rpc.request_many(calls, concurrency=0)
+
+    # check the bound on a slow server
+    now, most = 0, 0
+
+    async def slow_request(method: str, path: str) -> str:
+        nonlocal now, most
+        now += 1
+        most = max(most, now)
+        await asyncio.sleep(0.01)
+        now -= 1
+        return path
+
+    rpc.request = slow_request  # type: ignore[assignment,method-assign]
+    assert await rpc.request_many(calls, concurrency=4) == [c[1] for c in calls]
+    assert most == 4
+
+
+@pytest.mark.asyncio
+async def test_111_request_many_as_completed(requests_mock: Mock) -> None:
+    """Test `request_many_as_completed()`."""
+    rpc = RestClient("http://test", "passkey", timeout=0.1)
+    in_flight = _InFlight()
+    requests_mock.get(re.compile("/test"), content=in_flight.response)
+
+    seen = set()
+    calls: Iterator[Tuple[Any, ...]] = (("GET", f"/test/{i}", {}, {"foo": "bar"}) for i in range(20))
+    async for i, ret in rpc.request_many_as_completed(calls, concurrency=5):
+        assert ret == {"path": f"/test/{i}"}
+        seen.add(i)
+    assert seen == set(range(20))
+    assert in_flight.max <= 5
+
+
+@pytest.mark.asyncio
+async def test_112_request_coalesce(requests_mock: Mock) -> None:
+    """Test that concurrent identical GETs share one request."""
+    requests_mock.get("/test", content=b'{"foo": [1]}')
+    requests_mock.post("/test", content=b'{"foo": [1]}')
+    rpc = RestClient("http://test", "passkey", coalesce=True)
+
+    rets = await asyncio.gather(*[rpc.request("GET", "test", {"a": 1}) for _ in range(10)])
+    assert rets == [{"foo": [1]}] * 10
+    assert requests_mock.call_count == 1
+    assert rpc.coalesced_requests == 9
+    # each caller has its own copy
+    assert len({id(r) for r in rets}) == 10
+
+    # different args, and unsafe methods, are not shared
+    await asyncio.gather(rpc.request("GET", "test", {"a": 1}), rpc.request("GET", "test", {"a": 2}))
+    assert requests_mock.call_count == 3
+    await asyncio.gather(*[rpc.request("POST", "test") for _ in range(3)])
+    assert requests_mock.call_count == 6
+
+    # cancelling one caller does not cancel the shared request
+    tasks = [asyncio.create_task(rpc.request("GET", "test")) for _ in range(2)]
+    await asyncio.sleep(0)
+    tasks[0].cancel()
+    assert await tasks[1] == {"foo": [1]}
+    assert not rpc._inflight
+    rpc.close()
+
+
+def test_120_request_many_seq(requests_mock: Mock) -> None:
+    """Test `request_many_seq()`."""
+    rpc = RestClient("http://test", "passkey", timeout=0.1)
+    in_flight = _InFlight()
+    requests_mock.get(re.compile("/test"), content=in_flight.response)
+
+    calls = [("GET", f"/test/{i}" if i % 7 else "/test/bad") for i in range(30)]
+    rets = rpc.request_many_seq(calls, concurrency=4)
+
+    assert len(rets) == 30
+    for i, ret in enumerate(rets):
+        if i % 7:
+            assert ret == {"path": f"/test/{i}"}
+        else:
+            assert isinstance(ret, HTTPError)
+    assert in_flight.max <= 4
+
+    # the threads are reused by the next call
+    pool = rpc._batch_pool
+    assert pool is not None
+    threads = set(pool._threads)
+    assert rpc.request_many_seq(calls, concurrency=4)[1] == {"path": "/test/1"}
+    assert rpc._batch_pool is pool and threads <= set(pool._threads)
+    rpc.close()
+    assert rpc._batch_pool is None
+
+
 @contextmanager
 def _in_time(time, message):  # type: ignore[no-untyped-def]
     # Based on https://github.com/gabrielfalcao/HTTPretty/blob/master/tests/functional/test_requests.py#L290."""
@@ -423,3 +692,57 @@ def test_202_request_stream() -> None:
                 for i, resp in enumerate(response_stream):
                     print(f"resp={resp}")
                     assert resp == json_stream[i]
+
+
+@httprettified  # type: ignore[misc]
+def test_203_request_stream_batches() -> None:
+    """Test `request_stream()` with `batch_size`, and `__jsonclass__` objects."""
+    mock_url = "http://test"
+    rpc = RestClient(mock_url, "passkey", timeout=1)
+
+    expected_stream = [b'{"i": %d}\n' % i for i in range(10)] + [
+        b"\n",
+        json_encode({"set": {1, 2}}).encode() + b"\n",
+    ]
+    json_stream = [{"i": i} for i in range(10)] + [{"set": {1, 2}}]
+
+    for batch_size in [1, 3, 11, 100]:
+        for chunk_size in [None, 1, 5, 1024]:
+            HTTPretty.register_uri(
+                HTTPretty.POST,
+                mock_url + "/stream/it/",
+                body=(ln for ln in expected_stream),
+                streaming=True,
+            )
+            batches = list(rpc.request_stream(
+                "POST", "/stream/it/", {}, chunk_size=chunk_size, batch_size=batch_size
+            ))
+            assert all(len(b) == batch_size for b in batches[:-1])
+            assert [x for b in batches for x in b] == json_stream
+
+    with pytest.raises(ValueError):
+        list(rpc.request_stream("POST", "/stream/it/", {}, batch_size=0))
+
+
+@httprettified  # type: ignore[misc]
+def test_204_request_stream_bad_line() -> None:
+    """Test `request_stream()` returns the results before a bad line, then raises."""
+    mock_url = "http://test"
+    rpc = RestClient(mock_url, "passkey", timeout=1)
+
+    lines = [b''.join(b'{"i": %d}\n' % i for i in range(5)) + b'{"bad\n{"i": 5}\n']
+    for batch_size in [None, 2]:
+        HTTPretty.register_uri(
+            HTTPretty.POST,
+            mock_url + "/stream/it/",
+            body=(ln for ln in lines),
+            streaming=True,
+        )
+        ret = []
+        with pytest.raises(ValueError):
+            for resp in rpc.request_stream("POST", "/stream/it/", {}, chunk_size=1024, batch_size=batch_size):
+                ret.append(resp)
+        if batch_size:
+            assert ret == [[{"i": 0}, {"i": 1}], [{"i": 2}, {"i": 3}], [{"i": 4}]]
+        else:
+            assert ret == [{"i": i} for i in range(5)]
@@ -0,0 +1,31 @@
+"""Client test fixtures."""
+
+import socket
+from typing import Any, Dict, Sequence, Tuple, Type
+
+import pytest
+import tornado.web
+
+
+class StateHandler(tornado.web.RequestHandler):
+    """A test handler, sharing a `state` dict with the test."""
+
+    def initialize(self, state: Dict[str, Any]) -> None:
+        self.state = state
+
+
+def make_app(routes: Sequence[Tuple[str, Type[StateHandler]]], state: Dict[str, Any]) -> tornado.web.Application:
+    """Make a test app of `StateHandler` routes, all sharing `state`."""
+    return tornado.web.Application([(path, handler, {'state': state}) for path, handler in routes])
+
+
+@pytest.fixture
+def port() -> int:
+    """Get an ephemeral port number."""
+    # unix.stackexchange.com/a/132524
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("", 0))
+    addr = s.getsockname()
+    ephemeral_port = addr[1]
+    s.close()
+    return ephemeral_port
@@ -0,0 +1,163 @@
+"""Test request deadlines, from RestClient to RestHandler."""
+
+# fmt:quotes-ok
+
+import asyncio
+import time
+from typing import Any, Dict
+
+import pytest
+import requests
+from rest_tools.client import DeadlineExceededError, LoopbackTransport, RestClient
+from rest_tools.server import RestHandler, RestHandlerSetup, RestServer
+from rest_tools.utils.deadline import Deadline, deadline_scope
+
+
+def make_server(state: Dict[str, Any], config: Dict[str, Any]) -> RestServer:
+    class RemainingHandler(RestHandler):
+        def prepare(self) -> None:
+            state['calls'] = state.get('calls', 0) + 1
+            super().prepare()
+
+        async def get(self) -> None:
+            self.write({'remaining': self.deadline_remaining})
+
+    class SlowHandler(RestHandler):
+        async def get(self) -> None:
+            try:
+                await asyncio.sleep(1)
+                state['finished'] = True
+            except asyncio.CancelledError:
+                state['cancelled'] = True
+                raise
+            self.write({})
+
+    class ProxyHandler(RestHandler):
+        async def get(self) -> None:
+            # a call to another service, within this request's deadline
+            rc = RestClient("http://test", transport=LoopbackTransport(state['server']))
+            ret = await rc.request('GET', '/remaining')
+            rc.close()
+            self.write({'remaining': self.deadline_remaining, 'downstream': ret['remaining']})
+
+    class BusyHandler(RestHandler):
+        async def get(self) -> None:
+            state['busy'] += 1
+            self.set_header('Retry-After', '2')
+            self.set_status(503)
+
+    server = RestServer()
+    args = RestHandlerSetup(config)
+    server.add_route(r'/remaining', RemainingHandler, args)
+    server.add_route(r'/slow', SlowHandler, args)
+    server.add_route(r'/proxy', ProxyHandler, args)
+    server.add_route(r'/busy', BusyHandler, args)
+    state['server'] = server
+    return server
+
+
+def test_000_scope() -> None:
+    """Test that a nested deadline cannot extend an outer one."""
+    with deadline_scope(10) as outer:
+        assert outer is not None
+        with deadline_scope(20) as inner:
+            assert inner is outer
+        with deadline_scope(1) as inner:
+            assert inner is not None and inner.remaining() <= 1
+        with deadline_scope(None) as inner:
+            assert inner is outer
+    with deadline_scope(None) as d:
+        assert d is None
+
+    assert Deadline.parse_header('1.5') == 1.5
+    for value in ('-1', 'nan', 'soon'):
+        with pytest.raises(ValueError):
+            Deadline.parse_header(value)
+
+
+async def test_010_remaining() -> None:
+    """Test that the server sees the time left, and shares it downstream."""
+    state: Dict[str, Any] = {}
+    rc = RestClient("http://test", transport=LoopbackTransport(make_server(state, {})))
+    assert (await rc.request('GET', '/remaining'))['remaining'] is None
+
+    ret = await rc.request('GET', '/remaining', deadline=5)
+    assert 4 < ret['remaining'] <= 5
+
+    ret = await rc.request('GET', '/proxy', deadline=5)
+    assert 4 < ret['remaining'] <= 5
+    assert ret['downstream'] == pytest.approx(ret['remaining'], abs=0.1)
+    rc.close()
+
+    rc = RestClient("http://test", transport=LoopbackTransport(make_server(state, {})), deadline=3)
+    ret = await rc.request('GET', '/remaining')
+    assert 2 < ret['remaining'] <= 3
+    rc.close()
+
+
+async def test_020_expired() -> None:
+    """Test that the client gives up, and the server stops working, at the deadline."""
+    state: Dict[str, Any] = {}
+    rc = RestClient("http://test", transport=LoopbackTransport(make_server(state, {})), backoff_factor=0.001)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        await rc.request('GET', '/slow', deadline=0.1)
+    assert time.monotonic() - start < 0.5
+    await asyncio.sleep(0.1)
+    assert state.get('cancelled')
+    assert not state.get('finished')
+
+    # a deadline that passed (or is invalid) is rejected on arrival, and not retried
+    rc.close()
+    rc = RestClient("http://test", transport=LoopbackTransport(make_server(state, {})), backoff_factor=0.001)
+    for value, status in (('0', 504), ('soon', 400)):
+        state['calls'] = 0
+        with pytest.raises(requests.exceptions.HTTPError) as exc:
+            await rc.request('GET', '/remaining', headers={'X-Request-Timeout': value})
+        assert exc.value.response.status_code == status
+        assert state['calls'] == 1
+        assert ('X-Deadline-Exceeded' in exc.value.response.headers) == (status == 504)
+    rc.close()
+
+    # without cancelling, the handler finishes
+    state.clear()
+    rc = RestClient("http://test", transport=LoopbackTransport(make_server(state, {'deadline_cancel': False})))
+    with pytest.raises(DeadlineExceededError):
+        await rc.request('GET', '/slow', deadline=0.1)
+    await asyncio.sleep(1)
+    assert state.get('finished')
+    rc.close()
+
+
+async def test_030_backoff() -> None:
+    """Test that retries stop when the backoff would pass the deadline."""
+    state: Dict[str, Any] = {'busy': 0}
+    rc = RestClient("http://test", transport=LoopbackTransport(make_server(state, {})))
+    start = time.monotonic()
+    with pytest.raises(requests.exceptions.HTTPError):
+        await rc.request('GET', '/busy', deadline=1)
+    assert time.monotonic() - start < 0.5
+    assert state['busy'] == 1
+
+    loop = asyncio.get_running_loop()
+    with pytest.raises(requests.exceptions.HTTPError):
+        await loop.run_in_executor(None, lambda: rc.request_seq('GET', '/busy', deadline=1))
+    assert state['busy'] == 2
+    rc.close()
+
+
+async def test_040_stream() -> None:
+    """Test a deadline on a streamed request."""
+    state: Dict[str, Any] = {}
+    rc = RestClient("http://test", transport=LoopbackTransport(make_server(state, {})))
+    ret = [x async for x in rc.request_stream_async('GET', '/remaining', deadline=5)]
+    assert 4 < ret[0]['remaining'] <= 5
+
+    loop = asyncio.get_running_loop()
+    ret = await loop.run_in_executor(None, lambda: list(rc.request_stream('GET', '/remaining', deadline=5)))
+    assert 4 < ret[0]['remaining'] <= 5
+
+    with pytest.raises(DeadlineExceededError):
+        async for _ in rc.request_stream_async('GET', '/slow', deadline=0.1):
+            pass
+    rc.close()
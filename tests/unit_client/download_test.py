@@ -0,0 +1,234 @@
+"""Test streamed downloads to a file or buffer."""
+
+# fmt:quotes-ok
+
+import asyncio
+import hashlib
+import io
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Generator, List, Optional, Tuple
+
+import pytest
+import pytest_asyncio
+import requests
+import tornado.httpserver
+import tornado.web
+from rest_tools.client import LoopbackTransport, RestClient
+from rest_tools.client import download
+from rest_tools.client.download import DownloadWriter, plan_segments, range_headers
+
+DATA = bytes(range(256)) * 1000
+DIGEST = hashlib.sha256(DATA).hexdigest()
+
+
+def make_app(**settings: Any) -> tornado.web.Application:
+    class Handler(tornado.web.RequestHandler):
+        async def get(self) -> None:
+            if self.get_argument('missing', ''):
+                raise tornado.web.HTTPError(404)
+            if settings.get('compress_response'):
+                # compressible, and sent at once, with the compressed Content-Length
+                self.set_header('Content-Type', 'text/plain')
+                self.write(DATA)
+                return
+            self.set_header('Content-Type', 'application/octet-stream')
+            self.set_header('Content-Length', str(len(DATA)))
+            for i in range(0, len(DATA), 50000):
+                self.write(DATA[i:i + 50000])
+                await self.flush()
+
+    class FileHandler(tornado.web.StaticFileHandler):
+        def prepare(self) -> None:
+            state = settings.get('state')
+            if state is not None:
+                state['ranges'].append(self.request.headers.get('Range', ''))
+                state['encodings'].append(self.request.headers.get('Accept-Encoding', ''))
+
+        @classmethod
+        def get_content(cls, abspath: str, start: Optional[int] = None, end: Optional[int] = None) -> Generator[bytes, None, None]:
+            state = settings.get('state')
+            if state is not None and start and state['fail'] > 0:
+                # stop part way through a range
+                state['fail'] -= 1
+                yield b''.join(super().get_content(abspath, start, end))[:1000]
+                return
+            yield from super().get_content(abspath, start, end)
+
+    return tornado.web.Application(
+        [(r'/file', Handler), (r'/static/(.*)', FileHandler, {'path': settings.pop('static_path', '.')})],
+        **{k: v for k, v in settings.items() if k != 'state'},
+    )
+
+
+@pytest.fixture
+def static(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Dict[str, Any]:
+    """Serve DATA as a static file, in segments of (at least) 10000 bytes."""
+    monkeypatch.setattr(download, 'MIN_SEGMENT_SIZE', 10000)
+    (tmp_path / 'static').mkdir()
+    (tmp_path / 'static' / 'data').write_bytes(DATA)
+    return {'static_path': str(tmp_path / 'static'), 'state': {'ranges': [], 'encodings': [], 'fail': 0}}
+
+
+@pytest_asyncio.fixture
+async def server(port: int, static: Dict[str, Any]) -> AsyncIterator[None]:
+    http_server = tornado.httpserver.HTTPServer(make_app(compress_response=True, **static))
+    http_server.listen(port, address='localhost')
+    try:
+        yield
+    finally:
+        http_server.stop()
+        await http_server.close_all_connections()
+
+
+def test_000_writer(tmp_path: Path) -> None:
+    """Test that a file only appears once it is complete."""
+    dest = tmp_path / 'out'
+    writer = DownloadWriter(dest, checksum='md5')
+    writer.start({'Content-Length': '6'})
+    writer.write(b'foo')
+    assert not dest.exists() and Path(writer.part_path).exists()
+    writer.write(b'bar')
+    ret = writer.finish()
+    assert dest.read_bytes() == b'foobar'
+    assert ret.size == 6 and ret.checksum == hashlib.md5(b'foobar').hexdigest()
+    assert not Path(writer.part_path).exists()
+
+    writer = DownloadWriter(dest)
+    writer.start({'Content-Length': '6'})
+    writer.write(b'baz')
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        writer.finish()
+    assert dest.read_bytes() == b'foobar'
+    assert not Path(writer.part_path).exists()
+
+    with pytest.raises(ValueError):
+        DownloadWriter(dest, checksum='foo')
+
+
+async def test_010_download(tmp_path: Path) -> None:
+    """Test downloading to a path and a buffer, with a checksum and progress."""
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app()))
+    progress: List[Tuple[int, Optional[int]]] = []
+
+    dest = tmp_path / 'out'
+    ret = await rc.download('/file', dest, checksum='sha256', progress=lambda n, total: progress.append((n, total)))
+    assert dest.read_bytes() == DATA
+    assert ret.size == len(DATA) and ret.checksum == DIGEST
+    assert len(progress) > 1
+    assert progress[-1] == (len(DATA), len(DATA))
+
+    buf = io.BytesIO()
+    ret = await rc.download('/file', buf)
+    assert buf.getvalue() == DATA and ret.checksum is None
+
+    loop = asyncio.get_running_loop()
+    dest = tmp_path / 'out2'
+    ret = await loop.run_in_executor(None, lambda: rc.download_seq('/file', dest, checksum='sha256', chunk_size=1000))
+    assert dest.read_bytes() == DATA and ret.checksum == DIGEST
+
+    # an error leaves no file behind
+    dest = tmp_path / 'missing'
+    with pytest.raises(requests.exceptions.HTTPError):
+        await rc.download('/file', dest, args={'missing': 'true'})
+    with pytest.raises(requests.exceptions.HTTPError):
+        await loop.run_in_executor(None, lambda: rc.download_seq('/file', dest, args={'missing': 'true'}))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['out', 'out2']
+    rc.close()
+
+
+async def test_020_backends(server: None, port: int, tmp_path: Path) -> None:
+    """Test downloading a compressed response over a socket, with each backend."""
+    for backend in ('requests', 'tornado'):
+        rc = RestClient(f"http://localhost:{port}", async_backend=backend)
+        progress: List[Tuple[int, Optional[int]]] = []
+        ret = await rc.download('/file', tmp_path / backend, checksum='sha256', progress=lambda n, total: progress.append((n, total)))
+        assert ret.size == len(DATA) and ret.checksum == DIGEST
+        assert progress[-1] == (len(DATA), None)  # the compressed size is not the total
+        rc.close()
+
+    rc = RestClient(f"http://localhost:{port}")
+    loop = asyncio.get_running_loop()
+    ret = await loop.run_in_executor(None, lambda: rc.download_seq('/file', tmp_path / 'sync', checksum='sha256'))
+    assert ret.size == len(DATA) and ret.checksum == DIGEST
+    assert ret.headers['Content-Encoding'] == 'gzip'
+    assert (tmp_path / 'sync').read_bytes() == DATA
+    rc.close()
+
+
+def test_030_plan(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test splitting a body into byte ranges."""
+    monkeypatch.setattr(download, 'MIN_SEGMENT_SIZE', 10)
+    headers = {'Accept-Ranges': 'bytes', 'Content-Length': '95'}
+    assert plan_segments(headers, 4) == [(0, 23), (24, 47), (48, 71), (72, 94)]
+    ranges = plan_segments(headers, 20)
+    assert ranges is not None and len(ranges) == 9  # segments are at least MIN_SEGMENT_SIZE
+    assert ranges[-1] == (88, 94)
+    assert plan_segments({**headers, 'Content-Length': '15'}, 4) is None  # too small to split
+    assert plan_segments({'Content-Length': '95'}, 4) is None
+    assert plan_segments({**headers, 'Content-Encoding': 'gzip'}, 4) is None
+
+    ret = range_headers({'X-Foo': 'bar'}, {'ETag': '"abc"', 'Last-Modified': 'yesterday'})
+    assert ret == {'X-Foo': 'bar', 'Accept-Encoding': 'identity', 'If-Range': '"abc"'}
+    assert range_headers(None, {'ETag': 'W/"abc"', 'Last-Modified': 'yesterday'})['If-Range'] == 'yesterday'
+    assert 'If-Range' not in range_headers(None, {})
+
+
+async def test_040_segmented(static: Dict[str, Any], tmp_path: Path) -> None:
+    """Test a download in byte ranges, resuming the ones that fail."""
+    state = static['state']
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(**static)), backoff_factor=0.001)
+    progress: List[Tuple[int, Optional[int]]] = []
+
+    dest = tmp_path / 'out'
+    ret = await rc.download('/static/data', dest, checksum='sha256', segments=4, progress=lambda n, total: progress.append((n, total)))
+    assert dest.read_bytes() == DATA
+    assert ret.size == len(DATA) and ret.checksum == DIGEST
+    assert progress[-1] == (len(DATA), len(DATA))
+    assert sorted(state['ranges']) == ['', 'bytes=0-63999', 'bytes=128000-191999', 'bytes=192000-255999', 'bytes=64000-127999']
+
+    # two ranges stop part way, and are resumed from there
+    state.update(ranges=[], fail=2)
+    ret = await rc.download('/static/data', dest, segments=4)
+    assert dest.read_bytes() == DATA
+    assert state['fail'] == 0
+    assert len(state['ranges']) == 7
+    assert sum(1 for r in state['ranges'] if r.endswith('000-127999') or r.endswith('000-191999') or r.endswith('000-255999')) == 5
+
+    # out of retries, the download fails, and leaves no file behind
+    rc.close()
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(**static)), retries=1, backoff_factor=0.001)
+    state.update(ranges=[], fail=100)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        await rc.download('/static/data', tmp_path / 'failed', segments=4)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['out', 'static']
+
+    # without Accept-Ranges, it is a single stream
+    ret = await rc.download('/file', tmp_path / 'single', segments=4)
+    assert ret.size == len(DATA) and (tmp_path / 'single').read_bytes() == DATA
+
+    with pytest.raises(ValueError):
+        await rc.download('/file', dest, segments=0)
+    rc.close()
+
+
+async def test_050_segmented_backends(server: None, port: int, static: Dict[str, Any], tmp_path: Path) -> None:
+    """Test a download in byte ranges over a socket, async and sync."""
+    state = static['state']
+    rc = RestClient(f"http://localhost:{port}", backoff_factor=0.001)
+    state['fail'] = 1
+    ret = await rc.download('/static/data', tmp_path / 'async', checksum='sha256', segments=4)
+    assert ret.size == len(DATA) and ret.checksum == DIGEST
+    assert (tmp_path / 'async').read_bytes() == DATA
+    assert state['fail'] == 0
+    # the ranges are of the raw body
+    assert all(e == 'identity' for r, e in zip(state['ranges'], state['encodings']) if r)
+
+    state.update(ranges=[], encodings=[], fail=1)
+    loop = asyncio.get_running_loop()
+    ret = await loop.run_in_executor(None, lambda: rc.download_seq('/static/data', tmp_path / 'sync', checksum='sha256', segments=4))
+    assert ret.size == len(DATA) and ret.checksum == DIGEST
+    assert (tmp_path / 'sync').read_bytes() == DATA
+    assert len(state['ranges']) == 6
+    assert state['fail'] == 0
+    assert all(e == 'identity' for r, e in zip(state['ranges'], state['encodings']) if r)
+    rc.close()
@@ -0,0 +1,140 @@
+"""Test hedged requests."""
+
+# fmt:quotes-ok
+
+import asyncio
+import time
+
+import pytest
+import tornado.httpserver
+from rest_tools.client import LoopbackTransport, RestClient
+from rest_tools.client.hedging import LatencyTracker
+
+from .conftest import StateHandler, make_app
+
+
+class Handler(StateHandler):
+    async def get(self) -> None:
+        self.state['calls'] += 1
+        if self.state['slow'] > 0:
+            # a slow replica, for the next few calls
+            self.state['slow'] -= 1
+            await asyncio.sleep(1)
+        self.write({'ok': True})
+
+    def on_connection_close(self) -> None:
+        self.state['closed'] += 1
+
+    async def post(self) -> None:
+        self.state['calls'] += 1
+        self.write({'ok': True})
+
+
+ROUTES = [(r'/', Handler)]
+
+
+def test_000_percentile() -> None:
+    """Test the latency percentiles."""
+    t = LatencyTracker()
+    for i in range(1, 101):
+        t.add('GET /', i / 100)
+    assert t.percentile('GET /', 50) == 0.5
+    assert t.percentile('GET /', 95) == 0.95
+    assert t.percentile('GET /', 100) == 1.0
+    assert t.percentile('GET /', 50, min_samples=101) is None
+    assert t.percentile('GET /other', 50) is None
+
+
+async def test_010_hedge() -> None:
+    """Test that a slow attempt is hedged, and the hedge wins."""
+    state = {'calls': 0, 'slow': 0, 'closed': 0}
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(ROUTES, state)), hedging={'min_samples': 5})
+    for _ in range(5):
+        await rc.request('GET', '/')
+    assert state['calls'] == 5
+
+    state['slow'] = 1
+    start = time.monotonic()
+    assert await rc.request('GET', '/') == {'ok': True}
+    assert time.monotonic() - start < 0.5
+    assert state['calls'] == 7
+    await asyncio.sleep(0.01)
+    assert state['closed'] == 1  # the loser was cancelled
+
+    assert rc.hedging is not None
+    assert rc.hedging.as_dict() == {'requests': 6, 'hedges': 1, 'hedges_won': 1, 'budget_exhausted': 0}
+
+    # POST is not hedged
+    await rc.request('POST', '/')
+    assert state['calls'] == 8
+    rc.close()
+
+
+async def test_020_budget() -> None:
+    """Test that hedges stay within the budget."""
+    state = {'calls': 0, 'slow': 0, 'closed': 0}
+    config = {'min_samples': 5, 'budget_ratio': 0.1, 'budget_burst': 1}
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(ROUTES, state)), hedging=config, timeout=5)
+    for _ in range(5):
+        await rc.request('GET', '/')
+
+    # two slow calls at once: only one can be hedged
+    state['slow'] = 2
+    start = time.monotonic()
+    await asyncio.gather(rc.request('GET', '/'), rc.request('GET', '/'))
+    assert time.monotonic() - start >= 1
+    assert rc.hedging.as_dict()['hedges'] == 1  # type: ignore[union-attr]
+    assert rc.hedging.as_dict()['budget_exhausted'] == 1  # type: ignore[union-attr]
+    rc.close()
+
+    assert RestClient("http://test").hedging is None
+
+
+async def test_030_requests_backend(port: int) -> None:
+    """Test that a loser in a thread keeps its concurrency slot until it is done."""
+    state = {'calls': 0, 'slow': 0, 'closed': 0}
+    http_server = tornado.httpserver.HTTPServer(make_app(ROUTES, state))
+    http_server.listen(port, address='localhost')
+    rc = RestClient(f"http://localhost:{port}", hedging={'min_samples': 5}, concurrency_limit=True)
+    try:
+        for _ in range(5):
+            await rc.request('GET', '/')
+
+        state['slow'] = 1
+        start = time.monotonic()
+        assert await rc.request('GET', '/') == {'ok': True}
+        assert time.monotonic() - start < 0.5
+        limiter = rc.concurrency_limiter
+        assert limiter is not None
+        await asyncio.sleep(0.1)  # the loser is cancelled, but its thread is still waiting
+        assert limiter.as_dict()['in_flight'] == 1
+
+        await asyncio.sleep(1.1)
+        assert limiter.as_dict()['in_flight'] == 0
+    finally:
+        rc.close()
+        http_server.stop()
+        await http_server.close_all_connections()
+
+
+async def test_040_cancel(port: int) -> None:
+    """Test that a cancelled request returns at once, and its slot is kept until its thread is done."""
+    state = {'calls': 0, 'slow': 1, 'closed': 0}
+    http_server = tornado.httpserver.HTTPServer(make_app(ROUTES, state))
+    http_server.listen(port, address='localhost')
+    rc = RestClient(f"http://localhost:{port}", concurrency_limit=True)
+    try:
+        start = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(rc.request('GET', '/'), 0.3)
+        assert time.monotonic() - start < 0.6
+        limiter = rc.concurrency_limiter
+        assert limiter is not None
+        assert limiter.as_dict()['in_flight'] == 1
+
+        await asyncio.sleep(1)
+        assert limiter.as_dict()['in_flight'] == 0
+    finally:
+        rc.close()
+        http_server.stop()
+        await http_server.close_all_connections()
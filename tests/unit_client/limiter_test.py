@@ -0,0 +1,123 @@
+"""Test the adaptive concurrency limiter."""
+
+# fmt:quotes-ok
+
+import asyncio
+import threading
+import time
+from typing import Dict
+
+import pytest
+import tornado.web
+from rest_tools.client import AdaptiveLimiter, LoopbackTransport, RestClient
+
+
+def test_000_aimd() -> None:
+    """Test the additive increase, and multiplicative decrease."""
+    lim = AdaptiveLimiter(initial_limit=10, min_limit=2, max_limit=12, latency_tolerance=0)
+    early = lim.acquire()
+    start = lim.acquire()
+    lim.release(start, overloaded=True)
+    assert lim.limit == 5
+    # signals from attempts started before the decrease are ignored
+    lim.release(early, overloaded=True)
+    assert lim.limit == 5
+
+    for _ in range(6):
+        lim.release(lim.acquire(), overloaded=False)
+    assert lim.limit == 6
+    lim.release(lim.acquire(), overloaded=None)  # other errors are neutral
+    assert lim.as_dict()['increases'] == 6
+
+    for _ in range(5):
+        lim.release(lim.acquire(), overloaded=True)
+    assert lim.limit == 2
+
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(initial_limit=10, max_limit=5)
+
+
+def test_001_latency() -> None:
+    """Test that latency growth on a route is an overload signal."""
+    lim = AdaptiveLimiter(initial_limit=10, latency_tolerance=2.0)
+    now = time.monotonic()
+    lim.acquire()
+    lim.release(now - 0.01, overloaded=False, route='GET /a')
+    lim.acquire()
+    lim.release(now - 0.5, overloaded=False, route='GET /b')  # another route is not compared
+    assert lim.limit == 10
+    lim.acquire()
+    lim.release(now - 0.05, overloaded=False, route='GET /a')
+    assert lim.limit == 5
+
+
+def test_002_blocking() -> None:
+    """Test that threads wait for a slot."""
+    lim = AdaptiveLimiter(initial_limit=2, max_limit=2, latency_tolerance=0)
+
+    def run() -> None:
+        start = lim.acquire()
+        time.sleep(0.01)
+        lim.release(start, overloaded=False)
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert lim.as_dict()['max_in_flight'] == 2
+    assert lim.in_flight == 0
+
+
+async def test_010_async() -> None:
+    """Test that coroutines wait for a slot, and can be cancelled while waiting."""
+    lim = AdaptiveLimiter(initial_limit=2, max_limit=2, latency_tolerance=0)
+
+    async def run() -> None:
+        start = await lim.acquire_async()
+        await asyncio.sleep(0.01)
+        lim.release(start, overloaded=False)
+
+    await asyncio.gather(*[run() for _ in range(8)])
+    assert lim.as_dict()['max_in_flight'] == 2
+
+    starts = [await lim.acquire_async() for _ in range(2)]
+    task = asyncio.create_task(lim.acquire_async())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    for start in starts:
+        lim.release(start)
+    assert lim.in_flight == 0
+    assert await lim.acquire_async()
+
+
+async def test_020_client() -> None:
+    """Test that a client backs off from an overloaded server."""
+    state: Dict[str, int] = {'now': 0, 'max': 0, '503': 0}
+
+    class Handler(tornado.web.RequestHandler):
+        async def get(self) -> None:
+            if state['now'] >= 4:
+                state['503'] += 1
+                self.set_header('Retry-After', '0')
+                raise tornado.web.HTTPError(503)
+            state['now'] += 1
+            state['max'] = max(state['max'], state['now'])
+            await asyncio.sleep(0.01)
+            state['now'] -= 1
+            self.write({})
+
+    app = tornado.web.Application([(r'/', Handler)])
+    rc = RestClient("http://test", transport=LoopbackTransport(app), backoff_factor=0.001,
+                    concurrency_limit={'initial_limit': 16, 'latency_tolerance': 0})
+    assert await rc.request_many([('GET', '/')] * 100, concurrency=50) == [{}] * 100
+    assert state['503'] > 0
+    lim = rc.concurrency_limiter
+    assert lim is not None
+    assert lim.as_dict()['decreases'] > 0
+    assert lim.limit < 16
+    rc.close()
+
+    assert RestClient("http://test").concurrency_limiter is None
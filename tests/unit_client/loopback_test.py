@@ -0,0 +1,133 @@
+"""Test RestClient with the in-process loopback transport."""
+
+# fmt:quotes-ok
+
+import asyncio
+from typing import Any, Dict
+
+import pytest
+import requests
+import tornado.web
+from rest_tools.client import LoopbackTransport, RestClient
+from rest_tools.server import RestHandler, RestHandlerSetup, RestServer, authenticated
+from rest_tools.utils.auth import Auth
+
+SECRET = 'secret' * 11
+
+
+def make_server(counts: Dict[str, Any]) -> RestServer:
+    """Make a server with a few routes, without starting it."""
+    class EchoHandler(RestHandler):
+        @authenticated
+        async def get(self) -> None:
+            self.write({
+                'args': {k: self.get_argument(k) for k in self.request.arguments},
+                'sub': self.current_user,
+                'remote_ip': self.request.remote_ip,
+            })
+
+        @authenticated
+        async def post(self) -> None:
+            self.write({'body': self.json_body_arguments})
+
+    class SlowHandler(RestHandler):
+        async def get(self) -> None:
+            await asyncio.sleep(1)
+            self.write({})
+
+        def on_connection_close(self) -> None:
+            counts['closed'] = True
+
+    class StreamHandler(RestHandler):
+        async def get(self) -> None:
+            num = int(self.get_argument('num', '10'))
+            for i in range(num):
+                self.write(f'{{"i": {i}}}\n')
+                await self.flush()
+                counts['stream_sent'] = i + 1
+
+    server = RestServer()
+    args = RestHandlerSetup({'auth': {'secret': SECRET}})
+    server.add_route(r'/echo', EchoHandler, args)
+    server.add_route(r'/slow', SlowHandler, args)
+    server.add_route(r'/stream', StreamHandler, args)
+    return server
+
+
+@pytest.fixture
+def counts() -> Dict[str, Any]:
+    return {}
+
+
+@pytest.fixture
+def token() -> str:
+    return Auth(SECRET).create_token('me')
+
+
+async def test_010_request(counts: Dict[str, Any], token: str) -> None:
+    """Test `async request()` through the application."""
+    rc = RestClient("http://loopback", token, transport=LoopbackTransport(make_server(counts)))
+    ret = await rc.request('GET', '/echo', {'foo': 'bar'})
+    assert ret == {'args': {'foo': 'bar'}, 'sub': 'me', 'remote_ip': '127.0.0.1'}
+    assert await rc.request('POST', '/echo', {'foo': [1, 2]}) == {'body': {'foo': [1, 2]}}
+
+    rets = await asyncio.gather(*[rc.request('POST', '/echo', {'i': i}) for i in range(50)])
+    assert [r['body']['i'] for r in rets] == list(range(50))
+    rc.close()
+
+
+async def test_011_errors(counts: Dict[str, Any], token: str) -> None:
+    """Test error statuses, and timeouts."""
+    rc = RestClient("http://loopback", "bad-token", transport=LoopbackTransport(make_server(counts)))
+    with pytest.raises(requests.exceptions.HTTPError) as e:
+        await rc.request('GET', '/echo')
+    assert e.value.response.status_code == 403
+
+    with pytest.raises(requests.exceptions.HTTPError) as e:
+        await rc.request('GET', '/does-not-exist')
+    assert e.value.response.status_code == 404
+
+    rc = RestClient("http://loopback", transport=LoopbackTransport(make_server(counts)), timeout=0.1, retries=0)
+    with pytest.raises(requests.exceptions.Timeout):
+        await rc.request('GET', '/slow')
+    assert counts['closed']
+    rc.close()
+
+
+def test_020_request_seq(counts: Dict[str, Any], token: str) -> None:
+    """Test sync requests, with no event loop running."""
+    rc = RestClient("http://loopback", token, transport=LoopbackTransport(make_server(counts)))
+    assert rc.request_seq('GET', '/echo', {'foo': 'bar'})['sub'] == 'me'
+    assert list(rc.request_stream('GET', '/stream', {'num': 3})) == [{'i': 0}, {'i': 1}, {'i': 2}]
+    rc.close()
+
+
+async def test_021_request_seq_other_thread(counts: Dict[str, Any], token: str) -> None:
+    """Test sync requests from another thread, run on the application's event loop."""
+    app = tornado.web.Application(make_server(counts).routes)
+    rc = RestClient("http://loopback", token, transport=LoopbackTransport(app))
+    await rc.request('GET', '/echo')
+    loop = asyncio.get_running_loop()
+    ret = await loop.run_in_executor(None, rc.request_seq, 'GET', '/echo')
+    assert ret['sub'] == 'me'
+
+    with pytest.raises(RuntimeError):
+        rc.request_seq('GET', '/echo')
+    rc.close()
+
+
+async def test_030_stream(counts: Dict[str, Any]) -> None:
+    """Test `request_stream_async()`, with backpressure on the handler."""
+    rc = RestClient("http://loopback", transport=LoopbackTransport(make_server(counts)))
+    ret = [r async for r in rc.request_stream_async('GET', '/stream', {'num': 10})]
+    assert ret == [{'i': i} for i in range(10)]
+
+    ret = []
+    async for r in rc.request_stream_async('GET', '/stream', {'num': 1000}, max_buffered_chunks=1):
+        ret.append(r['i'])
+        if len(ret) == 5:
+            await asyncio.sleep(0.1)
+            assert counts['stream_sent'] < 10
+            break
+    assert ret == list(range(5))
+    rc.close()
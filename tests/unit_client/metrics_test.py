@@ -0,0 +1,154 @@
+"""Test the client request hooks and metrics."""
+
+# fmt:quotes-ok
+
+import asyncio
+import json
+from typing import List
+
+import pytest
+import requests
+import tornado.web
+from rest_tools.client import ClientMetrics, LoopbackTransport, RequestInfo, RestClient
+from rest_tools.client.metrics import Histogram, path_template
+
+from .conftest import StateHandler, make_app
+
+
+class Handler(StateHandler):
+    async def get(self, name: str) -> None:
+        if self.state['fail'] > 0:
+            self.state['fail'] -= 1
+            self.set_header('Retry-After', '0')
+            raise tornado.web.HTTPError(503)
+        if name == 'missing':
+            raise tornado.web.HTTPError(404)
+        self.write({'name': name})
+
+
+ROUTES = [(r'/items/(\w+)', Handler)]
+
+
+def test_000_path_template() -> None:
+    """Test that id-like path segments are templated."""
+    assert path_template('/items/1234') == '/items/{id}'
+    assert path_template('items/1234/files?x=1') == '/items/{id}/files'
+    assert path_template('/items/0123456789abcdef0123') == '/items/{id}'
+    assert path_template('/items/6f1c2d3e-4a5b-6c7d-8e9f-0a1b2c3d4e5f') == '/items/{id}'
+    assert path_template('/items/abc') == '/items/abc'
+
+
+def test_001_histogram() -> None:
+    """Test the histogram percentiles."""
+    h = Histogram([1, 2, 5, 10])
+    assert h.percentile(50) is None
+    for v in (0.5, 1.5, 1.5, 4, 20):
+        h.add(v)
+    assert h.percentile(50) == 2
+    assert h.percentile(80) == 5
+    assert h.percentile(100) == 20
+    d = h.as_dict()
+    assert d['count'] == 5
+    assert d['min'] == 0.5 and d['max'] == 20
+    assert d['buckets'] == [(1, 1), (2, 2), (5, 1), (10, 0), ('+Inf', 1)]
+
+
+async def test_010_hooks() -> None:
+    """Test that the hooks see each request."""
+    state = {'fail': 0}
+    started: List[RequestInfo] = []
+    ended: List[RequestInfo] = []
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(ROUTES, state)),
+                    on_request_start=started.append, on_request_end=ended.append)
+
+    assert await rc.request('GET', '/items/abc') == {'name': 'abc'}
+    assert len(started) == 1 and started[0] is ended[0]
+    info = ended[0]
+    assert info.method == 'GET'
+    assert info.route == '/items/abc'
+    assert info.status == 200
+    assert info.response_size == len(json.dumps({'name': 'abc'}))
+    assert info.duration > 0
+    assert info.error is None
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        await rc.request('GET', '/items/missing')
+    assert ended[-1].status == 404
+    assert isinstance(ended[-1].error, requests.exceptions.HTTPError)
+
+    # a broken hook does not break the request
+    def broken(info: RequestInfo) -> None:
+        raise Exception('broken')
+    rc.on_request_end = broken
+    assert await rc.request('GET', '/items/abc') == {'name': 'abc'}
+    rc.close()
+
+
+async def test_020_metrics() -> None:
+    """Test the per-route metrics, with retries, coalescing, and sync requests."""
+    state = {'fail': 0}
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(ROUTES, state)),
+                    metrics=True, coalesce=True, backoff_factor=0.001)
+    assert rc.metrics is not None
+
+    await rc.request('GET', '/items/1')
+    state['fail'] = 2
+    await rc.request('GET', '/items/2')
+    await asyncio.gather(rc.request('GET', '/items/3'), rc.request('GET', '/items/3'))
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, rc.request_seq, 'GET', '/items/4')
+
+    snap = rc.metrics.snapshot()
+    assert list(snap) == ['GET /items/{id}']
+    route = snap['GET /items/{id}']
+    assert route['latency']['count'] == 5
+    assert route['sources'] == {'network': 4, 'coalesced': 1}
+    assert route['statuses'] == {'200': 4}
+    assert route['retries']['count'] == 4
+    assert route['retries']['sum'] == 2
+    assert route['response_size']['count'] == 4
+    json.dumps(snap, allow_nan=False)  # plain data
+
+    rc.metrics.reset()
+    assert rc.metrics.snapshot() == {}
+    rc.close()
+
+    # a shared instance
+    metrics = ClientMetrics()
+    assert RestClient("http://test", metrics=metrics).metrics is metrics
+    assert RestClient("http://test").metrics is None
+
+
+async def test_030_stream() -> None:
+    """Test that streamed requests are tracked to the end of the stream."""
+    state = {'fail': 1}
+    ended: List[RequestInfo] = []
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(ROUTES, state)),
+                    on_request_end=ended.append, metrics=True, backoff_factor=0.001)
+    assert rc.metrics is not None
+
+    assert [x async for x in rc.request_stream_async('GET', '/items/abc')] == [{'name': 'abc'}]
+    info = ended[-1]
+    assert info.status == 200 and info.retries == 1 and info.error is None
+    assert info.response_size == len(json.dumps({'name': 'abc'}))
+
+    loop = asyncio.get_running_loop()
+    ret = await loop.run_in_executor(None, lambda: list(rc.request_stream('GET', '/items/abc')))
+    assert ret == [{'name': 'abc'}]
+    assert len(ended) == 2 and ended[-1].status == 200
+
+    # closed early by the caller, which is not an error
+    stream = rc.request_stream_async('GET', '/items/abc')
+    await stream.__anext__()
+    await stream.aclose()
+    assert len(ended) == 3 and ended[-1].error is None
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        async for _ in rc.request_stream_async('GET', '/items/missing'):
+            pass
+    assert ended[-1].status == 404
+
+    route = rc.metrics.snapshot()['GET /items/abc']
+    assert route['latency']['count'] == 3
+    assert route['statuses'] == {'200': 3}
+    rc.close()
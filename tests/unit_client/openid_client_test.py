@@ -0,0 +1,193 @@
+"""Test token acquisition for OpenIDRestClient and ClientCredentialsAuth."""
+
+# fmt:quotes-ok
+
+import asyncio
+import threading
+import time
+import urllib.parse
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Union
+
+import jwt
+import pytest
+import pytest_asyncio
+import requests
+import tornado.httpserver
+import tornado.web
+from rest_tools.client import ClientCredentialsAuth, OpenIDRestClient, RestClient
+from rest_tools.utils.json_util import json_encode
+
+
+def _make_token(exp: float) -> str:
+    return jwt.encode({"exp": exp}, "a-secret-that-is-long-enough-for-hs256", algorithm="HS256")
+
+
+@pytest_asyncio.fixture
+async def server(port: int) -> AsyncIterator[Dict[str, List[Any]]]:
+    """Start up a token service + an API that echoes the auth header."""
+    calls: Dict[str, List[Any]] = {'token': [], 'api': []}
+    address = f'http://localhost:{port}'
+
+    class WellKnownHandler(tornado.web.RequestHandler):
+        def get(self) -> None:
+            self.write({'token_endpoint': f'{address}/token', 'jwks_uri': f'{address}/jwks'})
+
+    class JWKSHandler(tornado.web.RequestHandler):
+        def get(self) -> None:
+            self.write({'keys': []})
+
+    class TokenHandler(tornado.web.RequestHandler):
+        async def post(self) -> None:
+            args = urllib.parse.parse_qs(self.request.body.decode())
+            calls['token'].append(args)
+            await asyncio.sleep(0.1)  # slow token service
+            if args['client_id'][0] != 'client-id':
+                self.set_status(400)
+                self.write({'error': 'invalid_client'})
+                return
+            self.write({
+                'access_token': _make_token(time.time() + 3600),
+                'refresh_token': f'refresh-{len(calls["token"])}',
+            })
+
+    class APIHandler(tornado.web.RequestHandler):
+        def get(self) -> None:
+            calls['api'].append(self.request.headers['Authorization'])
+            self.write(json_encode({}))
+
+    app = tornado.web.Application([
+        (r'/.well-known/openid-configuration', WellKnownHandler),
+        (r'/jwks', JWKSHandler),
+        (r'/token', TokenHandler),
+        (r'/api', APIHandler),
+    ])
+    http_server = tornado.httpserver.HTTPServer(app)
+    http_server.listen(port, address='localhost')
+    try:
+        yield calls
+    finally:
+        http_server.stop()
+        await http_server.close_all_connections()
+
+
+async def _in_thread(func: Any) -> Any:
+    # blocking setup calls must not block the server's event loop
+    return await asyncio.get_running_loop().run_in_executor(None, func)
+
+
+async def test_010_client_credentials(server: Dict[str, List[Any]], port: int, mocker: Any) -> None:
+    """Test `ClientCredentialsAuth` acquires tokens without blocking the event loop."""
+    address = f'http://localhost:{port}'
+    rc = await _in_thread(lambda: ClientCredentialsAuth(address, address, 'client-id', 'secret'))
+    assert not server['token']
+
+    # the token request goes through `requests` (for its proxy and CA settings), in a thread
+    threads = []
+    post = requests.post
+
+    def spy(*args: Any, **kwargs: Any) -> requests.Response:
+        threads.append(threading.current_thread())
+        return post(*args, **kwargs)
+
+    mocker.patch.object(requests, 'post', spy)
+    await asyncio.gather(*[rc.request('GET', '/api') for _ in range(10)])
+    assert len(server['token']) == 1  # one shared refresh
+    assert server['token'][0]['grant_type'] == ['client_credentials']
+    assert len(set(server['api'])) == 1
+    assert len(threads) == 1 and threads[0] is not threading.current_thread()
+    rc.close()
+
+
+async def test_011_client_credentials_error(server: Dict[str, List[Any]], port: int) -> None:
+    """Test a failed async token request."""
+    address = f'http://localhost:{port}'
+    rc = await _in_thread(lambda: ClientCredentialsAuth(address, address, 'bad-id', 'secret'))
+    with pytest.raises(Exception, match='Token request failed: invalid_client'):
+        await rc.request('GET', '/api')
+    rc.close()
+
+
+async def test_020_openid(server: Dict[str, List[Any]], port: int) -> None:
+    """Test `OpenIDRestClient` refreshes tokens asynchronously."""
+    address = f'http://localhost:{port}'
+    updates = []
+    rc = await _in_thread(lambda: OpenIDRestClient(
+        address, address, 'refresh-0', 'client-id',
+        update_func=lambda access, refresh: updates.append(refresh),
+    ))
+    assert len(server['token']) == 1  # initial check
+    assert rc.access_token  # (is kept)
+
+    await rc.request('GET', '/api')
+    assert len(server['token']) == 1
+
+    rc.access_token = _make_token(time.time() - 1)  # expired
+    await asyncio.gather(*[rc.request('GET', '/api') for _ in range(10)])
+    assert len(server['token']) == 2
+    assert server['token'][1]['refresh_token'] == ['refresh-1']
+    assert rc.refresh_token == 'refresh-2'
+    assert updates == ['refresh-1', 'refresh-2']
+    rc.close()
+
+
+async def test_021_openid_renewal(server: Dict[str, List[Any]], port: int) -> None:
+    """Test the background renewal does not race the initial token request."""
+    address = f'http://localhost:{port}'
+    rc = await _in_thread(lambda: OpenIDRestClient(address, address, 'refresh-0', 'client-id', token_renewal=0.5))
+    await asyncio.sleep(0.3)
+    assert [c['refresh_token'] for c in server['token']] == [['refresh-0']]
+    assert rc._token_renewal_thread is not None and rc._token_renewal_thread.is_alive()
+    rc.close()
+
+
+async def test_022_openid_sync_and_async(server: Dict[str, List[Any]], port: int) -> None:
+    """Test sync and async refreshes share one grant, and never reuse a refresh token."""
+    address = f'http://localhost:{port}'
+    rc = await _in_thread(lambda: OpenIDRestClient(address, address, 'refresh-0', 'client-id'))
+    rc.access_token = _make_token(time.time() - 1)  # expired
+    await asyncio.gather(
+        _in_thread(lambda: rc.request_seq('GET', '/api')),
+        *[rc.request('GET', '/api') for _ in range(5)],
+        _in_thread(lambda: rc.request_seq('GET', '/api')),
+    )
+    sent = [c['refresh_token'][0] for c in server['token']]
+    assert sent == ['refresh-0', 'refresh-1']
+    assert len(set(server['api'])) == 1
+    rc.close()
+
+
+async def test_030_token_func_does_not_block(server: Dict[str, List[Any]], port: int) -> None:
+    """Test sync and async token functions don't block the event loop."""
+    address = f'http://localhost:{port}'
+    ticks = 0
+
+    async def ticker() -> None:
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    def sync_token() -> str:
+        time.sleep(0.2)
+        return _make_token(time.time() + 3600)
+
+    async def async_token() -> str:
+        await asyncio.sleep(0.2)
+        return _make_token(time.time() + 3600)
+
+    token_funcs: List[Union[Callable[[], str], Callable[[], Awaitable[str]]]] = [sync_token, async_token]
+    for token_func in token_funcs:
+        rc = RestClient(address, token_func)
+        ticks = 0
+        task = asyncio.create_task(ticker())
+        await asyncio.gather(*[rc.request('GET', '/api') for _ in range(5)])
+        task.cancel()
+        assert ticks >= 10
+        rc.close()
+
+    # an async token function also works for sync requests
+    rc = RestClient(address, async_token)
+    await _in_thread(lambda: rc.request_seq('GET', '/api'))
+    assert isinstance(rc.access_token, str)
+    assert server['api'][-1] == f'Bearer {rc.access_token}'
+    rc.close()
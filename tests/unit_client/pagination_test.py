@@ -0,0 +1,136 @@
+"""Test the paginated iterator."""
+
+# fmt:quotes-ok
+
+import asyncio
+import time
+from typing import Any, Dict, List
+
+import pytest
+import requests
+import tornado.web
+from rest_tools.client import (
+    CursorPagination,
+    LinkHeaderPagination,
+    LoopbackTransport,
+    OffsetPagination,
+    RestClient,
+)
+
+from .conftest import StateHandler, make_app
+
+ITEMS = list(range(25))
+
+
+class Base(StateHandler):
+    async def prepare(self) -> None:
+        self.state['requests'] += 1
+        self.state['in_flight'] += 1
+        self.state['max_in_flight'] = max(self.state['max_in_flight'], self.state['in_flight'])
+        await asyncio.sleep(self.state['delay'])
+        self.state['in_flight'] -= 1
+
+
+class Offset(Base):
+    def get(self) -> None:
+        offset = int(self.get_argument('offset'))
+        limit = int(self.get_argument('limit'))
+        self.write({'results': ITEMS[offset:offset + limit], 'total': len(ITEMS)})
+
+
+class Cursor(Base):
+    def get(self) -> None:
+        start = int(self.get_argument('cursor', '0'))
+        if start == 20:
+            raise tornado.web.HTTPError(404)
+        ret: Dict[str, Any] = {'results': ITEMS[start:start + 10]}
+        if start + 10 < self.state['end']:
+            ret['next'] = str(start + 10)
+        self.write(ret)
+
+
+class Link(Base):
+    def get(self) -> None:
+        page = int(self.get_argument('page', '0'))
+        if (page + 1) * 10 < len(ITEMS):
+            self.set_header('Link', f'</link?page={page + 1}>; rel="next", </link?page=0>; rel="first"')
+        self.set_header('Content-Type', 'application/json')
+        self.write(tornado.escape.json_encode(ITEMS[page * 10:(page + 1) * 10]))
+
+
+ROUTES = [(r'/offset', Offset), (r'/cursor', Cursor), (r'/link', Link)]
+
+
+def new_state(delay: float = 0) -> Dict[str, Any]:
+    return {'requests': 0, 'in_flight': 0, 'max_in_flight': 0, 'delay': delay, 'end': 20}
+
+
+async def collect(rc: RestClient, path: str, pagination: Any, **kwargs: Any) -> List[Any]:
+    return [item async for item in rc.paginate(path, pagination, **kwargs)]
+
+
+async def test_010_strategies() -> None:
+    """Test each pagination strategy."""
+    state = new_state()
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(ROUTES, state)))
+
+    assert await collect(rc, '/offset', OffsetPagination(limit=10)) == ITEMS
+    assert await collect(rc, '/offset', OffsetPagination(limit=10), args={'offset': 5}) == ITEMS[5:]
+    assert await collect(rc, '/cursor', CursorPagination()) == ITEMS[:20]
+    assert await collect(rc, '/link', LinkHeaderPagination()) == ITEMS
+
+    # the total stops the offsets without a short page
+    state['requests'] = 0
+    assert await collect(rc, '/offset', OffsetPagination(limit=5, total_key='total'), lookahead=0) == ITEMS
+    assert state['requests'] == 5
+    rc.close()
+
+
+async def test_020_prefetch() -> None:
+    """Test that pages are prefetched while the caller is busy."""
+    state = new_state(delay=0.05)
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(ROUTES, state)))
+
+    async def consume(lookahead: int) -> float:
+        start = time.monotonic()
+        async for item in rc.paginate('/cursor', CursorPagination(), lookahead=lookahead):
+            if item % 10 == 0:
+                await asyncio.sleep(0.05)  # busy with a page
+        return time.monotonic() - start
+
+    sequential = await consume(0)
+    prefetched = await consume(1)
+    assert prefetched < sequential - 0.03
+    assert state['max_in_flight'] == 1
+
+    # offset pages are fetched concurrently, up to the lookahead
+    state['max_in_flight'] = 0
+    assert await collect(rc, '/offset', OffsetPagination(limit=5), lookahead=3) == ITEMS
+    assert state['max_in_flight'] == 4
+    rc.close()
+
+
+async def test_030_errors() -> None:
+    """Test that an error from a page is raised to the caller."""
+    state = new_state()
+    state['end'] = 30
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(ROUTES, state)))
+    items = []
+    with pytest.raises(requests.exceptions.HTTPError):
+        async for item in rc.paginate('/cursor', CursorPagination(), lookahead=2):
+            items.append(item)
+    assert items == ITEMS[:20]
+
+    # a broken strategy is raised too
+    with pytest.raises(KeyError):
+        await collect(rc, '/cursor', CursorPagination(items_key='missing'))
+
+    # breaking out stops the prefetching
+    async for item in rc.paginate('/offset', OffsetPagination(limit=1), lookahead=2):
+        break
+    await asyncio.sleep(0.01)
+    assert state['in_flight'] == 0
+
+    with pytest.raises(ValueError):
+        await collect(rc, '/offset', OffsetPagination(), lookahead=-1)
+    rc.close()
@@ -0,0 +1,135 @@
+"""Test the retry policy and budget."""
+
+# fmt:quotes-ok
+
+import pytest
+import requests
+import tornado.web
+from requests.adapters import HTTPAdapter
+from rest_tools.client import LoopbackTransport, RestClient, RetryBudget
+from rest_tools.client.retry import get_retry_budget, make_retry
+from rest_tools.client.session import AsyncSession, Session
+from rest_tools.utils.deadline import deadline_scope
+from urllib3.exceptions import MaxRetryError
+from urllib3.response import HTTPResponse
+
+from .conftest import StateHandler, make_app
+
+
+class Handler(StateHandler):
+    def get(self) -> None:
+        self.state['calls'] += 1
+        raise tornado.web.HTTPError(self.state['status'])
+
+    def post(self) -> None:
+        self.get()
+
+
+ROUTES = [(r'/', Handler)]
+
+
+def test_000_jitter() -> None:
+    """Test the decorrelated jitter, capped by the exponential backoff."""
+    for _ in range(20):
+        retry = make_retry(10, 0.1)
+        backoffs = []
+        for _ in range(6):
+            retry = retry.increment('GET', '/', response=HTTPResponse(status=503))
+            backoffs.append(retry.get_backoff_time())
+        assert backoffs[0] == 0
+        for i, backoff in enumerate(backoffs[1:], start=1):
+            assert 0.1 <= backoff <= 0.1 * 2 ** i
+        # the same attempt always gets the same backoff
+        assert retry.get_backoff_time() == backoffs[-1]
+
+    retry = make_retry(10, 0.1, jitter=False)
+    for _ in range(3):
+        retry = retry.increment('GET', '/', response=HTTPResponse(status=503))
+    assert retry.get_backoff_time() == pytest.approx(0.4)
+
+
+def test_001_rules() -> None:
+    """Test the per-method and per-status rules."""
+    retry = make_retry(10, 0)
+    assert retry.is_retry('GET', 500)
+    assert not retry.is_retry('POST', 500)
+    assert retry.is_retry('POST', 503)
+    assert not retry.is_retry('POST', 200)
+
+    retry = make_retry(10, 0, status_retries={500: 1})
+    retry = retry.increment('GET', '/', response=HTTPResponse(status=500))
+    with pytest.raises(MaxRetryError, match='too many 500'):
+        retry.increment('GET', '/', response=HTTPResponse(status=500))
+    retry = retry.increment('GET', '/', response=HTTPResponse(status=503))  # other statuses are not capped
+
+    retry = make_retry(10, 0, method_retries={'PUT': 2})
+    for _ in range(2):
+        retry = retry.increment('PUT', '/', response=HTTPResponse(status=503))
+    with pytest.raises(MaxRetryError, match='too many retries of PUT'):
+        retry.increment('PUT', '/', response=HTTPResponse(status=503))
+
+    # the session factories keep retrying POST, as before
+    for session in (AsyncSession(10, 0), Session(10, 0)):
+        adapter = session.get_adapter('http://test')
+        assert isinstance(adapter, HTTPAdapter)
+        assert adapter.max_retries.is_retry('POST', 500)
+        session.close()
+
+
+def test_002_budget() -> None:
+    """Test the token bucket."""
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+    assert budget.as_dict() == {'tokens': 0, 'successes': 2, 'retries': 2, 'denied': 2}
+
+    assert get_retry_budget() is get_retry_budget()
+    with pytest.raises(ValueError):
+        RetryBudget(max_tokens=0)
+
+
+async def test_010_client() -> None:
+    """Test the policy and budget in a client."""
+    state = {'calls': 0, 'status': 500}
+    transport = LoopbackTransport(make_app(ROUTES, state))
+    rc = RestClient("http://test", transport=transport, retries=2, backoff_factor=0.001)
+
+    # POST is not retried after it may have been processed
+    with pytest.raises(requests.exceptions.HTTPError):
+        await rc.request('POST', '/')
+    assert state['calls'] == 1
+    state['status'] = 503
+    with pytest.raises(requests.exceptions.RetryError):
+        await rc.request('POST', '/')
+    assert state['calls'] == 4
+    rc.close()
+
+    # the budget stops the retries
+    state['calls'] = 0
+    budget = RetryBudget(min_per_second=0, max_tokens=1)
+    rc = RestClient("http://test", transport=transport, retries=5, backoff_factor=0.001, retry_budget=budget)
+    assert rc.retry_budget is budget
+    with pytest.raises(requests.exceptions.RetryError, match='budget'):
+        await rc.request('GET', '/')
+    assert state['calls'] == 2
+    assert budget.as_dict()['denied'] == 1
+    rc.close()
+
+    # a retry skipped for the deadline does not spend the budget
+    state['calls'] = 0
+    budget = RetryBudget(min_per_second=0, max_tokens=5)
+    rc = RestClient("http://test", transport=transport, retries=5, backoff_factor=10, retry_budget=budget)
+    with deadline_scope(5):
+        with pytest.raises(requests.exceptions.HTTPError):
+            await rc.request('GET', '/')
+    assert state['calls'] == 2
+    assert budget.as_dict() == {'tokens': 4, 'successes': 0, 'retries': 1, 'denied': 0}
+    rc.close()
+
+    rc = RestClient("http://test", retry_budget=True, retry_policy={'status_retries': {500: 1}})
+    assert rc.retry_budget is get_retry_budget()
+    assert rc.retry_policy.status_retries == {500: 1}
@@ -0,0 +1,80 @@
+"""Test connection-pool sizing and counters."""
+
+# fmt:quotes-ok
+
+import asyncio
+from typing import AsyncIterator
+
+import pytest_asyncio
+import tornado.httpserver
+import tornado.web
+from requests.adapters import HTTPAdapter
+from rest_tools.client import AsyncSession, PoolStats, RestClient, Session
+from rest_tools.client.session import StatsHTTPAdapter
+
+
+@pytest_asyncio.fixture
+async def server(port: int) -> AsyncIterator[None]:
+    """Start up a plain tornado server."""
+
+    class SlowHandler(tornado.web.RequestHandler):
+        async def get(self) -> None:
+            await asyncio.sleep(0.05)
+            self.write({})
+
+    http_server = tornado.httpserver.HTTPServer(tornado.web.Application([(r'/slow', SlowHandler)]))
+    http_server.listen(port, address='localhost')
+    try:
+        yield
+    finally:
+        http_server.stop()
+        await http_server.close_all_connections()
+
+
+def test_000_sizing() -> None:
+    """Test pool sizing options."""
+    session = Session(0, 0, pool_maxsize=3, pool_block=True)
+    adapter = session.get_adapter('http://test')
+    assert type(adapter) is HTTPAdapter
+    assert adapter._pool_maxsize == 3  # type: ignore[attr-defined]
+    assert adapter._pool_block  # type: ignore[attr-defined]
+
+    session = AsyncSession(0, 0, max_workers=20, stats=PoolStats())
+    adapter = session.get_adapter('http://test')
+    assert isinstance(adapter, StatsHTTPAdapter)
+    assert adapter._pool_maxsize == 20  # defaults to the number of workers
+    assert session.executor._max_workers == 20
+    session.close()
+
+
+async def test_010_async_stats(server: None, port: int) -> None:
+    """Test counters for a saturated connection pool."""
+    rc = RestClient(f"http://localhost:{port}", pool_maxsize=2, pool_block=True, max_workers=4)
+    await asyncio.gather(*[rc.request('GET', '/slow') for _ in range(12)])
+
+    stats = rc.pool_stats.as_dict()
+    assert stats['connections_opened'] == 2
+    assert stats['connections_reused'] == 10
+    assert stats['connections_discarded'] == 0
+    assert stats['pool_waits'] > 0
+    assert stats['pool_wait_time'] > 0
+    assert stats['max_waiting'] == 2  # 4 workers, 2 connections
+    assert stats['max_queued'] > 0
+    assert stats['waiting'] == 0 and stats['queued'] == 0
+    rc.close()
+
+
+async def test_020_sync_stats(server: None, port: int) -> None:
+    """Test counters for sequential requests."""
+    rc = RestClient(f"http://localhost:{port}")
+
+    def run() -> None:
+        for _ in range(3):
+            rc.request_seq('GET', '/slow')
+
+    await asyncio.get_running_loop().run_in_executor(None, run)
+    stats = rc.pool_stats.as_dict()
+    assert stats['connections_opened'] == 1
+    assert stats['connections_reused'] == 2
+    assert stats['pool_waits'] == 0
+    rc.close()
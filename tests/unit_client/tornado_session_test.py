@@ -0,0 +1,308 @@
+"""Test RestClient with the asyncio-native tornado backend."""
+
+# fmt:quotes-ok
+
+import asyncio
+from typing import AsyncIterator, Dict
+
+import pytest
+import pytest_asyncio
+import requests
+import tornado.httpserver
+import tornado.web
+from rest_tools.client import RestClient, RetryTransport, TornadoTransport
+from rest_tools.server import RestHandler
+from rest_tools.utils.compression import ACCEPT_ENCODING, compress
+from rest_tools.utils.json_util import json_decode, json_encode
+
+
+@pytest_asyncio.fixture
+async def server(port: int) -> AsyncIterator[Dict[str, int]]:
+    """Start up a plain tornado server, and count the calls per route."""
+    counts: Dict[str, int] = {}
+
+    class EchoHandler(tornado.web.RequestHandler):
+        def get(self) -> None:
+            counts['echo'] = counts.get('echo', 0) + 1
+            self.write(json_encode({
+                'args': {k: self.get_argument(k) for k in self.request.arguments},
+                'auth': self.request.headers.get('Authorization', ''),
+            }))
+
+        def post(self) -> None:
+            counts['echo'] = counts.get('echo', 0) + 1
+            self.write(json_encode({'body': json_decode(self.request.body)}))
+
+    class FlakyHandler(tornado.web.RequestHandler):
+        def get(self) -> None:
+            counts['flaky'] = counts.get('flaky', 0) + 1
+            if counts['flaky'] < 3:
+                raise tornado.web.HTTPError(503)
+            self.write({'ok': True})
+
+    class SlowHandler(tornado.web.RequestHandler):
+        async def get(self) -> None:
+            counts['slow'] = counts.get('slow', 0) + 1
+            await asyncio.sleep(1)
+            self.write({})
+
+    class StreamHandler(tornado.web.RequestHandler):
+        async def get(self) -> None:
+            counts['stream'] = counts.get('stream', 0) + 1
+            num = int(self.get_argument('num', '10'))
+            size = int(self.get_argument('size', '0'))
+            for i in range(num):
+                # split lines across writes, and add blank lines
+                line = json_encode({'i': i, 'pad': 'x' * size}) + '\n\n'
+                self.write(line[:5])
+                await self.flush()
+                self.write(line[5:])
+                await self.flush()
+                counts['stream_sent'] = i + 1
+            self.write('"last"')
+
+    class RedirectHandler(tornado.web.RequestHandler):
+        def get(self) -> None:
+            counts['redirect'] = counts.get('redirect', 0) + 1
+            self.redirect(f"/stream?num={self.get_argument('num')}")
+
+        def post(self) -> None:
+            self.redirect('/echo', status=303)
+
+    class CompressedHandler(RestHandler):
+        def prepare(self) -> None:
+            counts['content_encoding'] = self.request.headers.get('Content-Encoding', '')  # type: ignore[assignment]
+            super().prepare()
+
+        def get(self) -> None:
+            counts['accept_encoding'] = self.request.headers.get('Accept-Encoding', '')  # type: ignore[assignment]
+            self.set_header('Content-Encoding', 'deflate')
+            self.write(compress(json_encode({'foo': 'bar'}).encode(), 'deflate'))
+
+        def post(self) -> None:
+            if 'Content-Encoding' in self.request.headers:
+                self.write({'encoded': True})  # not decoded
+                return
+            self.write({'body': self.json_body_arguments})
+
+    app = tornado.web.Application([
+        (r'/echo', EchoHandler),
+        (r'/flaky', FlakyHandler),
+        (r'/slow', SlowHandler),
+        (r'/stream', StreamHandler),
+        (r'/redirect', RedirectHandler),
+        (r'/compressed', CompressedHandler, {'decompress_request': True, 'max_decompressed_size': 10000}),
+        (r'/compressed-off', CompressedHandler),
+    ])
+    http_server = tornado.httpserver.HTTPServer(app)
+    http_server.listen(port, address='localhost')
+    try:
+        yield counts
+    finally:
+        http_server.stop()
+        await http_server.close_all_connections()
+
+
+async def test_000_backend_choice() -> None:
+    """Test choosing the async backend."""
+    rc = RestClient("http://test", "passkey", async_backend='tornado')
+    assert isinstance(rc.transport, RetryTransport)
+    assert isinstance(rc.transport.transport, TornadoTransport)
+    rc.close()
+
+    with pytest.raises(ValueError):
+        RestClient("http://test", "passkey", async_backend='foo')
+
+
+async def test_010_request(server: Dict[str, int], port: int) -> None:
+    """Test `async request()` with GET and POST."""
+    rc = RestClient(f"http://localhost:{port}", "passkey", async_backend='tornado')
+
+    ret = await rc.request('GET', '/echo', {'foo': 'bar'})
+    assert ret == {'args': {'foo': 'bar'}, 'auth': 'Bearer passkey'}
+
+    ret = await rc.request('POST', '/echo', {'foo': [1, 2]})
+    assert ret == {'body': {'foo': [1, 2]}}
+    assert server['echo'] == 2
+    rc.close()
+
+
+async def test_011_concurrent(server: Dict[str, int], port: int) -> None:
+    """Test many concurrent requests on one event loop."""
+    rc = RestClient(f"http://localhost:{port}", async_backend='tornado')
+    rets = await asyncio.gather(*[rc.request('POST', '/echo', {'i': i}) for i in range(100)])
+    assert [r['body']['i'] for r in rets] == list(range(100))
+    rc.close()
+
+
+async def test_020_retry(server: Dict[str, int], port: int) -> None:
+    """Test retries on a status in the forcelist."""
+    rc = RestClient(f"http://localhost:{port}", async_backend='tornado', backoff_factor=0.01)
+    assert await rc.request('GET', '/flaky') == {'ok': True}
+    assert server['flaky'] == 3
+    rc.close()
+
+
+async def test_021_retries_exhausted(server: Dict[str, int], port: int) -> None:
+    """Test running out of retries on a status in the forcelist."""
+    rc = RestClient(f"http://localhost:{port}", async_backend='tornado', retries=1, backoff_factor=0.01)
+    with pytest.raises(requests.exceptions.RetryError):
+        await rc.request('GET', '/flaky')
+    assert server['flaky'] == 2
+    rc.close()
+
+
+async def test_030_http_error(server: Dict[str, int], port: int) -> None:
+    """Test a non-retried error status."""
+    rc = RestClient(f"http://localhost:{port}", async_backend='tornado')
+    with pytest.raises(requests.exceptions.HTTPError) as e:
+        await rc.request('GET', '/does-not-exist')
+    assert e.value.response.status_code == 404
+    rc.close()
+
+
+async def test_031_timeout(server: Dict[str, int], port: int) -> None:
+    """Test a timeout, with retries."""
+    rc = RestClient(f"http://localhost:{port}", async_backend='tornado', timeout=0.1, retries=1, backoff_factor=0.01)
+    with pytest.raises(requests.exceptions.Timeout):
+        await rc.request('GET', '/slow')
+    assert server['slow'] == 2
+    rc.close()
+
+
+async def test_032_connection_error(port: int) -> None:
+    """Test a connection error (no server)."""
+    rc = RestClient(f"http://localhost:{port}", async_backend='tornado', retries=1, backoff_factor=0.01)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        await rc.request('GET', '/echo')
+    rc.close()
+
+
+async def test_040_cancel(server: Dict[str, int], port: int) -> None:
+    """Test cancelling an in-flight request."""
+    rc = RestClient(f"http://localhost:{port}", async_backend='tornado')
+    task = asyncio.create_task(rc.request('GET', '/slow'))
+    await asyncio.sleep(0.2)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    rc.close()
+
+
+async def test_041_loops(server: Dict[str, int], port: int) -> None:
+    """Test sharing a transport with an event loop in another thread."""
+    rc = RestClient(f"http://localhost:{port}", async_backend='tornado')
+    assert isinstance(rc.transport, RetryTransport)
+    transport = rc.transport.transport
+    assert isinstance(transport, TornadoTransport)
+    task = asyncio.create_task(rc.request('GET', '/slow'))
+    await asyncio.sleep(0.2)
+    clients = transport._loop_clients()
+
+    # does not close the clients of this loop
+    ret = await asyncio.get_running_loop().run_in_executor(None, lambda: asyncio.run(rc.request('GET', '/echo')))
+    assert ret == {'args': {}, 'auth': ''}
+    assert await task == {}
+    assert server['slow'] == 1
+    assert transport._loop_clients() is clients
+    assert not clients.client._closed
+    rc.close()
+    assert clients.client._closed
+
+
+@pytest.mark.parametrize('backend', ['requests', 'tornado'])
+async def test_050_stream(server: Dict[str, int], port: int, backend: str) -> None:
+    """Test `request_stream_async()`."""
+    rc = RestClient(f"http://localhost:{port}", "passkey", async_backend=backend)
+    ret = [r async for r in rc.request_stream_async('GET', '/stream', {'num': 10})]
+    assert ret == [{'i': i, 'pad': ''} for i in range(10)] + ['last']
+
+    ret = [r async for r in rc.request_stream_async('GET', '/stream', {'num': 10}, batch_size=4)]
+    assert [len(b) for b in ret] == [4, 4, 3]
+    assert [x for b in ret for x in b] == [{'i': i, 'pad': ''} for i in range(10)] + ['last']
+    rc.close()
+
+
+async def test_051_stream_error(server: Dict[str, int], port: int) -> None:
+    """Test `request_stream_async()` with an error status, and retries."""
+    rc = RestClient(f"http://localhost:{port}", retries=1, backoff_factor=0.01)
+    with pytest.raises(requests.exceptions.HTTPError) as e:
+        async for _ in rc.request_stream_async('GET', '/does-not-exist'):
+            pass
+    assert e.value.response.status_code == 404
+
+    with pytest.raises(requests.exceptions.RetryError):
+        async for _ in rc.request_stream_async('GET', '/flaky'):
+            pass
+    assert [r async for r in rc.request_stream_async('GET', '/flaky')] == [{'ok': True}]
+    assert server['flaky'] == 3
+    rc.close()
+
+
+async def test_052_stream_connection_error(port: int) -> None:
+    """Test `request_stream_async()` with no server."""
+    rc = RestClient(f"http://localhost:{port}", retries=1, backoff_factor=0.01)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        async for _ in rc.request_stream_async('GET', '/stream'):
+            pass
+    rc.close()
+
+
+async def test_053_stream_backpressure(server: Dict[str, int], port: int) -> None:
+    """Test that a slow consumer pauses the server, and can stop early."""
+    rc = RestClient(f"http://localhost:{port}")
+    args = {'num': 1000, 'size': 100000}
+    ret = []
+    async for r in rc.request_stream_async('GET', '/stream', args, max_buffered_chunks=1):
+        ret.append(r['i'])
+        if len(ret) == 5:
+            await asyncio.sleep(0.5)
+            # only a bounded amount is read ahead (plus socket buffers)
+            assert server['stream_sent'] < 100
+            break
+    assert ret == list(range(5))
+    rc.close()
+
+
+async def test_054_stream_redirect(server: Dict[str, int], port: int) -> None:
+    """Test that `request_stream_async()` follows redirects."""
+    rc = RestClient(f"http://localhost:{port}", "passkey", async_backend='tornado')
+    ret = [r async for r in rc.request_stream_async('GET', '/redirect', {'num': 3})]
+    assert ret == [{'i': i, 'pad': ''} for i in range(3)] + ['last']
+    assert server['redirect'] == 1
+
+    # a 303 is followed with a GET
+    ret = [r async for r in rc.request_stream_async('POST', '/redirect', {'foo': 'bar'})]
+    assert ret == [{'args': {}, 'auth': 'Bearer passkey'}]
+    rc.close()
+
+
+@pytest.mark.parametrize('backend', ['requests', 'tornado'])
+async def test_060_compression(server: Dict[str, int], port: int, backend: str) -> None:
+    """Test request body compression, and response decompression."""
+    rc = RestClient(f"http://localhost:{port}", async_backend=backend, compression='gzip', compression_threshold=100)
+
+    assert await rc.request('POST', '/compressed', {'foo': 'bar'}) == {'body': {'foo': 'bar'}}
+    assert server['content_encoding'] == ''  # below the threshold
+
+    big = {'foo': 'x' * 1000}
+    assert await rc.request('POST', '/compressed', big) == {'body': big}
+    assert server['content_encoding'] == 'gzip'
+    loop = asyncio.get_running_loop()
+    assert await loop.run_in_executor(None, rc.request_seq, 'POST', '/compressed', big) == {'body': big}
+
+    assert await rc.request('GET', '/compressed') == {'foo': 'bar'}
+    assert server['accept_encoding'] == ACCEPT_ENCODING
+    assert await loop.run_in_executor(None, rc.request_seq, 'GET', '/compressed') == {'foo': 'bar'}
+
+    # decoding is capped
+    with pytest.raises(requests.exceptions.HTTPError) as e:
+        await rc.request('POST', '/compressed', {'foo': 'x' * 20000})
+    assert e.value.response.status_code == 413
+
+    # and opt-in
+    assert await rc.request('POST', '/compressed-off', big) == {'encoded': True}
+    rc.close()
+
+    with pytest.raises(ValueError):
+        RestClient("http://test", compression='foo')
@@ -0,0 +1,165 @@
+"""Test the pluggable transports."""
+
+# fmt:quotes-ok
+
+import asyncio
+import os
+import threading
+from typing import List, Optional
+from unittest.mock import Mock
+
+import pytest
+import requests
+import tornado.httpserver
+import tornado.web
+from rest_tools.client import RequestsTransport, RestClient, RetryTransport, Transport, TransportWrapper
+from rest_tools.client.transport import make_retry
+from rest_tools.utils.json_util import json_encode
+from urllib3.exceptions import ProtocolError
+
+
+class FakeTransport(Transport):
+    """Answer every request with the next status in a list."""
+
+    def __init__(self, statuses: List[int]) -> None:
+        super().__init__()
+        self.statuses = statuses
+        self.sent: List[requests.PreparedRequest] = []
+
+    async def send(
+        self,
+        prepared: requests.PreparedRequest,
+        timeout: Optional[float] = None,
+    ) -> requests.Response:
+        self.sent.append(prepared)
+        status = self.statuses.pop(0)
+        if status == 0:
+            raise ProtocolError('connection reset')
+        r = requests.Response()
+        r.status_code = status
+        r.url = prepared.url  # type: ignore[assignment]
+        r.request = prepared
+        r._content = json_encode({'url': prepared.url}).encode()
+        return r
+
+
+async def test_000_custom_transport() -> None:
+    """Test a custom transport, with the client's headers and retries."""
+    t = FakeTransport([503, 0, 200])
+    rc = RestClient("http://test", "passkey", transport=t, backoff_factor=0.01)
+    assert isinstance(rc.transport, RetryTransport)
+    assert rc.transport.transport is t
+
+    assert await rc.request('GET', '/foo') == {'url': 'http://test/foo'}
+    assert len(t.sent) == 3
+    assert t.sent[0].headers['Authorization'] == 'Bearer passkey'
+    rc.close()
+
+
+async def test_001_custom_transport_errors() -> None:
+    """Test running out of retries with a custom transport."""
+    rc = RestClient("http://test", transport=FakeTransport([0, 0]), retries=1, backoff_factor=0.01)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        await rc.request('GET', '/foo')
+
+    rc = RestClient("http://test", transport=FakeTransport([503, 503]), retries=1, backoff_factor=0.01)
+    with pytest.raises(requests.exceptions.RetryError):
+        await rc.request('GET', '/foo')
+
+    rc = RestClient("http://test", transport=FakeTransport([404]))
+    with pytest.raises(requests.exceptions.HTTPError):
+        await rc.request('GET', '/foo')
+
+
+def test_002_session_compat() -> None:
+    """Test the deprecated `session` attribute."""
+    rc = RestClient("http://test", "passkey", username='user', password='pass')
+    with pytest.warns(DeprecationWarning):
+        session = rc.session
+    assert isinstance(session, requests.Session)
+    assert session.headers['Content-Type'] == 'application/json'
+    assert session.auth == ('user', 'pass')
+    with pytest.warns(DeprecationWarning):
+        assert rc.session is session
+
+    # open() still gives a session
+    with pytest.warns(DeprecationWarning):
+        session = rc.open(sync=True)
+    assert type(session) is requests.Session
+    assert session.auth == ('user', 'pass')
+    assert rc.open_transport() is rc.transport
+    rc.close()
+
+
+def test_003_session_setter(requests_mock: Mock) -> None:
+    """Test that assigning the deprecated `session` sends requests with it."""
+    requests_mock.get('/foo', content=b'{"foo": "bar"}')
+    rc = RestClient("http://test", "passkey")
+    session = requests.Session()
+    session.headers['X-Foo'] = 'bar'
+    with pytest.warns(DeprecationWarning):
+        rc.session = session
+    assert isinstance(rc.transport, RetryTransport)
+    assert isinstance(rc.transport.transport, RequestsTransport)
+    assert rc.transport.transport._get_sync_session() is session
+
+    assert rc.request_seq('GET', '/foo') == {'foo': 'bar'}
+    assert requests_mock.last_request.headers['X-Foo'] == 'bar'
+    assert requests_mock.last_request.headers['Authorization'] == 'Bearer passkey'
+    with pytest.warns(DeprecationWarning):
+        assert rc.session is session
+    rc.close()
+
+
+def test_010_sync_fallback(requests_mock: Mock) -> None:
+    """Test sync requests falling back to `requests`, for an async-only transport."""
+    requests_mock.get('/foo', content=b'{"foo": "bar"}')
+    rc = RestClient("http://test", "passkey", transport=FakeTransport([]))
+    assert rc.request_seq('GET', '/foo') == {'foo': 'bar'}
+    sync = rc.open_transport(sync=True)
+    assert isinstance(sync, RetryTransport)
+    assert isinstance(sync.transport, RequestsTransport)
+    assert requests_mock.last_request.headers['Authorization'] == 'Bearer passkey'
+    rc.close()
+
+
+def test_020_wrapper() -> None:
+    """Test that a wrapper delegates attributes to the wrapped transport."""
+    t = RequestsTransport()
+    w = TransportWrapper(RetryTransport(t, make_retry(1, 0)))
+    assert w.supports_sync and not w.supports_stream
+    w.headers = {'foo': 'bar'}
+    assert t.headers == {'foo': 'bar'}
+    assert w.prepare_request('GET', 'http://test/').headers['foo'] == 'bar'
+    w.close()
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc')
+async def test_030_sync_threads(port: int) -> None:
+    """Test that sync requests from short-lived threads do not pile up sessions."""
+    class Handler(tornado.web.RequestHandler):
+        def get(self) -> None:
+            self.write({'ok': True})
+
+    http_server = tornado.httpserver.HTTPServer(tornado.web.Application([(r'/', Handler)]))
+    http_server.listen(port, address='localhost')
+    rc = RestClient(f"http://localhost:{port}")
+
+    def batch() -> None:
+        threads = [threading.Thread(target=rc.request_seq, args=('GET', '/')) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, batch)
+        fds = len(os.listdir('/proc/self/fd'))
+        for _ in range(10):
+            await loop.run_in_executor(None, batch)
+        assert len(os.listdir('/proc/self/fd')) <= fds + 10  # at most a full pool more
+    finally:
+        rc.close()
+        http_server.stop()
+        await http_server.close_all_connections()
@@ -0,0 +1,180 @@
+"""Test streamed request-body uploads."""
+
+# fmt:quotes-ok
+
+import asyncio
+import hashlib
+import io
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator
+
+import pytest
+import pytest_asyncio
+import requests
+import tornado.httpserver
+import tornado.web
+from rest_tools.client import LoopbackTransport, RestClient, UploadBody
+
+from .conftest import StateHandler, make_app
+
+DATA = bytes(range(256)) * 1000
+
+
+@tornado.web.stream_request_body
+class Handler(StateHandler):
+    def prepare(self) -> None:
+        self.state['calls'] += 1
+        self.state['chunks'] = 0
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def data_received(self, chunk: bytes) -> None:
+        self.state['chunks'] += 1
+        self.digest.update(chunk)
+        self.size += len(chunk)
+
+    def put(self) -> None:
+        if self.state['fail'] > 0:
+            self.state['fail'] -= 1
+            raise tornado.web.HTTPError(503)
+        self.write({
+            'size': self.size,
+            'sha256': self.digest.hexdigest(),
+            'name': self.get_argument('name', ''),
+            'auth': self.request.headers.get('Authorization', ''),
+            'type': self.request.headers.get('Content-Type', ''),
+            'length': self.request.headers.get('Content-Length', ''),
+        })
+
+    post = put
+
+
+ROUTES = [(r'/upload', Handler)]
+
+
+def new_state(fail: int = 0) -> Dict[str, Any]:
+    return {'calls': 0, 'chunks': 0, 'fail': fail}
+
+
+def chunks() -> Iterator[bytes]:
+    for i in range(0, len(DATA), 10000):
+        yield DATA[i:i + 10000]
+
+
+@pytest.fixture
+def data_file(tmp_path: Path) -> Path:
+    path = tmp_path / 'data'
+    path.write_bytes(DATA)
+    return path
+
+
+@pytest_asyncio.fixture
+async def server(port: int) -> AsyncIterator[Dict[str, Any]]:
+    state = new_state()
+    http_server = tornado.httpserver.HTTPServer(make_app(ROUTES, state))
+    http_server.listen(port, address='localhost')
+    try:
+        yield state
+    finally:
+        http_server.stop()
+        await http_server.close_all_connections()
+
+
+def test_000_body(data_file: Path) -> None:
+    """Test reading each kind of source."""
+    body = UploadBody(data_file, chunk_size=1000)
+    assert body.length == len(DATA)
+    assert [len(c) for c in body][:2] == [1000, 1000]
+    assert body.replayable
+    assert b''.join(body) == DATA
+
+    f = io.BytesIO(DATA)
+    f.seek(100)
+    body = UploadBody(f)
+    assert body.length == len(DATA) - 100
+    assert b''.join(body) == DATA[100:]
+    assert b''.join(body) == DATA[100:]  # rewound
+
+    assert b''.join(UploadBody(DATA)) == DATA
+
+    body = UploadBody(chunks())
+    assert body.length is None
+    assert body.replayable
+    assert b''.join(body) == DATA
+    assert not body.replayable
+    with pytest.raises(ValueError):
+        list(body)
+
+    with pytest.raises(ValueError):
+        UploadBody(DATA, chunk_size=0)
+
+
+async def test_010_upload(data_file: Path) -> None:
+    """Test uploading each kind of source, in chunks."""
+    state = new_state()
+    rc = RestClient("http://test", "passkey", transport=LoopbackTransport(make_app(ROUTES, state)))
+    expected = {
+        'size': len(DATA),
+        'sha256': hashlib.sha256(DATA).hexdigest(),
+        'name': 'foo',
+        'auth': 'Bearer passkey',
+        'type': 'application/octet-stream',
+        'length': str(len(DATA)),
+    }
+
+    ret = await rc.upload('PUT', '/upload', data_file, args={'name': 'foo'}, chunk_size=10000)
+    assert ret == expected
+    assert state['chunks'] == 26
+
+    with open(data_file, 'rb') as f:
+        ret = await rc.upload('POST', '/upload', f, args={'name': 'foo'}, headers={'content-type': 'text/plain'})
+    assert ret == {**expected, 'type': 'text/plain'}
+
+    # an iterator has no length, so it is chunked
+    ret = await rc.upload('PUT', '/upload', chunks(), args={'name': 'foo'})
+    assert ret == {**expected, 'length': ''}
+
+    loop = asyncio.get_running_loop()
+    ret = await loop.run_in_executor(None, lambda: rc.upload_seq('PUT', '/upload', data_file, args={'name': 'foo'}))
+    assert ret == expected
+    rc.close()
+
+
+async def test_020_retry(data_file: Path) -> None:
+    """Test that files are re-sent on a retry, and iterators are not."""
+    state = new_state(fail=2)
+    rc = RestClient("http://test", transport=LoopbackTransport(make_app(ROUTES, state)), backoff_factor=0.001)
+    ret = await rc.upload('PUT', '/upload', data_file)
+    assert ret['size'] == len(DATA) and ret['sha256'] == hashlib.sha256(DATA).hexdigest()
+    assert state['calls'] == 3
+
+    state.update(new_state(fail=1))
+    f = io.BytesIO(DATA)
+    ret = await rc.upload('PUT', '/upload', f)
+    assert ret['size'] == len(DATA)
+    assert state['calls'] == 2
+
+    state.update(new_state(fail=1))
+    with pytest.raises(requests.exceptions.HTTPError) as exc:
+        await rc.upload('PUT', '/upload', chunks())
+    assert exc.value.response.status_code == 503
+    assert state['calls'] == 1
+    rc.close()
+
+
+async def test_030_backends(server: Dict[str, Any], port: int, data_file: Path) -> None:
+    """Test uploading over a socket, with each backend."""
+    digest = hashlib.sha256(DATA).hexdigest()
+    for backend in ('requests', 'tornado'):
+        rc = RestClient(f"http://localhost:{port}", async_backend=backend)
+        for source in (data_file, chunks()):
+            ret = await rc.upload('PUT', '/upload', source)
+            assert ret['size'] == len(DATA) and ret['sha256'] == digest
+        rc.close()
+
+    rc = RestClient(f"http://localhost:{port}")
+    loop = asyncio.get_running_loop()
+    ret = await loop.run_in_executor(None, lambda: rc.upload_seq('PUT', '/upload', chunks()))
+    assert ret['size'] == len(DATA) and ret['sha256'] == digest
+    assert ret['length'] == ''
+    rc.close()
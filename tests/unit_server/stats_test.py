@@ -21,6 +21,7 @@ def random_half(mocker):
 def test_stats_empty():
     s = stats.RouteStats()
     assert not s.is_overloaded()
+    assert s.get_median() is None
 
 
 def test_stats_basic(random_half):
@@ -34,6 +35,7 @@ def test_stats_basic(random_half):
         s.append(i)
     assert s.is_overloaded()
     assert 205 < s.get_backoff_time() < 215
+    assert s.get_median() == 104.5
 
 
 def test_stats_expiring(random_half):
@@ -0,0 +1,57 @@
+"""Test script for compression."""
+
+# fmt:off
+# pylint: skip-file
+
+import zlib
+
+import pytest
+
+# local imports
+from rest_tools.utils import compression
+
+
+def test_compression_roundtrip():
+    data = b'{"foo": "bar"}' * 1000
+    for encoding in compression.available_encodings():
+        c = compression.compress(data, encoding)
+        assert len(c) < len(data)
+        assert compression.decompress(c, encoding) == data
+
+
+def test_compression_multiple():
+    data = b'{"foo": "bar"}' * 1000
+    c = compression.compress(compression.compress(data, 'deflate'), 'gzip')
+    assert compression.decompress(c, 'deflate, gzip') == data
+    assert compression.decompress(data, 'identity') == data
+
+
+def test_compression_stream():
+    data = b'{"foo": "bar"}\n' * 1000
+    c = compression.compress(data, 'gzip')
+    d = compression.Decompressor('gzip')
+    out = b''.join(d.decompress(c[i:i+7]) for i in range(0, len(c), 7)) + d.flush()
+    assert out == data
+
+
+def test_compression_raw_deflate():
+    data = b'{"foo": "bar"}' * 1000
+    c = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    assert compression.decompress(c.compress(data) + c.flush(), 'deflate') == data
+
+
+def test_compression_max_size():
+    data = b'\0' * 1000000
+    c = compression.compress(data, 'gzip')
+    assert compression.decompress(c, 'gzip', max_size=len(data)) == data
+    with pytest.raises(compression.DecompressedSizeError):
+        compression.decompress(c, 'gzip', max_size=len(data) - 1)
+
+
+def test_compression_errors():
+    with pytest.raises(ValueError):
+        compression.compress(b'foo', 'foo')
+    with pytest.raises(ValueError):
+        compression.decompress(b'foo', 'foo')
+    with pytest.raises(ValueError):
+        compression.decompress(b'foo', 'gzip')